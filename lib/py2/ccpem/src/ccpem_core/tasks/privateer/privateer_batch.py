@@ -0,0 +1,300 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+'''
+Batch validation of many models with Privateer.
+
+A batch is a list of (model, map, resolution) entries, read from a
+manifest file or made from several input models sharing one map.  Each
+entry runs as its own Privateer process in batch/<entry name> under the
+job directory, and a per-entry result index is written to
+batch_index.json when the batch finishes.
+
+The entries are run by a pool process that keeps a fixed number of them
+in flight, starting the next as soon as any finishes, so one slow model
+does not hold up the rest.  Each entry's own stages (e.g. crop, then
+Privateer) run in order, the processes of a stage side by side:
+
+    ccpem-python -m ccpem_core.tasks.privateer.privateer_batch \\
+        <plan.json> --workers <n>
+'''
+
+import os
+import sys
+import json
+import argparse
+import threading
+import subprocess
+import multiprocessing
+from ccpem_core import ccpem_utils
+from ccpem_core.tasks.privateer import privateer_model
+from ccpem_core.tasks.privateer import privateer_xml
+
+batch_dirname = 'batch'
+batch_index_filename = 'batch_index.json'
+batch_plan_filename = 'batch_plan.json'
+entry_log_filename = 'batch_entry.log'
+
+
+class BatchEntry(object):
+    '''
+    One model to validate, with its optional map and resolution.
+    '''
+    def __init__(self, name, input_model, input_map=None, resolution=None):
+        self.name = name
+        self.input_model = input_model
+        self.input_map = input_map
+        self.resolution = resolution
+
+    def job_location(self, batch_location):
+        return os.path.join(batch_location, batch_dirname, self.name)
+
+    def __repr__(self):
+        return 'BatchEntry({0} {1})'.format(self.name, self.input_model)
+
+
+def entry_names(models):
+    '''
+    Unique, ordered directory names for the models.
+    '''
+    return ['{0:04d}_{1}'.format(i + 1,
+                                 os.path.splitext(os.path.basename(model))[0])
+            for i, model in enumerate(models)]
+
+
+def read_manifest(path):
+    '''
+    Batch entries from a manifest.  Either a JSON list of objects with
+    input_model and optional input_map and resolution keys, or a text file
+    with one "model [map [resolution]]" line per entry; '#' starts a
+    comment and '-' leaves a column out.  Relative paths are taken from
+    the manifest's directory.
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+    with open(path) as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        rows = [(item.get('input_model'),
+                 item.get('input_map'),
+                 item.get('resolution'))
+                for item in json.loads(text)]
+    else:
+        rows = []
+        for line in text.splitlines():
+            fields = line.split('#', 1)[0].split()
+            if fields:
+                fields = [None if field == '-' else field
+                          for field in fields[:3]]
+                rows.append(tuple(fields + [None] * (3 - len(fields))))
+
+    models = []
+    entries = []
+    for model, map_path, resolution in rows:
+        if not model:
+            raise ValueError('Batch manifest entry without a model: ' + path)
+        models.append(os.path.join(directory, model))
+        if map_path is not None:
+            map_path = os.path.join(directory, map_path)
+        if resolution is not None:
+            resolution = float(resolution)
+        entries.append((map_path, resolution))
+    return [BatchEntry(name, model, map_path, resolution)
+            for name, model, (map_path, resolution)
+            in zip(entry_names(models), models, entries)]
+
+
+def entries_from_models(models, input_map=None, resolution=None):
+    '''
+    Batch entries for several models validated against the same map.
+    '''
+    return [BatchEntry(name, model, input_map, resolution)
+            for name, model in zip(entry_names(models), models)]
+
+
+def pool_size(ncpus, n_entries):
+    '''
+    (concurrent processes, cores per process) for a batch on ncpus cores.
+    '''
+    if ncpus is None or ncpus < 1:
+        ncpus = multiprocessing.cpu_count()
+    workers = max(1, min(ncpus, n_entries))
+    return workers, max(1, ncpus // workers)
+
+
+def stages(processes, workers):
+    '''
+    Pipeline stages of at most workers processes each.  Each stage waits
+    for its slowest process; run_plan does not.
+    '''
+    return [processes[i:i + workers]
+            for i in range(0, len(processes), workers)]
+
+
+def write_plan(path, entry_stages):
+    '''
+    Write the plan run_plan reads: entry_stages is a list of (entry
+    name, pipeline stages of CCPEMProcess) pairs.
+    '''
+    plan = []
+    for name, process_stages in entry_stages:
+        plan.append({'name': name,
+                     'stages': [[{'name': process.name,
+                                  'command': process.command,
+                                  'args': [str(arg) for arg in process.args],
+                                  'location': process.location}
+                                 for process in stage]
+                                for stage in process_stages]})
+    with open(path, 'w') as f:
+        json.dump(plan, f, indent=1)
+
+
+def run_args(plan_path, workers):
+    '''
+    Arguments to ccpem-python that run the plan at plan_path.
+    '''
+    return ['-m', 'ccpem_core.tasks.privateer.privateer_batch',
+            plan_path, '--workers', str(workers)]
+
+
+def run_entry(entry):
+    '''
+    Run an entry's stages in order, logging their output to the entry
+    directory.  Returns False, skipping later stages, if a process fails
+    or can not be started.
+    '''
+    for stage in entry['stages']:
+        running = []
+        failed = False
+        for process in stage:
+            log = open(os.path.join(process['location'],
+                                    entry_log_filename), 'a')
+            try:
+                popen = subprocess.Popen(
+                    [process['command']] + process['args'],
+                    cwd=process['location'], stdout=log,
+                    stderr=subprocess.STDOUT)
+            except OSError as e:
+                message = 'Unable to start {0}: {1}'.format(process['name'], e)
+                log.write(message + '\n')
+                log.close()
+                ccpem_utils.print_warning(message=message)
+                failed = True
+                continue
+            running.append((process, log, popen))
+        for process, log, popen in running:
+            if popen.wait() != 0:
+                ccpem_utils.print_warning(
+                    message='{0} failed with exit code {1}'.format(
+                        process['name'], popen.returncode))
+                failed = True
+            log.close()
+        if failed:
+            return False
+    return True
+
+
+def run_plan(plan, workers):
+    '''
+    Run the entries of plan with at most workers in flight.  Returns the
+    names of the entries that failed.
+    '''
+    pending = list(reversed(plan))
+    failed = []
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                entry = pending.pop()
+            try:
+                ok = run_entry(entry)
+            except (IOError, OSError) as e:
+                ccpem_utils.print_warning(
+                    message='Batch entry {0}: {1}'.format(entry['name'], e))
+                ok = False
+            with lock:
+                if not ok:
+                    failed.append(entry['name'])
+                print 'Batch entry {0} {1}'.format(
+                    entry['name'], 'finished' if ok else 'failed')
+                sys.stdout.flush()
+
+    threads = [threading.Thread(target=work)
+               for _i in range(max(1, min(workers, len(plan))))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run the entries of a Privateer batch')
+    parser.add_argument('plan')
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    with open(args.plan) as f:
+        plan = json.load(f)
+    failed = run_plan(plan, args.workers)
+    print '{0} of {1} batch entries finished'.format(
+        len(plan) - len(failed), len(plan))
+    if failed:
+        return 1
+    return 0
+
+
+def entry_result(entry, batch_location):
+    '''
+    Index record for a finished entry.
+    '''
+    job_location = entry.job_location(batch_location)
+    result = {'name': entry.name,
+              'job_location': job_location,
+              'input_model': entry.input_model,
+              'input_map': entry.input_map,
+              'resolution': entry.resolution}
+    xmlfilename = os.path.join(job_location, 'program.xml')
+    if not os.path.exists(xmlfilename):
+        result['status'] = 'failed'
+        return result
+    try:
+        data = privateer_xml.read_program_xml(xmlfilename)
+    except Exception as e:
+        result['status'] = 'failed'
+        result['error'] = str(e)
+        return result
+    sugars = data.pyranoses + data.furanoses
+    result['status'] = 'finished' if sugars else 'no sugars'
+    result['pyranoses'] = len(data.pyranoses)
+    result['furanoses'] = len(data.furanoses)
+    result['glycans'] = len(data.glycans)
+    result['issues'] = sum(
+        1 for sugar in sugars
+        if privateer_model.classify_diagnostic(sugar.diagnostic) !=
+        privateer_model.SUGAR_OK)
+    report = os.path.join(job_location, 'report', 'index.html')
+    if os.path.exists(report):
+        result['report'] = report
+    return result
+
+
+def write_batch_index(batch_location, entries):
+    '''
+    Collect every entry's results into batch_index.json and return them.
+    '''
+    results = [entry_result(entry, batch_location) for entry in entries]
+    with open(os.path.join(batch_location, batch_index_filename), 'w') as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+    return results
+
+
+if __name__ == '__main__':
+    sys.exit(main())
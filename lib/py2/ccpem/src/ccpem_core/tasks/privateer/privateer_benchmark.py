@@ -0,0 +1,214 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+'''
+Benchmarks of the Privateer results pipeline on synthetic outputs.
+
+For each size a job is written with privateer_synthetic, with and without
+glycan permutations, and every report step is timed on it in a fresh
+process against an empty report directory: reading program.xml, the
+validation tables, the summary graphs, the glycan view HTML and the whole
+glycan tab.  Memory is the growth of the process's peak resident size
+over the step, from getrusage.  Results are written as JSON to compare
+across releases.
+
+    ccpem-python -m ccpem_core.tasks.privateer.privateer_benchmark \\
+        [--sugars 10 1000 50000] [--permutations both] [--repeat 1] \\
+        [--work_location <dir>] [--output <json>]
+
+Needs the rvapi module and CCPEM set, as the report itself does.
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import multiprocessing
+from ccpem_core.tasks.privateer import privateer_report_cache
+from ccpem_core.tasks.privateer import privateer_synthetic
+from ccpem_core.tasks.privateer import privateer_xml
+
+default_sugars = [10, 1000, 50000]
+
+results_tab = 'results_tab'
+
+
+def read_step(viewer, data):
+    privateer_xml.read_program_xml(viewer.xmlfilename, section_hashes=True)
+
+
+def table_step(viewer, data):
+    viewer.GetXML2Table('Privateer', results_tab, data)
+
+
+def graph_step(viewer, data):
+    viewer.validation_summary_graph(data, results_tab)
+
+
+def glycan_html_step(viewer, data):
+    viewer.generate_HTML_glycan_view(data.glycans)
+
+
+def glycan_tab_step(viewer, data):
+    viewer.display_glycan_chains(results_tab, data)
+    viewer.wait_for_glycan_view()
+
+
+# (name, function) in report order
+steps = [('read_program_xml', read_step),
+         ('GetXML2Table', table_step),
+         ('validation_summary_graph', graph_step),
+         ('generate_HTML_glycan_view', glycan_html_step),
+         ('display_glycan_chains', glycan_tab_step)]
+
+
+def peak_rss_kb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def time_step(job_location, name):
+    '''
+    Time report step name on the job in this process.  The report
+    directory is removed first so nothing is reused from a cache.
+    '''
+    # Report modules need rvapi, only load them where the steps run
+    import pyrvapi
+    from ccpem_core.tasks.privateer import privateer_results
+    shutil.rmtree(os.path.join(job_location, 'report'), ignore_errors=True)
+    viewer = privateer_results.PrivateerResultsViewer(
+        job_location=job_location, write_glycan_view=False, render=False)
+    viewer.init_document()
+    pyrvapi.rvapi_add_tab(results_tab, 'Sugar view', True)
+    function = dict(steps)[name]
+    rss_before = peak_rss_kb()
+    start = time.time()
+    with viewer.batch:
+        function(viewer, viewer.validation_data)
+        stepped = time.time()
+    end = time.time()
+    rss_after = peak_rss_kb()
+    return {'seconds': stepped - start,
+            'flush_seconds': end - stepped,
+            'peak_rss_kb': rss_after,
+            'peak_rss_increase_kb': rss_after - rss_before}
+
+
+def step_worker(job_location, name, queue):
+    try:
+        queue.put(time_step(job_location, name))
+    except Exception as e:
+        queue.put({'error': '{0}: {1}'.format(type(e).__name__, e)})
+
+
+def run_step(job_location, name):
+    '''
+    time_step in a child process, so peak memory is the step's own.
+    '''
+    queue = multiprocessing.Queue()
+    worker = multiprocessing.Process(target=step_worker,
+                                     args=(job_location, name, queue))
+    worker.start()
+    result = queue.get()
+    worker.join()
+    return result
+
+
+def benchmark_job(job_location, repeat=1):
+    '''
+    Every step run repeat times on the job, keeping the fastest run.
+    '''
+    results = {}
+    for name, _function in steps:
+        runs = [run_step(job_location, name) for _i in range(repeat)]
+        timed = [run for run in runs if 'error' not in run]
+        if not timed:
+            results[name] = runs[0]
+            continue
+        best = min(timed, key=lambda run: run['seconds'])
+        best = dict(best, runs=[run['seconds'] for run in timed])
+        results[name] = best
+    return results
+
+
+def run_benchmarks(work_location, sugar_counts, permutation_modes, repeat=1):
+    cases = []
+    for sugars in sugar_counts:
+        for permutations in permutation_modes:
+            job_location = os.path.join(
+                work_location, '{0}_sugars{1}'.format(
+                    sugars, '_permutations' if permutations else ''))
+            shutil.rmtree(job_location, ignore_errors=True)
+            start = time.time()
+            case = privateer_synthetic.write_synthetic_job(
+                job_location, sugars, permutations)
+            case['generate_seconds'] = time.time() - start
+            case['permutations'] = permutations
+            print 'Benchmarking {0} sugars, {1} glycans{2}'.format(
+                case['sugars'], case['glycans'],
+                ' with permutations' if permutations else '')
+            sys.stdout.flush()
+            case['steps'] = benchmark_job(job_location, repeat)
+            for name, _function in steps:
+                result = case['steps'][name]
+                if 'error' in result:
+                    print '  {0:<28} failed: {1}'.format(name, result['error'])
+                else:
+                    print '  {0:<28} {1:9.3f} s, flush {2:7.3f} s, {3:9d} kB'.format(
+                        name, result['seconds'], result['flush_seconds'],
+                        result['peak_rss_increase_kb'])
+            cases.append(case)
+    return {'created': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': multiprocessing.cpu_count(),
+            'report_cache_version': privateer_report_cache.report_cache_version,
+            'repeat': repeat,
+            'cases': cases}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the Privateer report on synthetic outputs')
+    parser.add_argument('--sugars', type=int, nargs='+', default=default_sugars,
+                        help='Numbers of sugars to benchmark')
+    parser.add_argument('--permutations', choices=['with', 'without', 'both'],
+                        default='both',
+                        help='Glycans with closest permutations or not')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Runs per step, the fastest is kept')
+    parser.add_argument('--work_location', default=None,
+                        help='Directory for the synthetic jobs, kept if given')
+    parser.add_argument('--output', default='privateer_benchmark.json',
+                        help='JSON file for the results')
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    permutation_modes = {'with': [True],
+                         'without': [False],
+                         'both': [False, True]}[args.permutations]
+    work_location = args.work_location
+    if work_location is None:
+        work_location = tempfile.mkdtemp(prefix='privateer_benchmark_')
+    try:
+        results = run_benchmarks(work_location, args.sugars,
+                                 permutation_modes, max(1, args.repeat))
+    finally:
+        if args.work_location is None:
+            shutil.rmtree(work_location, ignore_errors=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+    print 'Results written to {0}'.format(args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
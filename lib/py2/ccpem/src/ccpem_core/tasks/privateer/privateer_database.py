@@ -0,0 +1,453 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+'''
+Memory-mapped index over privateer_database.json.
+
+The GlyTouCan / GlyConnect database shipped with CCP-EM is a large JSON
+file.  It is parsed once per installation into a compact binary index
+(sorted 64-bit WURCS and composition hashes plus a string pool), stored
+next to the JSON or, if that directory is read only, under ~/.ccpem.  The
+index records the size and mtime of the JSON it was built from and is
+rebuilt when they change.
+
+A job builds the index, if needed, in a pipeline process of its own:
+
+    ccpem-python -m ccpem_core.tasks.privateer.privateer_database <json>
+'''
+
+import os
+import sys
+import json
+import errno
+import hashlib
+import argparse
+import tempfile
+import collections
+import numpy as np
+from ccpem_core import ccpem_utils
+
+# Bump when the index layout changes so old indexes are rebuilt
+index_version = 3
+index_magic = b'PRIVDBIX'
+index_suffix = '.idx'
+
+header_dtype = np.dtype([('magic', 'S8'),
+                         ('version', '<u4'),
+                         ('count', '<u8'),
+                         ('pool_size', '<u8'),
+                         ('json_size', '<u8'),
+                         ('json_mtime', '<f8')])
+
+record_dtype = np.dtype([('wurcs_hash', '<u8'),
+                         ('wurcs_offset', '<u8'),
+                         ('wurcs_length', '<u4'),
+                         ('gtc_offset', '<u8'),
+                         ('gtc_length', '<u4'),
+                         ('glyconnect_id', '<i8'),
+                         ('expression_systems', '<u2')])
+
+# Record value for entries without a GlyConnect ID
+no_glyconnect_id = -1
+
+# Expression systems of the task's expression_system_mode, with the
+# organism names and NCBI taxonomy IDs of the GlyConnect taxonomy each
+# one covers.  Bit i of a record's expression_systems is the ith system.
+expression_systems = collections.OrderedDict([
+    ('bacterial', (('bacteria', 'escherichia', 'bacillus', 'salmonella',
+                    'campylobacter', 'streptococcus', 'mycobacterium',
+                    'pseudomonas', 'neisseria', 'helicobacter'),
+                   ('2', '562'))),
+    ('fungal', (('fungi', 'aspergillus', 'trichoderma', 'neurospora',
+                 'penicillium', 'saccharomyces', 'pichia', 'komagataella',
+                 'kluyveromyces', 'candida', 'yeast'),
+                ('4751', '4932', '4922', '4896'))),
+    ('yeast', (('saccharomyces', 'pichia', 'komagataella', 'kluyveromyces',
+                'schizosaccharomyces', 'candida', 'yeast'),
+               ('4932', '4922', '4896'))),
+    ('plant', (('viridiplantae', 'arabidopsis', 'nicotiana', 'oryza',
+                'zea mays', 'glycine max', 'triticum', 'solanum', 'plant'),
+               ('33090', '3702', '4097', '4530', '4577'))),
+    ('insect', (('insecta', 'spodoptera', 'trichoplusia', 'drosophila',
+                 'bombyx', 'apis mellifera', 'insect'),
+                ('50557', '7108', '7111', '7227', '7091'))),
+    ('mammalian', (('mammalia', 'homo sapiens', 'human', 'mus musculus',
+                    'rattus', 'cricetulus', 'mesocricetus', 'bos taurus',
+                    'sus scrofa', 'ovis aries', 'capra hircus', 'equus',
+                    'oryctolagus', 'macaca', 'canis', 'felis',
+                    'chlorocebus'),
+                   ('40674', '9606', '10090', '10116', '10029', '9913',
+                    '9823', '9940', '9925', '9796', '9986', '9544'))),
+    ('human', (('homo sapiens', 'human'), ('9606',))),
+])
+
+DatabaseEntry = collections.namedtuple(
+    'DatabaseEntry', ['wurcs', 'gtc_id', 'glyconnect_id',
+                      'expression_systems'])
+
+
+def default_database_path():
+    '''
+    privateer_database.json shipped with CCP-EM.
+    '''
+    return os.path.join(os.environ['CCPEM'], 'lib/data/privateer_database.json')
+
+
+def hash64(text):
+    '''
+    Stable 64 bit hash of a WURCS string or composition key.
+    '''
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8')
+    return np.uint64(int(hashlib.sha1(text).hexdigest()[:16], 16))
+
+
+def wurcs_composition(wurcs):
+    '''
+    Composition key of a WURCS 2.0 string: its unique residues with their
+    counts, independent of linkage and order.  None if wurcs can not be
+    split into its sections.
+    '''
+    if not wurcs or '[' not in wurcs:
+        return None
+    try:
+        residues = wurcs[wurcs.index('[') + 1:wurcs.rindex(']')].split('][')
+        sequence = wurcs[wurcs.rindex(']') + 1:].lstrip('/').split('/')[0]
+        counts = collections.Counter()
+        for residue in sequence.split('-'):
+            if residue:
+                counts[residues[letter_index(residue)]] += 1
+    except (ValueError, IndexError):
+        return None
+    return '|'.join(['{0}x{1}'.format(residue, count)
+                     for residue, count in sorted(counts.items())])
+
+
+def letter_index(residue):
+    '''
+    Unique residue index of a WURCS residue label: a-z, then A-Z, with
+    any trailing repeat or modification markers ignored.
+    '''
+    letter = residue[0]
+    if 'a' <= letter <= 'z':
+        return ord(letter) - ord('a')
+    elif 'A' <= letter <= 'Z':
+        return 26 + ord(letter) - ord('A')
+    # Numeric labels are 1-based unique residue numbers
+    return int(residue.split('_')[0]) - 1
+
+
+def taxonomy_terms(entry):
+    '''
+    Lower case organism names and taxonomy IDs recorded for one
+    privateer_database.json entry.
+    '''
+    values = [entry.get('taxonomy')]
+    glyconnect = entry.get('glyconnect')
+    if isinstance(glyconnect, dict):
+        values += [glyconnect.get('taxonomy'), glyconnect.get('taxonomies'),
+                   glyconnect.get('species')]
+    terms = set()
+    while values:
+        value = values.pop()
+        if isinstance(value, dict):
+            values.extend(value.values())
+        elif isinstance(value, list):
+            values.extend(value)
+        elif isinstance(value, basestring):
+            terms.add(value.strip().lower())
+        elif isinstance(value, (int, long)) and not isinstance(value, bool):
+            terms.add(str(value))
+    return terms
+
+
+def expression_system_mask(entry):
+    '''
+    Bit mask of the expression_systems an entry's taxonomy falls in, 0
+    if it records no taxonomy.
+    '''
+    terms = taxonomy_terms(entry)
+    mask = 0
+    for bit, (names, taxonomy_ids) in enumerate(expression_systems.values()):
+        if any(term in taxonomy_ids or
+               any(name in term for name in names) for term in terms):
+            mask |= 1 << bit
+    return mask
+
+
+def entry_fields(entry):
+    '''
+    (wurcs, gtc_id, glyconnect_id) of one privateer_database.json entry.
+    '''
+    wurcs = entry.get('Sequence') or entry.get('wurcs') or entry.get('WURCS')
+    gtc_id = (entry.get('AccessionNumber') or entry.get('glytoucan_id') or
+              entry.get('GlyTouCanID'))
+    glyconnect = entry.get('glyconnect') or entry.get('glyconnect_id')
+    if isinstance(glyconnect, dict):
+        glyconnect = glyconnect.get('id')
+    try:
+        glyconnect_id = int(glyconnect)
+    except (TypeError, ValueError):
+        glyconnect_id = no_glyconnect_id
+    return wurcs, gtc_id, glyconnect_id
+
+
+def json_entries(json_path):
+    with open(json_path) as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('data', data.values())
+    for entry in data:
+        if isinstance(entry, dict):
+            yield entry
+
+
+def json_stamp(json_path):
+    stat = os.stat(json_path)
+    return stat.st_size, stat.st_mtime
+
+
+def index_path(json_path):
+    '''
+    Index location for json_path: alongside it if that directory is
+    writable, otherwise in the per-user CCP-EM directory.
+    '''
+    json_path = os.path.abspath(json_path)
+    directory = os.path.dirname(json_path)
+    if os.access(directory, os.W_OK):
+        return json_path + index_suffix
+    user_directory = os.path.join(os.path.expanduser('~'), '.ccpem',
+                                  'privateer')
+    name = hashlib.sha1(json_path.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(user_directory,
+                        os.path.basename(json_path) + '.' + name + index_suffix)
+
+
+def read_header(path):
+    if not os.path.exists(path) or os.path.getsize(path) < header_dtype.itemsize:
+        return None
+    header = np.fromfile(path, dtype=header_dtype, count=1)[0]
+    if header['magic'] != index_magic or header['version'] != index_version:
+        return None
+    return header
+
+
+def is_current(json_path, path=None):
+    '''
+    True if the index for json_path exists and was built from the JSON as
+    it is now.
+    '''
+    if path is None:
+        path = index_path(json_path)
+    header = read_header(path)
+    if header is None:
+        return False
+    size, mtime = json_stamp(json_path)
+    return header['json_size'] == size and header['json_mtime'] == mtime
+
+
+def build_index(json_path, path=None):
+    '''
+    Parse json_path and write its index atomically.  Returns the index path.
+    '''
+    if path is None:
+        path = index_path(json_path)
+    size, mtime = json_stamp(json_path)
+
+    pool = []
+    pool_size = 0
+    rows = []
+    compositions = []
+    for entry in json_entries(json_path):
+        wurcs, gtc_id, glyconnect_id = entry_fields(entry)
+        if not wurcs:
+            continue
+        strings = []
+        for text in (wurcs, gtc_id or ''):
+            if not isinstance(text, bytes):
+                text = text.encode('utf-8')
+            strings.append((pool_size, len(text)))
+            pool.append(text)
+            pool_size += len(text)
+        composition = wurcs_composition(wurcs)
+        compositions.append(0 if composition is None else hash64(composition))
+        rows.append((hash64(wurcs),
+                     strings[0][0], strings[0][1],
+                     strings[1][0], strings[1][1],
+                     glyconnect_id,
+                     expression_system_mask(entry)))
+
+    records = np.array(rows, dtype=record_dtype)
+    order = np.argsort(records['wurcs_hash'], kind='mergesort')
+    records = records[order]
+    # Composition hashes sorted, with the record each belongs to
+    compositions = np.array(compositions, dtype='<u8')[order]
+    composition_order = np.argsort(compositions,
+                                   kind='mergesort').astype('<u4')
+    compositions = compositions[composition_order]
+
+    header = np.zeros(1, dtype=header_dtype)
+    header['magic'] = index_magic
+    header['version'] = index_version
+    header['count'] = len(records)
+    header['pool_size'] = pool_size
+    header['json_size'] = size
+    header['json_mtime'] = mtime
+
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix=index_suffix)
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            f.write(header.tobytes())
+            f.write(records.tobytes())
+            f.write(compositions.tobytes())
+            f.write(composition_order.tobytes())
+            f.write(b''.join(pool))
+        os.rename(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return path
+
+
+def ensure_index(json_path):
+    '''
+    Build the index for json_path unless an up to date one exists.
+    Returns the index path, or None if the JSON is missing.
+    '''
+    if not os.path.isfile(json_path):
+        return None
+    path = index_path(json_path)
+    if not is_current(json_path, path):
+        build_index(json_path, path)
+    return path
+
+
+def index_args(json_path):
+    '''
+    Arguments to ccpem-python that build the index for json_path.
+    '''
+    return ['-m', 'ccpem_core.tasks.privateer.privateer_database', json_path]
+
+
+def mapped_array(path, dtype, offset, count):
+    '''
+    Read-only memory map of count items of dtype at offset in path.
+    '''
+    if count == 0:
+        # mmap refuses empty mappings
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset,
+                     shape=(count,))
+
+
+class PrivateerDatabaseIndex(object):
+    '''
+    Read-only, memory-mapped view of an index built by build_index.
+    '''
+    def __init__(self, path):
+        header = read_header(path)
+        if header is None:
+            raise ValueError('Not a Privateer database index: ' + path)
+        self.path = path
+        count = int(header['count'])
+        offset = header_dtype.itemsize
+        self.records = mapped_array(path, record_dtype, offset, count)
+        offset += record_dtype.itemsize * count
+        self.composition_hashes = mapped_array(path, '<u8', offset, count)
+        offset += 8 * count
+        self.composition_order = mapped_array(path, '<u4', offset, count)
+        offset += 4 * count
+        self.pool = mapped_array(path, 'u1', offset, int(header['pool_size']))
+
+    @classmethod
+    def for_database(cls, json_path):
+        '''
+        Index for json_path, building it first if needed.
+        '''
+        path = ensure_index(json_path)
+        if path is None:
+            raise IOError('Privateer database not found: ' + json_path)
+        return cls(path)
+
+    def __len__(self):
+        return len(self.records)
+
+    def string(self, offset, length):
+        return self.pool[offset:offset + length].tobytes().decode('utf-8')
+
+    def entry(self, position):
+        record = self.records[position]
+        glyconnect_id = int(record['glyconnect_id'])
+        mask = int(record['expression_systems'])
+        return DatabaseEntry(
+            self.string(int(record['wurcs_offset']), int(record['wurcs_length'])),
+            self.string(int(record['gtc_offset']), int(record['gtc_length'])) or None,
+            None if glyconnect_id == no_glyconnect_id else glyconnect_id,
+            tuple(system for bit, system in enumerate(expression_systems)
+                  if mask & (1 << bit)))
+
+    def lookup(self, wurcs):
+        '''
+        DatabaseEntry with exactly this WURCS, or None.
+        '''
+        wurcs_hash = hash64(wurcs)
+        hashes = self.records['wurcs_hash']
+        position = int(np.searchsorted(hashes, wurcs_hash))
+        while position < len(hashes) and hashes[position] == wurcs_hash:
+            entry = self.entry(position)
+            if entry.wurcs == wurcs:
+                return entry
+            position += 1
+        return None
+
+    def same_composition(self, wurcs):
+        '''
+        DatabaseEntries with the same residue composition as wurcs, in
+        database index order.
+        '''
+        composition = wurcs_composition(wurcs)
+        if composition is None:
+            return []
+        composition_hash = hash64(composition)
+        start = int(np.searchsorted(self.composition_hashes, composition_hash,
+                                    side='left'))
+        end = int(np.searchsorted(self.composition_hashes, composition_hash,
+                                  side='right'))
+        return [self.entry(int(position))
+                for position in self.composition_order[start:end]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Build the index of a Privateer database')
+    parser.add_argument('database')
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    try:
+        path = ensure_index(args.database)
+    except (IOError, OSError, ValueError) as e:
+        # Lookups build the index themselves if this fails
+        ccpem_utils.print_warning(
+            message='Unable to index Privateer database: {0}'.format(e))
+        return 0
+    if path is None:
+        ccpem_utils.print_warning(
+            message='Privateer database not found: {0}'.format(args.database))
+    else:
+        print 'Privateer database index: {0}'.format(path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+'''
+Stand-in for the privateer executable, for headless end-to-end runs and
+benchmarks without CCP4 or real maps.
+
+It takes the arguments PrivateerCLI builds, checks them as Privateer
+would and writes synthetic program.xml, glycan diagrams and
+privateer-results.py to the working directory, printing a line per
+sugar and glycan as it goes.  Size and speed are set from the
+environment:
+
+    CCPEM_PRIVATEER_FAKE_SUGARS       sugars to report, default the number
+                                      of sugar residues in -pdbin
+    CCPEM_PRIVATEER_FAKE_STARTUP      seconds before the first sugar
+    CCPEM_PRIVATEER_FAKE_SUGAR_TIME   seconds per sugar on one core,
+                                      shared over -cores
+
+Install a launcher and point the task at it with CCPEM_PRIVATEER_COMMAND:
+
+    ccpem-python -m ccpem_core.tasks.privateer.privateer_fake \\
+        --install <directory>
+    export CCPEM_PRIVATEER_COMMAND=<directory>/privateer
+'''
+
+import os
+import sys
+import stat
+import time
+import random
+import argparse
+from ccpem_core.tasks.privateer import privateer_structure
+from ccpem_core.tasks.privateer import privateer_synthetic
+from ccpem_core.tasks.privateer import privateer_xml
+from ccpem_core.tasks.privateer import privateer_model
+
+# Flags taking one value, and the checks applied to it
+value_flags = {'-pdbin': 'file',
+               '-mapin': 'file',
+               '-databasein': 'file',
+               '-resolution': float,
+               '-radiusin': float,
+               '-cores': int,
+               '-codein': str,
+               '-expression': str}
+
+switch_flags = ('-glytoucan', '-closest_match_disable', '-all_permutations',
+                '-oldstyle', '-vertical', '-invert')
+
+# Values after -valstring for a pyranose (code, O, C1-C5, anomer, handedness,
+# conformation) and a furanose (code, O, C1-C4, handedness, conformation)
+valstring_lengths = (10, 8)
+
+
+class FakeUsageError(Exception):
+    pass
+
+
+def parse_privateer_args(argv):
+    '''
+    Options from a Privateer argument list, as a dict keyed by flag.
+    Raises FakeUsageError for anything Privateer would reject.
+    '''
+    options = {}
+    i = 0
+    while i < len(argv):
+        flag = argv[i]
+        if flag in switch_flags:
+            options[flag] = True
+            i += 1
+        elif flag == '-valstring':
+            values = []
+            i += 1
+            while i < len(argv) and not argv[i].startswith('-'):
+                values.append(argv[i])
+                i += 1
+            if len(values) not in valstring_lengths:
+                raise FakeUsageError(
+                    '-valstring takes {0} or {1} values, got {2}'.format(
+                        valstring_lengths[0], valstring_lengths[1], len(values)))
+            options[flag] = values
+        elif flag in value_flags:
+            if i + 1 >= len(argv):
+                raise FakeUsageError('{0} needs a value'.format(flag))
+            value = argv[i + 1]
+            check = value_flags[flag]
+            if check == 'file':
+                if not os.path.isfile(value):
+                    raise FakeUsageError('Unable to open {0}'.format(value))
+            else:
+                try:
+                    value = check(value)
+                except ValueError:
+                    raise FakeUsageError('Bad value for {0}: {1}'.format(
+                        flag, value))
+            options[flag] = value
+            i += 2
+        else:
+            raise FakeUsageError('Unknown option {0}'.format(flag))
+    if '-pdbin' not in options:
+        raise FakeUsageError('No input model given with -pdbin')
+    if '-glytoucan' in options and '-databasein' not in options:
+        raise FakeUsageError('-glytoucan needs -databasein')
+    return options
+
+
+def environment_number(name, default, convert=float):
+    value = os.environ.get(name)
+    if not value:
+        return default
+    return convert(value)
+
+
+def write_coot_script(path, validation_data, seed=1):
+    '''
+    Coot script listing the sugars with issues, as Privateer writes.
+    '''
+    rng = random.Random(seed)
+    with open(path, 'w') as f:
+        f.write('# Privateer results for Coot\n')
+        f.write('interesting_things_gui("Validation report from Privateer", [\n')
+        for sugar in validation_data.pyranoses + validation_data.furanoses:
+            if (privateer_model.classify_diagnostic(sugar.diagnostic) ==
+                    privateer_model.SUGAR_OK):
+                continue
+            f.write(' ["{0} ({1})", {2:.3f}, {3:.3f}, {4:.3f}],\n'.format(
+                sugar.name, sugar.diagnostic, rng.uniform(0.0, 100.0),
+                rng.uniform(0.0, 100.0), rng.uniform(0.0, 100.0)))
+        f.write('])\n')
+
+
+def run(options, job_location):
+    extra_codes = []
+    if '-valstring' in options:
+        extra_codes.append(options['-valstring'][0])
+    sugars = environment_number('CCPEM_PRIVATEER_FAKE_SUGARS', None, int)
+    if sugars is None:
+        sugars = sum(privateer_structure.count_sugar_residues(
+            options['-pdbin'], extra_codes).values())
+    startup = environment_number('CCPEM_PRIVATEER_FAKE_STARTUP', 0.0)
+    sugar_time = (environment_number('CCPEM_PRIVATEER_FAKE_SUGAR_TIME', 0.0) /
+                  max(1, options.get('-cores', 1)))
+    permutations = ('-glytoucan' in options and
+                    '-closest_match_disable' not in options)
+
+    print 'Privateer stand-in, {0} sugars in {1}'.format(
+        sugars, options['-pdbin'])
+    sys.stdout.flush()
+    time.sleep(startup)
+    for chain, number, code, ring, _kind in \
+            privateer_synthetic.synthetic_sugars(sugars):
+        print '    {0}-/{1}/{2}/  {3}'.format(code, chain, number, ring)
+        sys.stdout.flush()
+        time.sleep(sugar_time)
+
+    xmlfilename = os.path.join(job_location, 'program.xml')
+    if not sugars:
+        privateer_xml.write_empty_program_xml(xmlfilename)
+        return 0
+    counts = privateer_synthetic.write_synthetic_job(job_location, sugars,
+                                                     permutations)
+    validation_data = privateer_xml.read_program_xml(xmlfilename)
+    for glycan in validation_data.glycans:
+        print '{0} GlyTouCan ID: {1}'.format(glycan.wurcs, glycan.gtc_id)
+        for _permutation in glycan.permutations or []:
+            print '    Closest permutation found'
+    write_coot_script(os.path.join(job_location, 'privateer-results.py'),
+                      validation_data)
+    print 'Wrote {0} glycans and {1} diagrams'.format(counts['glycans'],
+                                                      counts['svg_files'])
+    return 0
+
+
+def install(directory):
+    '''
+    Write an executable privateer launcher for this module to directory
+    and return its path.
+    '''
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    path = os.path.join(directory, 'privateer')
+    package_root = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__)))))
+    with open(path, 'w') as f:
+        f.write('#!/bin/sh\n')
+        f.write('PYTHONPATH="{0}${{PYTHONPATH:+:$PYTHONPATH}}" exec "{1}" '
+                '-m ccpem_core.tasks.privateer.privateer_fake "$@"\n'.format(
+                    package_root, sys.executable))
+    mode = os.stat(path).st_mode
+    os.chmod(path, mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['--install']:
+        parser = argparse.ArgumentParser(
+            description='Install a stand-in privateer executable')
+        parser.add_argument('--install', required=True, metavar='directory')
+        path = install(parser.parse_args(argv).install)
+        print 'export CCPEM_PRIVATEER_COMMAND={0}'.format(path)
+        return 0
+    try:
+        options = parse_privateer_args(argv)
+    except FakeUsageError as e:
+        print 'Privateer stand-in: {0}'.format(e)
+        return 1
+    return run(options, os.getcwd())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
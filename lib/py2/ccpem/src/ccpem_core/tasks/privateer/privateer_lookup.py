@@ -0,0 +1,120 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+'''
+GlyTouCan and GlyConnect lookup for glycans already in program.xml.
+
+The GlycanWURCS values Privateer wrote are resolved against the indexed
+copy of privateer_database.json and the IDs found are kept in
+glycan_ids.json in the job directory.  The results viewer applies them
+over the IDs in program.xml, so the glycan view can be brought up to date
+without running Privateer over the model and map again.
+
+As with Privateer's -expression option, a GlyConnect ID is only taken
+for an expression system other than 'undefined' when the database
+records the glycan in an organism of that system.
+'''
+
+import os
+import json
+from ccpem_core.tasks.privateer import privateer_database
+
+glycan_ids_filename = 'glycan_ids.json'
+
+# Text Privateer writes to program.xml when an ID is not found
+gtc_id_not_found = 'Unable to find GlyTouCan ID'
+glyconnect_id_not_found = 'Unable to find GlyConnect ID'
+
+# expression_system_mode that looks at every GlyConnect entry
+any_expression_system = 'undefined'
+
+
+def glycan_ids_path(job_location):
+    return os.path.join(job_location, glycan_ids_filename)
+
+
+def lookup_glycan_ids(glycans, index, expression_system=None):
+    '''
+    {wurcs: (gtc_id, glyconnect_id)} for the glycans, using the
+    program.xml placeholders for IDs not in the database or, for the
+    GlyConnect ID, not recorded for expression_system.
+    '''
+    filtered = expression_system not in (None, any_expression_system)
+    ids = {}
+    for glycan in glycans:
+        if not glycan.wurcs or glycan.wurcs in ids:
+            continue
+        entry = index.lookup(glycan.wurcs)
+        gtc_id = gtc_id_not_found
+        glyconnect_id = glyconnect_id_not_found
+        if entry is not None:
+            if entry.gtc_id:
+                gtc_id = entry.gtc_id
+            if entry.glyconnect_id is not None and (
+                    not filtered or
+                    expression_system in entry.expression_systems):
+                glyconnect_id = str(entry.glyconnect_id)
+        ids[glycan.wurcs] = (gtc_id, glyconnect_id)
+    return ids
+
+
+def write_glycan_ids(job_location, ids, glycan_section_hash,
+                     expression_system=None):
+    '''
+    Store ids for the program.xml Glycan section and expression system
+    they were looked up for.
+    '''
+    with open(glycan_ids_path(job_location), 'w') as f:
+        json.dump({'glycan_section': glycan_section_hash,
+                   'expression_system': expression_system,
+                   'ids': ids},
+                  f, indent=1, sort_keys=True)
+
+
+def read_glycan_ids(job_location, glycan_section_hash):
+    '''
+    Stored ids, or None if there are none for this Glycan section.
+    '''
+    path = glycan_ids_path(job_location)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            stored = json.load(f)
+    except ValueError:
+        return None
+    if stored.get('glycan_section') != glycan_section_hash:
+        return None
+    return stored.get('ids')
+
+
+def apply_glycan_ids(glycans, ids):
+    '''
+    Replace the IDs of glycans found in ids.
+    '''
+    for glycan in glycans:
+        if glycan.wurcs in ids:
+            glycan.gtc_id, glycan.glyconnect_id = ids[glycan.wurcs]
+
+
+def update_glycan_ids(job_location, validation_data, expression_system=None,
+                      database_path=None):
+    '''
+    Look up the glycans of validation_data in the database index for
+    expression_system and store the IDs for the job.  validation_data
+    must carry section hashes.
+    '''
+    if database_path is None:
+        database_path = privateer_database.default_database_path()
+    index = privateer_database.PrivateerDatabaseIndex.for_database(
+        database_path)
+    ids = lookup_glycan_ids(validation_data.glycans, index, expression_system)
+    write_glycan_ids(job_location, ids,
+                     validation_data.section_hashes.get('Glycan'),
+                     expression_system)
+    return ids
@@ -0,0 +1,267 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+'''
+Streaming merge of several Privateer program.xml files into one.
+
+The Pyranose, Furanose and Glycan records of each input are read with
+iterparse and written straight out with etree.xmlfile, so only one record
+is held at a time whatever the number and size of the inputs.
+
+Chain IDs already used by an earlier input are given an unused ID, in
+the chain fields and in sugar names alike, and diagram paths are made
+relative to the output directory, with a diagram copied under a new name
+if its path is already taken by another input.  The mapping applied is
+saved next to the merged file.
+
+    ccpem-python -m ccpem_core.tasks.privateer.privateer_merge \\
+        <output_dir> <input_dir> [<input_dir> ...] [--keep_chains]
+'''
+
+import os
+import re
+import sys
+import json
+import shutil
+import string
+import argparse
+import itertools
+import contextlib
+from lxml import etree
+from ccpem_core.tasks.privateer import privateer_xml
+
+record_tags = ('Pyranose', 'Furanose', 'Glycan')
+chain_tags = ('SugarChain', 'GlycanChain')
+svg_tags = ('GlycanSVG', 'PermutationSVG')
+
+# Sugar names read CODE-/chain/number/
+sugar_name_chain = re.compile(r'^(.*?-/)([^/]*)(/.*)$')
+
+merge_map_filename = 'program_merge.json'
+
+
+def chain_id_pool():
+    '''
+    Chain IDs to hand out, single characters first.
+    '''
+    alphabet = string.ascii_uppercase + string.ascii_lowercase + string.digits
+    for size in itertools.count(1):
+        for chars in itertools.product(alphabet, repeat=size):
+            yield ''.join(chars)
+
+
+def document_path(xmlfilename):
+    '''
+    Tags from the root down to the first ValidationData of xmlfilename.
+    '''
+    context = etree.iterparse(xmlfilename, events=('start',))
+    for _event, element in context:
+        if element.tag == 'ValidationData':
+            path = []
+            while element is not None:
+                path.insert(0, element.tag)
+                element = element.getparent()
+            return path
+    return ['PrivateerResult', 'ValidationData']
+
+
+class ProgramXMLMerger(object):
+    '''
+    Remapping state shared by the inputs of one merge.
+    '''
+    def __init__(self, output_location, keep_chains=False):
+        self.output_location = output_location
+        self.keep_chains = keep_chains
+        self.used_chains = set()
+        self.free_chains = chain_id_pool()
+        self.used_svgs = {}
+        self.chain_maps = []
+        self.svg_maps = []
+
+    def chain_map(self, source, chain):
+        '''
+        Output chain ID for chain of input number source.
+        '''
+        chains = self.chain_maps[source]
+        if chain not in chains:
+            new_chain = chain
+            if not self.keep_chains and chain in self.used_chains:
+                new_chain = next(new for new in self.free_chains
+                                 if new not in self.used_chains)
+            self.used_chains.add(new_chain)
+            chains[chain] = new_chain
+        return chains[chain]
+
+    def svg_map(self, source, input_location, svg):
+        '''
+        Output diagram path, relative to the output location, for svg of
+        input number source, copying the file if its path is taken.
+        '''
+        svgs = self.svg_maps[source]
+        if svg in svgs:
+            return svgs[svg]
+        path = os.path.normpath(os.path.join(input_location, svg))
+        new_svg = os.path.relpath(path, self.output_location)
+        owner = self.used_svgs.get(new_svg)
+        if owner is not None and owner != source:
+            stem, extension = os.path.splitext(svg)
+            for n in itertools.count(2):
+                new_svg = '{0}_{1}{2}'.format(stem, n, extension)
+                if (new_svg not in self.used_svgs and not os.path.exists(
+                        os.path.join(self.output_location, new_svg))):
+                    break
+            if os.path.isfile(path):
+                shutil.copy2(path, os.path.join(self.output_location, new_svg))
+        self.used_svgs[new_svg] = source
+        svgs[svg] = new_svg
+        return new_svg
+
+    def remap(self, source, input_location, element):
+        for tag in chain_tags:
+            for field in element.iter(tag):
+                if field.text is not None:
+                    field.text = self.chain_map(source, field.text.strip())
+        for field in element.iter('SugarName'):
+            match = sugar_name_chain.match(field.text or '')
+            if match is not None:
+                field.text = (match.group(1) +
+                              self.chain_map(source, match.group(2)) +
+                              match.group(3))
+        for tag in svg_tags:
+            for field in element.iter(tag):
+                if field.text:
+                    field.text = self.svg_map(source, input_location,
+                                              field.text.strip())
+
+    def merge(self, xmlfilenames, output_filename):
+        '''
+        Write the records of every file in xmlfilenames to output_filename.
+        Returns the number of records written.
+        '''
+        path = document_path(xmlfilenames[0])
+        count = 0
+        with etree.xmlfile(output_filename, encoding='UTF-8') as xf:
+            xf.write_declaration()
+            with nested_elements(xf, path):
+                for xmlfilename in xmlfilenames:
+                    source = len(self.chain_maps)
+                    self.chain_maps.append({})
+                    self.svg_maps.append({})
+                    input_location = os.path.dirname(
+                        os.path.abspath(xmlfilename))
+                    context = etree.iterparse(xmlfilename, events=('end',),
+                                              tag=record_tags)
+                    for _event, element in context:
+                        parent = element.getparent()
+                        if parent is None or parent.tag != 'ValidationData':
+                            continue
+                        self.remap(source, input_location, element)
+                        element.tail = None
+                        xf.write(element)
+                        count += 1
+                        privateer_xml.release_element(element)
+                    del context
+        return count
+
+    def mapping(self, xmlfilenames):
+        '''
+        Chain and diagram renames per input, for the record.
+        '''
+        return [{'input': xmlfilename,
+                 'chains': dict((old, new) for old, new in chains.items()
+                                if old != new),
+                 'svgs': svgs}
+                for xmlfilename, chains, svgs
+                in zip(xmlfilenames, self.chain_maps, self.svg_maps)]
+
+
+@contextlib.contextmanager
+def nested_elements(xf, path):
+    '''
+    Open the elements of path, outermost first, on an etree.xmlfile.
+    '''
+    if not path:
+        yield
+        return
+    with xf.element(path[0]):
+        with nested_elements(xf, path[1:]):
+            yield
+
+
+def merge_program_xml(output_location, input_locations, keep_chains=False):
+    '''
+    Merge the program.xml of every input location into
+    output_location/program.xml and save the renames applied.  With
+    keep_chains chain IDs are left alone, for inputs known to hold
+    disjoint chains.  Returns the number of records merged.
+    '''
+    xmlfilenames = [os.path.join(input_location, 'program.xml')
+                    for input_location in input_locations]
+    merger = ProgramXMLMerger(os.path.abspath(output_location), keep_chains)
+    output_filename = os.path.join(output_location, 'program.xml')
+    temp_filename = output_filename + '.tmp'
+    count = merger.merge(xmlfilenames, temp_filename)
+    os.rename(temp_filename, output_filename)
+    with open(os.path.join(output_location, merge_map_filename), 'w') as f:
+        json.dump(merger.mapping(xmlfilenames), f, indent=1)
+    return count
+
+
+def merge_coot_scripts(output_location, input_locations,
+                       name='privateer-results.py'):
+    '''
+    Concatenate the inputs' Coot scripts, if they wrote any.
+    '''
+    scripts = [os.path.join(input_location, name)
+               for input_location in input_locations
+               if os.path.exists(os.path.join(input_location, name))]
+    if not scripts:
+        return
+    with open(os.path.join(output_location, name), 'w') as output:
+        for script in scripts:
+            output.write('# {0}\n'.format(
+                os.path.relpath(script, output_location)))
+            with open(script) as f:
+                shutil.copyfileobj(f, output)
+            output.write('\n')
+
+
+def merge_args(output_location, input_locations, keep_chains=False):
+    '''
+    Arguments to ccpem-python that merge the inputs' results.
+    '''
+    args = ['-m', 'ccpem_core.tasks.privateer.privateer_merge',
+            output_location] + list(input_locations)
+    if keep_chains:
+        args.append('--keep_chains')
+    return args
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Merge the program.xml of several Privateer runs')
+    parser.add_argument('output_location')
+    parser.add_argument('input_locations', nargs='+')
+    parser.add_argument('--keep_chains', action='store_true',
+                        help='Keep chain IDs, for inputs with disjoint chains')
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    missing = [location for location in args.input_locations
+               if not os.path.exists(os.path.join(location, 'program.xml'))]
+    if missing:
+        print 'No Privateer results in {0}'.format(', '.join(missing))
+        return 1
+    count = merge_program_xml(args.output_location, args.input_locations,
+                              args.keep_chains)
+    merge_coot_scripts(args.output_location, args.input_locations)
+    print 'Merged {0} records from {1} Privateer runs'.format(
+        count, len(args.input_locations))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,255 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+'''
+Result model for Privateer validation data.
+
+Numeric fields are converted once when the record is built, their
+program.xml text being kept for display, and repeated strings (chain IDs,
+sugar names, diagnostics) are interned, so large reports share one copy
+of each.
+'''
+
+import numpy as np
+
+try:
+    intern
+except NameError:
+    from sys import intern
+
+# Sugar categories used by the validation plots
+SUGAR_OK = 0
+SUGAR_CONFORMATION = 1
+SUGAR_OTHER = 2
+
+
+def intern_text(text):
+    if text is None:
+        return None
+    try:
+        return intern(text)
+    except TypeError:
+        # Non-ASCII text comes back from lxml as unicode under Python 2
+        return text
+
+
+def to_float(text):
+    if text is None:
+        return float('nan')
+    try:
+        return float(text)
+    except ValueError:
+        return float('nan')
+
+
+def classify_diagnostic(diagnostic):
+    '''
+    Plot category for a Privateer diagnostic string.
+    '''
+    if diagnostic is None:
+        return SUGAR_OTHER
+    if 'conformation' in diagnostic.lower():
+        return SUGAR_CONFORMATION
+    elif 'Ok' in diagnostic:
+        return SUGAR_OK
+    return SUGAR_OTHER
+
+
+class PrivateerSugar(object):
+    '''
+    Validation result for one monosaccharide.  Furanoses have no theta.
+    '''
+    __slots__ = ('ring', 'chain', 'name', 'q', 'phi', 'theta', 'anomer',
+                 'hand', 'conformation', 'rscc', 'bfactor', 'diagnostic',
+                 'numeric_text')
+
+    pyranose_columns = ('chain', 'name', 'q', 'phi', 'theta', 'anomer',
+                        'hand', 'conformation', 'rscc', 'bfactor',
+                        'diagnostic')
+    furanose_columns = ('chain', 'name', 'q', 'phi', 'anomer', 'hand',
+                        'conformation', 'rscc', 'bfactor', 'diagnostic')
+    # Numeric fields, whose program.xml text is kept, interned, for display
+    numeric_columns = ('q', 'phi', 'theta', 'rscc', 'bfactor')
+
+    def __init__(self,
+                 ring,
+                 chain,
+                 name,
+                 q,
+                 phi,
+                 theta,
+                 anomer,
+                 hand,
+                 conformation,
+                 rscc,
+                 bfactor,
+                 diagnostic):
+        self.ring = intern_text(ring)
+        self.chain = intern_text(chain)
+        self.name = intern_text(name)
+        self.q = to_float(q)
+        self.phi = to_float(phi)
+        self.theta = None if theta is None else to_float(theta)
+        self.anomer = intern_text(anomer)
+        self.hand = intern_text(hand)
+        self.conformation = intern_text(conformation)
+        self.rscc = to_float(rscc)
+        self.bfactor = to_float(bfactor)
+        self.diagnostic = intern_text(diagnostic)
+        self.numeric_text = (intern_text(q), intern_text(phi),
+                             intern_text(theta), intern_text(rscc),
+                             intern_text(bfactor))
+
+    @property
+    def columns(self):
+        if self.ring == 'furanose':
+            return self.furanose_columns
+        return self.pyranose_columns
+
+    def text(self, column):
+        '''
+        Field as written in program.xml, '' if missing.
+        '''
+        if column in self.numeric_columns:
+            text = self.numeric_text[self.numeric_columns.index(column)]
+        else:
+            text = getattr(self, column)
+        if text is None:
+            return ''
+        return text
+
+    def table_row(self):
+        '''
+        Values as shown in the validation table, in column order.
+        '''
+        return [self.text(column) for column in self.columns]
+
+    def __repr__(self):
+        return 'PrivateerSugar({0} {1} {2})'.format(
+            self.ring, self.chain, self.name)
+
+
+class GlycanPermutation(object):
+    '''
+    Closest GlyConnect match found by permuting a glycan.
+    '''
+    __slots__ = ('wurcs', 'score', 'score_text', 'anomer_permutations',
+                 'residue_permutations', 'residue_deletions', 'gtc_id',
+                 'glyconnect_id', 'svg')
+
+    def __init__(self,
+                 wurcs,
+                 score,
+                 anomer_permutations,
+                 residue_permutations,
+                 residue_deletions,
+                 gtc_id,
+                 glyconnect_id,
+                 svg):
+        self.wurcs = intern_text(wurcs)
+        self.score = to_float(score)
+        self.score_text = intern_text(score) or ''
+        self.anomer_permutations = intern_text(anomer_permutations)
+        self.residue_permutations = intern_text(residue_permutations)
+        self.residue_deletions = intern_text(residue_deletions)
+        self.gtc_id = intern_text(gtc_id)
+        self.glyconnect_id = intern_text(glyconnect_id)
+        self.svg = svg
+
+
+class PrivateerGlycan(object):
+    '''
+    Glycan tree detected in the model.  permutations is None when
+    Privateer did not search for close matches.
+    '''
+    __slots__ = ('chain', 'wurcs', 'gtc_id', 'glyconnect_id', 'svg',
+                 'permutations')
+
+    def __init__(self,
+                 chain,
+                 wurcs,
+                 gtc_id,
+                 glyconnect_id,
+                 svg,
+                 permutations=None):
+        self.chain = intern_text(chain)
+        self.wurcs = intern_text(wurcs)
+        self.gtc_id = intern_text(gtc_id)
+        self.glyconnect_id = intern_text(glyconnect_id)
+        self.svg = svg
+        self.permutations = permutations
+
+    def __repr__(self):
+        return 'PrivateerGlycan({0} {1})'.format(self.chain, self.svg)
+
+
+class PrivateerValidationData(object):
+    '''
+    Records read from the ValidationData section of program.xml.
+    '''
+    def __init__(self):
+        self.pyranoses = []
+        self.furanoses = []
+        self.glycans = []
+        self.section_hashes = {}
+
+    def is_empty(self):
+        return not (self.pyranoses or self.furanoses or self.glycans)
+
+
+class SugarTable(object):
+    '''
+    Columnar view of a list of PrivateerSugar records.
+
+    Numeric fields and the plot category are held in one structured
+    array, so classification and per-category selection are vectorised.
+    '''
+    dtype = np.dtype([('q', 'f8'),
+                      ('phi', 'f8'),
+                      ('theta', 'f8'),
+                      ('rscc', 'f8'),
+                      ('bfactor', 'f8'),
+                      ('category', 'i1')])
+
+    def __init__(self, sugars):
+        self.data = np.empty(len(sugars), dtype=self.dtype)
+        for column in ('q', 'phi', 'rscc', 'bfactor'):
+            self.data[column] = [getattr(sugar, column) for sugar in sugars]
+        self.data['theta'] = [np.nan if sugar.theta is None else sugar.theta
+                              for sugar in sugars]
+        self.data['category'] = self.classify(
+            [sugar.diagnostic or '' for sugar in sugars])
+
+    @staticmethod
+    def classify(diagnostics):
+        '''
+        Categories for an array of diagnostics.  Diagnostics repeat a lot,
+        so each distinct string is classified once and broadcast back.
+        '''
+        if not len(diagnostics):
+            return np.empty(0, dtype='i1')
+        unique, inverse = np.unique(np.asarray(diagnostics),
+                                    return_inverse=True)
+        categories = np.array([classify_diagnostic(diagnostic)
+                               for diagnostic in unique], dtype='i1')
+        return categories[inverse]
+
+    def __len__(self):
+        return len(self.data)
+
+    def column(self, name):
+        return self.data[name]
+
+    def series(self, category, name):
+        '''
+        Values of column name for sugars in category, in model order.
+        '''
+        return self.data[name][self.data['category'] == category]
+
+    def count(self, category):
+        return int(np.count_nonzero(self.data['category'] == category))
@@ -0,0 +1,347 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+'''
+Memory-mapped MRC / CCP4 map access, pre-flight checks and cropping
+around sugars.
+
+Only the header and the voxels that are checked or inside the crop box
+are read, so the full map is never loaded.  The crop keeps the grid sampling and cell of the
+input and records its position through the start indices, so Privateer
+sees the same density on the same grid.
+
+    ccpem-python -m ccpem_core.tasks.privateer.privateer_mrc \\
+        <model> <map> <output map> [--margin 10] [--code XYZ]
+'''
+
+import os
+import sys
+import shutil
+import argparse
+import collections
+import numpy as np
+from ccpem_core.tasks.privateer import privateer_structure
+
+header_fields = [('nc', 'i4'), ('nr', 'i4'), ('ns', 'i4'), ('mode', 'i4'),
+                 ('ncstart', 'i4'), ('nrstart', 'i4'), ('nsstart', 'i4'),
+                 ('mx', 'i4'), ('my', 'i4'), ('mz', 'i4'),
+                 ('cella', 'f4', 3), ('cellb', 'f4', 3),
+                 ('mapc', 'i4'), ('mapr', 'i4'), ('maps', 'i4'),
+                 ('dmin', 'f4'), ('dmax', 'f4'), ('dmean', 'f4'),
+                 ('ispg', 'i4'), ('nsymbt', 'i4'), ('extra', 'V100'),
+                 ('origin', 'f4', 3), ('map', 'S4'), ('machst', 'u1', 4),
+                 ('rms', 'f4'), ('nlabl', 'i4'), ('label', 'S80', 10)]
+
+header_size = 1024
+
+mode_dtypes = {0: 'i1', 1: 'i2', 2: 'f4', 6: 'u2', 12: 'f2'}
+
+# Voxels sampled along each axis by the pre-flight check
+preflight_samples = 16
+
+PreflightIssue = collections.namedtuple('PreflightIssue', ['level', 'message'])
+
+
+def header_dtype(byte_order):
+    return np.dtype([field_dtype(field, byte_order) for field in header_fields])
+
+
+def field_dtype(field, byte_order):
+    name, kind = field[0], field[1]
+    if kind[0] in 'if':
+        kind = byte_order + kind
+    if len(field) == 3:
+        return (name, kind, field[2])
+    return (name, kind)
+
+
+class MRCMap(object):
+    '''
+    Header and memory-mapped voxels of an MRC / CCP4 map.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.byte_order = '<'
+        if os.path.getsize(path) < header_size:
+            raise ValueError('File is too short to be an MRC map: ' + path)
+        header = np.fromfile(path, dtype=header_dtype('<'), count=1)[0]
+        if not 0 <= header['mode'] <= 16 or not 0 < header['mapc'] <= 3:
+            self.byte_order = '>'
+            header = np.fromfile(path, dtype=header_dtype('>'), count=1)[0]
+        self.header = header
+        mode = int(header['mode'])
+        if mode not in mode_dtypes:
+            raise ValueError('Unsupported MRC mode {0}: {1}'.format(mode, path))
+        self.dtype = np.dtype(self.byte_order + mode_dtypes[mode])
+        self.shape = (int(header['ns']), int(header['nr']), int(header['nc']))
+        self.data_offset = header_size + int(header['nsymbt'])
+        expected = self.data_offset + self.dtype.itemsize * int(np.prod(self.shape))
+        if os.path.getsize(path) < expected:
+            raise ValueError('MRC file is shorter than its header says: ' + path)
+
+    @property
+    def data(self):
+        return np.memmap(self.path, dtype=self.dtype, mode='r',
+                         offset=self.data_offset, shape=self.shape)
+
+    def is_orthogonal(self):
+        return bool(np.allclose(self.header['cellb'], 90.0))
+
+    def voxel_size(self):
+        '''
+        Grid spacing along X, Y and Z in Angstrom.
+        '''
+        sampling = np.array([self.header['mx'], self.header['my'],
+                             self.header['mz']], dtype='f8')
+        return np.array(self.header['cella'], dtype='f8') / sampling
+
+    def axis_order(self):
+        '''
+        X/Y/Z axis (0-2) of columns, rows and sections.
+        '''
+        return [int(self.header['mapc']) - 1, int(self.header['mapr']) - 1,
+                int(self.header['maps']) - 1]
+
+    def starts(self):
+        return [int(self.header['ncstart']), int(self.header['nrstart']),
+                int(self.header['nsstart'])]
+
+    def extent(self, use_origin=False):
+        '''
+        (low, high) X/Y/Z corners in Angstrom of the voxels in the file,
+        placed by the start indices or, with use_origin, by the origin.
+        '''
+        voxel = self.voxel_size()
+        sizes = [self.shape[2], self.shape[1], self.shape[0]]
+        low = np.zeros(3)
+        high = np.zeros(3)
+        for axis, start, size in zip(self.axis_order(), self.starts(), sizes):
+            if use_origin:
+                low[axis] = self.header['origin'][axis]
+            else:
+                low[axis] = start * voxel[axis]
+            high[axis] = low[axis] + (size - 1) * voxel[axis]
+        return low, high
+
+    def sample(self, samples=preflight_samples):
+        '''
+        Evenly strided voxels, about samples along each axis.
+        '''
+        steps = [max(1, size // samples) for size in self.shape]
+        data = self.data
+        values = np.array(data[::steps[0], ::steps[1], ::steps[2]], dtype='f8')
+        del data
+        return values
+
+    def crop_box(self, coordinates, margin):
+        '''
+        (start, stop) file indices for columns, rows and sections of the
+        box around coordinates plus margin Angstrom, clipped to the map.
+        None if it can not be computed for this map.
+        '''
+        if not len(coordinates) or not self.is_orthogonal():
+            return None
+        # A non-zero origin with nstart set is read differently by
+        # different programs, so only crop maps placed by nstart
+        if np.any(np.array(self.header['origin']) != 0.0):
+            return None
+        voxel = self.voxel_size()
+        low = np.floor((coordinates.min(axis=0) - margin) / voxel).astype(int)
+        high = np.ceil((coordinates.max(axis=0) + margin) / voxel).astype(int)
+        sizes = [self.shape[2], self.shape[1], self.shape[0]]
+        box = []
+        for axis, start, size in zip(self.axis_order(), self.starts(), sizes):
+            box.append((int(np.clip(low[axis] - start, 0, size)),
+                        int(np.clip(high[axis] - start + 1, 0, size))))
+        if any(stop <= start for start, stop in box):
+            return None
+        return box
+
+    def write_crop(self, path, box):
+        '''
+        Write the voxels in box to a new map at path, one section at a
+        time, with statistics recomputed and the extended header dropped.
+        '''
+        (c0, c1), (r0, r1), (s0, s1) = box
+        data = self.data
+        header = np.array(self.header, dtype=self.header.dtype).copy()
+        header['nc'], header['nr'], header['ns'] = c1 - c0, r1 - r0, s1 - s0
+        header['ncstart'] += c0
+        header['nrstart'] += r0
+        header['nsstart'] += s0
+        header['nsymbt'] = 0
+        count = 0
+        total = 0.0
+        total_sq = 0.0
+        dmin = np.inf
+        dmax = -np.inf
+        for section in range(s0, s1):
+            values = np.asarray(data[section, r0:r1, c0:c1], dtype='f8')
+            count += values.size
+            total += values.sum()
+            total_sq += np.square(values).sum()
+            dmin = min(dmin, values.min())
+            dmax = max(dmax, values.max())
+        mean = total / count
+        header['dmin'] = dmin
+        header['dmax'] = dmax
+        header['dmean'] = mean
+        header['rms'] = np.sqrt(max(total_sq / count - mean * mean, 0.0))
+        with open(path, 'wb') as f:
+            f.write(header.tobytes())
+            for section in range(s0, s1):
+                f.write(np.ascontiguousarray(
+                    data[section, r0:r1, c0:c1]).tobytes())
+        del data
+
+
+def preflight_map(map_path, resolution=None, model_path=None,
+                  extra_codes=()):
+    '''
+    Quick checks of map_path before Privateer is run on it, reading the
+    header and a sparse sample of voxels only.  Returns a list of
+    PreflightIssue with level 'error' (Privateer would fail or give
+    meaningless results) or 'warning'.
+    '''
+    issues = []
+    try:
+        mrc = MRCMap(map_path)
+    except (IOError, OSError, ValueError) as e:
+        return [PreflightIssue('error', 'Unable to read map: {0}'.format(e))]
+    header = mrc.header
+    if min(mrc.shape) < 1:
+        issues.append(PreflightIssue(
+            'error', 'Map has no voxels ({0} x {1} x {2})'.format(
+                *reversed(mrc.shape))))
+    if (sorted(mrc.axis_order()) != [0, 1, 2] or
+            min(header['mx'], header['my'], header['mz']) < 1 or
+            np.any(np.array(header['cella']) <= 0.0)):
+        issues.append(PreflightIssue(
+            'error', 'Map header has an invalid cell, sampling or axis order'))
+    if issues:
+        return issues
+
+    voxel = mrc.voxel_size()
+    if resolution:
+        if resolution < 2.0 * voxel.max():
+            issues.append(PreflightIssue(
+                'warning', 'Resolution {0:.2f} A is finer than the map '
+                'sampling supports ({1:.2f} A voxels, Nyquist {2:.2f} A)'.format(
+                    resolution, voxel.max(), 2.0 * voxel.max())))
+        if voxel.max() > 1.01 * voxel.min():
+            issues.append(PreflightIssue(
+                'warning', 'Voxels are not cubic ({0:.3f} x {1:.3f} x {2:.3f} A)'.format(
+                    *voxel)))
+
+    values = mrc.sample()
+    if not np.all(np.isfinite(values)):
+        issues.append(PreflightIssue(
+            'error', 'Map contains NaN or infinite values'))
+    elif values.size and values.max() == values.min():
+        issues.append(PreflightIssue(
+            'error', 'Map is flat, every sampled voxel is {0:g}'.format(
+                values.min())))
+
+    if model_path is None or not os.path.isfile(model_path):
+        return issues
+    if not mrc.is_orthogonal():
+        issues.append(PreflightIssue(
+            'warning', 'Non-orthogonal cell, model placement not checked'))
+        return issues
+    try:
+        coordinates = privateer_structure.sugar_coordinates(
+            model_path, extra_codes, hetero=True)
+    except (IOError, OSError) as e:
+        issues.append(PreflightIssue(
+            'warning', 'Unable to read model: {0}'.format(e)))
+        return issues
+    if not len(coordinates):
+        return issues
+    low, high = mrc.extent()
+    inside = np.all((coordinates >= low) & (coordinates <= high), axis=1)
+    if inside.mean() >= 0.5:
+        return issues
+    message = '{0:.0f}% of the carbohydrate atoms lie outside the map'.format(
+        100.0 * (1.0 - inside.mean()))
+    if np.all(np.array(header['origin']) == 0.0):
+        issues.append(PreflightIssue('error', message))
+        return issues
+    # Programs differ on whether the origin field or the start indices
+    # place the map, only fail if the model is outside either way
+    origin_low, origin_high = mrc.extent(use_origin=True)
+    origin_inside = np.all((coordinates >= origin_low) &
+                           (coordinates <= origin_high), axis=1)
+    if origin_inside.mean() >= 0.5:
+        issues.append(PreflightIssue(
+            'warning', message + ' by its start indices, the map seems to '
+            'be placed by its origin field instead'))
+    else:
+        issues.append(PreflightIssue(
+            'warning', message + ' whether placed by its start indices or '
+            'its origin field'))
+    return issues
+
+
+def crop_map_to_sugars(model_path, map_path, output_path, margin=10.0,
+                       extra_codes=()):
+    '''
+    Write the part of map_path within margin Angstrom of the model's
+    carbohydrates to output_path.  When no box can be cut (no sugars,
+    non-orthogonal cell, origin-placed map) output_path links to the full
+    map instead.  Returns the crop box or None.
+    '''
+    coordinates = privateer_structure.sugar_coordinates(
+        model_path, extra_codes, hetero=True)
+    mrc = MRCMap(map_path)
+    box = mrc.crop_box(coordinates, margin)
+    if os.path.lexists(output_path):
+        os.remove(output_path)
+    if box is None:
+        try:
+            os.symlink(os.path.abspath(map_path), output_path)
+        except (OSError, AttributeError):
+            shutil.copy2(map_path, output_path)
+        return None
+    mrc.write_crop(output_path, box)
+    return box
+
+
+def crop_args(model_path, map_path, output_path, margin, extra_codes=()):
+    '''
+    Arguments to ccpem-python that run crop_map_to_sugars.
+    '''
+    args = ['-m', 'ccpem_core.tasks.privateer.privateer_mrc',
+            model_path, map_path, output_path, '--margin', str(margin)]
+    for code in extra_codes:
+        if code:
+            args += ['--code', code]
+    return args
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Crop a map to the neighbourhood of a model\'s sugars')
+    parser.add_argument('model')
+    parser.add_argument('map')
+    parser.add_argument('output')
+    parser.add_argument('--margin', type=float, default=10.0)
+    parser.add_argument('--code', action='append', default=[])
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    box = crop_map_to_sugars(args.model, args.map, args.output,
+                             args.margin, args.code)
+    if box is None:
+        print 'Map not cropped, using the full map'
+    else:
+        print 'Map cropped to columns {0}-{1}, rows {2}-{3}, sections {4}-{5}'.format(
+            box[0][0], box[0][1] - 1, box[1][0], box[1][1] - 1,
+            box[2][0], box[2][1] - 1)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
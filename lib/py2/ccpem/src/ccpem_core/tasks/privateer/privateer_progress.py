@@ -0,0 +1,181 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+'''
+Progress of running Privateer processes.
+
+privateer_runner feeds every line Privateer prints to a ProgressTracker,
+which counts the sugars, glycans and permutations mentioned and the
+diagrams written so far, and saves the counts with their rates to
+privateer_progress.json in the run directory every few seconds.  The
+window and any monitoring read those files, summed over the shards or
+batch entries of a job.
+'''
+
+import os
+import re
+import glob
+import json
+import time
+import threading
+
+progress_filename = 'privateer_progress.json'
+
+# Seconds between writes of the progress file
+write_interval = 2.0
+
+# Privateer log markers.  Sugars and glycans are counted once per distinct
+# ID, database matches and permutations once per line.
+sugar_marker = re.compile(r'\b[A-Z0-9]{3}-/?[A-Za-z0-9]{1,4}[/-]-?\d+[A-Za-z]?/?')
+glycan_marker = re.compile(r'WURCS=\S+')
+match_marker = re.compile(r'(GlyTouCan|GlyConnect) ID', re.I)
+permutation_marker = re.compile(r'permutation', re.I)
+
+# Progress files of a job, its shards and its batch entries
+progress_patterns = (progress_filename,
+                     os.path.join('shard_*', progress_filename),
+                     os.path.join('batch', '*', progress_filename),
+                     os.path.join('batch', '*', 'shard_*', progress_filename))
+
+counters = ('sugars', 'glycans', 'matched', 'permutations', 'diagrams')
+
+
+class ProgressTracker(object):
+    '''
+    Counts for one Privateer process, written to job_location.
+    '''
+    def __init__(self, job_location, total_sugars=None):
+        self.path = os.path.join(job_location, progress_filename)
+        self.job_location = job_location
+        self.total_sugars = total_sugars
+        self.started = time.time()
+        self.last_write = 0.0
+        self.lines = 0
+        self.sugars = set()
+        self.glycans = set()
+        self.matched = 0
+        self.permutations = 0
+        self.diagrams = 0
+        self.lock = threading.Lock()
+
+    def feed(self, line):
+        '''
+        Count the markers in one line of Privateer output.
+        '''
+        with self.lock:
+            self.lines += 1
+            self.sugars.update(sugar_marker.findall(line))
+            self.glycans.update(glycan_marker.findall(line))
+            if match_marker.search(line) and 'unable' not in line.lower():
+                self.matched += 1
+            if permutation_marker.search(line):
+                self.permutations += 1
+
+    def scan_outputs(self):
+        '''
+        Count the diagrams written to the run directory so far.
+        '''
+        diagrams = len(glob.glob(os.path.join(self.job_location, '*.svg')))
+        with self.lock:
+            self.diagrams = diagrams
+
+    def counts(self):
+        with self.lock:
+            return {'sugars': len(self.sugars),
+                    'glycans': len(self.glycans),
+                    'matched': self.matched,
+                    'permutations': self.permutations,
+                    'diagrams': self.diagrams}
+
+    def write(self, status='running', force=False):
+        '''
+        Save the counts and rates, at most every write_interval seconds
+        unless forced.
+        '''
+        now = time.time()
+        if not force and now - self.last_write < write_interval:
+            return
+        self.last_write = now
+        elapsed = now - self.started
+        counts = self.counts()
+        progress = {'status': status,
+                    'pid': os.getpid(),
+                    'started': self.started,
+                    'updated': now,
+                    'elapsed': elapsed,
+                    'total_sugars': self.total_sugars,
+                    'lines': self.lines,
+                    'counts': counts,
+                    'rates': dict((name, count / elapsed if elapsed > 0 else 0.0)
+                                  for name, count in counts.items())}
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(progress, f)
+        os.rename(temp_path, self.path)
+
+
+def read_progress(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def job_progress(job_location):
+    '''
+    Progress of every Privateer process of a job summed into one record,
+    or None if none has started.  status is running while any process
+    is.
+    '''
+    records = []
+    for pattern in progress_patterns:
+        for path in sorted(glob.glob(os.path.join(job_location, pattern))):
+            record = read_progress(path)
+            if record is not None:
+                records.append(record)
+    if not records:
+        return None
+    totals = [record.get('total_sugars') for record in records]
+    started = min(record['started'] for record in records)
+    updated = max(record['updated'] for record in records)
+    elapsed = max(updated - started, 0.0)
+    counts = dict((name, sum(record['counts'].get(name, 0) for record in records))
+                  for name in counters)
+    return {'status': ('running' if any(record['status'] == 'running'
+                                        for record in records)
+                       else records[-1]['status']),
+            'processes': len(records),
+            'running': sum(1 for record in records
+                           if record['status'] == 'running'),
+            'elapsed': elapsed,
+            'total_sugars': None if None in totals else sum(totals),
+            'counts': counts,
+            'rates': dict((name, count / elapsed if elapsed > 0 else 0.0)
+                          for name, count in counts.items())}
+
+
+def describe(progress):
+    '''
+    One line summary of job_progress for display.
+    '''
+    counts = progress['counts']
+    sugars = '{0}'.format(counts['sugars'])
+    if progress['total_sugars']:
+        sugars += ' of {0}'.format(progress['total_sugars'])
+    parts = ['{0} sugars'.format(sugars),
+             '{0} glycans ({1} matched)'.format(counts['glycans'],
+                                                counts['matched']),
+             '{0} permutations'.format(counts['permutations']),
+             '{0} diagrams'.format(counts['diagrams'])]
+    if progress['processes'] > 1:
+        parts.append('{0} of {1} processes running'.format(
+            progress['running'], progress['processes']))
+    parts.append('{0:.0f} s, {1:.1f} sugars/s'.format(
+        progress['elapsed'], progress['rates']['sugars']))
+    return ', '.join(parts)
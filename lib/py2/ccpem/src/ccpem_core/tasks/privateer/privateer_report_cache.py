@@ -0,0 +1,131 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+'''
+Content-hash cache for Privateer report artefacts.
+
+The rendered validation tables and glycan view are stored under
+report/cache, recorded in a manifest with the hash of the program.xml
+section and source files (SVG diagrams, looked up IDs) they were built
+from, and reused rather than rebuilt while that key is unchanged.
+
+Together the keys also cover everything else in the report, so the
+manifest doubles as a freshness check for the whole report: when every
+key matches the report on disk is left as it is.  Parts without a stored
+artefact, such as the graphs, are redrawn whenever it is not.
+'''
+
+import os
+import json
+import hashlib
+
+# Bump when report rendering changes so old artefacts are rebuilt
+report_cache_version = 5
+
+
+def hash_strings(*strings):
+    '''
+    Combine several keys or text chunks into one hex digest.
+    '''
+    digest = hashlib.sha1()
+    digest.update(str(report_cache_version).encode('ascii'))
+    for string in strings:
+        if string is None:
+            string = ''
+        if not isinstance(string, bytes):
+            string = string.encode('utf-8')
+        digest.update(string)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class ReportCache(object):
+    '''
+    Manifest of artefact keys plus stored artefact content.
+    '''
+    def __init__(self, report_directory):
+        self.directory = os.path.join(report_directory, 'cache')
+        self.manifest_path = os.path.join(self.directory, 'manifest.json')
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path) as f:
+                    self.manifest = json.load(f)
+            except ValueError:
+                self.manifest = {}
+        self.touched = set()
+
+    def artefact_path(self, name):
+        return os.path.join(self.directory,
+                            hashlib.sha1(name.encode('utf-8')).hexdigest() + '.html')
+
+    def is_current(self, keys):
+        '''
+        True if every artefact in keys was built with the same key and no
+        other artefacts are recorded.
+        '''
+        return (set(keys) == set(self.manifest) and
+                all(self.manifest[name] == key for name, key in keys.items()))
+
+    def get(self, name, key):
+        '''
+        Stored content for name if it was built from key, else None.
+        '''
+        if key is None or self.manifest.get(name) != key:
+            return None
+        path = self.artefact_path(name)
+        if not os.path.exists(path):
+            return None
+        self.touched.add(name)
+        with open(path, 'rb') as f:
+            content = f.read()
+        if not isinstance(content, str):
+            content = content.decode('utf-8')
+        return content
+
+    def put(self, name, key, content=None):
+        '''
+        Record name as built from key, storing content if given.
+        '''
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        if content is not None:
+            if not isinstance(content, bytes):
+                content = content.encode('utf-8')
+            with open(self.artefact_path(name), 'wb') as f:
+                f.write(content)
+        self.manifest[name] = key
+        self.touched.add(name)
+
+    def save(self):
+        '''
+        Write the manifest, dropping artefacts not used in this render.
+        '''
+        for name in list(self.manifest):
+            if name not in self.touched:
+                del self.manifest[name]
+                path = self.artefact_path(name)
+                if os.path.exists(path):
+                    os.remove(path)
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        with open(self.manifest_path, 'w') as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+
+    def clear(self):
+        '''
+        Forget every artefact, so the next report is built in full.
+        '''
+        for name in self.manifest:
+            path = self.artefact_path(name)
+            if os.path.exists(path):
+                os.remove(path)
+        self.manifest = {}
+        self.touched = set()
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
@@ -0,0 +1,496 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+'''
+Content-addressed cache of Privateer outputs.
+
+A run is keyed on the Privateer executable and the exact argument list it
+is given, with input file paths (model, map, database) replaced by hashes
+of their content and the core count left out.  The outputs of a finished
+run (program.xml, privateer-results.py and the SVG diagrams) are stored
+under that key in the per-user CCP-EM directory, and a later job with the
+same key is materialised by copying them into its directory instead of
+running Privateer.  The least recently used results are evicted once the
+cache grows past CCPEM_PRIVATEER_RESULT_CACHE_MB megabytes (default 2048).
+
+The compute arguments alone give a compute key, so a stored run that
+differs only in diagram options can be reused with its diagrams redrawn
+from the model.  That needs a Privateer that runs on a model without a
+map, which is checked once per executable by running it on a single
+N-acetylglucosamine, and the verdict kept with the cache.
+
+    ccpem-python -m ccpem_core.tasks.privateer.privateer_result_cache \\
+        materialise <key> <job_location>
+'''
+
+import os
+import sys
+import json
+import errno
+import shutil
+import time
+import hashlib
+import tempfile
+import argparse
+import subprocess
+from ccpem_core.tasks.privateer import privateer_xml
+
+# Bump when the key or the stored layout changes
+result_cache_version = 2
+
+# Privateer flags whose value is an input file
+file_flags = ('-pdbin', '-mapin', '-databasein')
+# Flags that do not change Privateer's output, with their value
+ignored_flags = ('-cores',)
+
+result_files = ('program.xml', 'privateer-results.py')
+manifest_filename = 'manifest.json'
+capabilities_filename = 'capabilities.json'
+
+default_size_limit_mb = 2048
+
+# Seconds a model-only test run of Privateer may take
+probe_timeout = 60
+
+# One beta-GlcNAc, the model of the model-only test run
+probe_model = '''\
+CRYST1   20.000   20.000   20.000  90.00  90.00  90.00 P 1           1
+HETATM    1  C1  NAG A   1      11.440  10.000  10.250  1.00 20.00           C
+HETATM    2  C2  NAG A   1      10.720  11.247   9.750  1.00 20.00           C
+HETATM    3  C3  NAG A   1       9.280  11.247  10.250  1.00 20.00           C
+HETATM    4  C4  NAG A   1       8.560  10.000   9.750  1.00 20.00           C
+HETATM    5  C5  NAG A   1       9.280   8.753  10.250  1.00 20.00           C
+HETATM    6  C6  NAG A   1       8.563   7.510   9.748  1.00 20.00           C
+HETATM    7  C7  NAG A   1      11.555  12.694  11.530  1.00 20.00           C
+HETATM    8  C8  NAG A   1      12.285  13.958  11.875  1.00 20.00           C
+HETATM    9  N2  NAG A   1      11.409  12.440  10.232  1.00 20.00           N
+HETATM   10  O1  NAG A   1      12.790  10.000   9.778  1.00 20.00           O
+HETATM   11  O3  NAG A   1       8.605  12.416   9.778  1.00 20.00           O
+HETATM   12  O4  NAG A   1       7.210  10.000  10.222  1.00 20.00           O
+HETATM   13  O5  NAG A   1      10.720   8.753   9.750  1.00 20.00           O
+HETATM   14  O6  NAG A   1       8.115   6.735  10.862  1.00 20.00           O
+HETATM   15  O7  NAG A   1      11.118  11.937  12.395  1.00 20.00           O
+END
+'''
+
+
+def default_cache_location():
+    return os.path.join(os.path.expanduser('~'), '.ccpem', 'privateer',
+                        'result_cache')
+
+
+def size_limit():
+    '''
+    Size in bytes the cache is trimmed to after each store.
+    '''
+    try:
+        megabytes = float(os.environ.get('CCPEM_PRIVATEER_RESULT_CACHE_MB',
+                                         default_size_limit_mb))
+    except ValueError:
+        megabytes = default_size_limit_mb
+    return int(megabytes * (1 << 20))
+
+
+def executable_stamp(command):
+    '''
+    Path, size and mtime of command, so a rebuilt Privateer gets new keys.
+    '''
+    if command is not None and os.path.exists(command):
+        stat = os.stat(command)
+        return '{0}:{1}:{2}'.format(os.path.realpath(command),
+                                    stat.st_size, stat.st_mtime)
+    return str(command)
+
+
+def probe_model_only(command, timeout=probe_timeout):
+    '''
+    True if command, a Privateer executable, validates a model given
+    without a map and writes its program.xml.
+    '''
+    location = tempfile.mkdtemp(prefix='privateer_probe_')
+    try:
+        model_path = os.path.join(location, 'probe.pdb')
+        with open(model_path, 'w') as f:
+            f.write(probe_model)
+        with open(os.devnull, 'w') as devnull:
+            try:
+                process = subprocess.Popen([command, '-pdbin', model_path],
+                                           cwd=location,
+                                           stdin=devnull,
+                                           stdout=devnull,
+                                           stderr=devnull)
+            except OSError:
+                return False
+            deadline = time.time() + timeout
+            while process.poll() is None:
+                if time.time() > deadline:
+                    process.kill()
+                    process.wait()
+                    return False
+                time.sleep(0.1)
+        return (process.returncode == 0 and
+                os.path.exists(os.path.join(location, 'program.xml')))
+    finally:
+        shutil.rmtree(location, ignore_errors=True)
+
+
+def make_directory(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+class ResultCache(object):
+    '''
+    Stored Privateer outputs, one directory per result key.
+    '''
+    def __init__(self, location=None, max_bytes=None):
+        if location is None:
+            location = default_cache_location()
+        if max_bytes is None:
+            max_bytes = size_limit()
+        self.location = location
+        self.max_bytes = max_bytes
+        self.file_hashes_path = os.path.join(location, 'file_hashes.json')
+        self.file_hashes = None
+
+    def file_digest(self, path, block_size=1 << 20):
+        '''
+        Content hash of path.  Hashes are remembered by path, size and
+        mtime so large maps are only read once.
+        '''
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        stamp = [stat.st_size, stat.st_mtime]
+        if self.file_hashes is None:
+            self.file_hashes = {}
+            if os.path.exists(self.file_hashes_path):
+                try:
+                    with open(self.file_hashes_path) as f:
+                        self.file_hashes = json.load(f)
+                except ValueError:
+                    pass
+        cached = self.file_hashes.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                digest.update(block)
+        self.file_hashes[path] = [stamp, digest.hexdigest()]
+        make_directory(self.location)
+        temp_path = self.file_hashes_path + '.tmp.{0}'.format(os.getpid())
+        with open(temp_path, 'w') as f:
+            json.dump(self.file_hashes, f)
+        os.rename(temp_path, self.file_hashes_path)
+        return digest.hexdigest()
+
+    def compute_key(self, command, privateer_args):
+        '''
+        Key of the analysis done by command with privateer_args, the
+        compute arguments only, or None if an input file is missing.
+        '''
+        parts = [str(result_cache_version), executable_stamp(command)]
+        args = [str(arg) for arg in privateer_args]
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            if arg in ignored_flags:
+                i += 2
+                continue
+            parts.append(arg)
+            if arg in file_flags and i + 1 < len(args):
+                if not os.path.isfile(args[i + 1]):
+                    return None
+                parts.append(self.file_digest(args[i + 1]))
+                i += 1
+            i += 1
+        return hashlib.sha1('\0'.join(parts).encode('utf-8')).hexdigest()
+
+    def result_key(self, compute_key, presentation_args):
+        '''
+        Key of a run's full output, diagrams included.
+        '''
+        if compute_key is None:
+            return None
+        return hashlib.sha1('\0'.join(
+            [compute_key] + [str(arg) for arg in presentation_args]).encode(
+                'utf-8')).hexdigest()
+
+    def model_only_supported(self, command):
+        '''
+        True if command can redraw diagrams from a model alone.  Test
+        runs are remembered by executable, so each build is run once.
+        '''
+        path = os.path.join(self.location, capabilities_filename)
+        capabilities = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    capabilities = json.load(f)
+            except ValueError:
+                pass
+        stamp = executable_stamp(command)
+        if stamp not in capabilities:
+            capabilities[stamp] = probe_model_only(command)
+            make_directory(self.location)
+            temp_path = path + '.tmp.{0}'.format(os.getpid())
+            with open(temp_path, 'w') as f:
+                json.dump(capabilities, f)
+            os.rename(temp_path, path)
+        return capabilities[stamp]
+
+    def compute_index_path(self, compute_key):
+        return os.path.join(self.location, 'compute', compute_key[:2],
+                            compute_key)
+
+    def compute_match(self, compute_key):
+        '''
+        Key of a stored result with the same analysis, or None.
+        '''
+        if compute_key is None:
+            return None
+        path = self.compute_index_path(compute_key)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            key = f.read().strip()
+        if not self.has(key):
+            return None
+        return key
+
+    def entry_location(self, key):
+        return os.path.join(self.location, key[:2], key)
+
+    def has(self, key):
+        return (key is not None and
+                os.path.exists(os.path.join(self.entry_location(key),
+                                            manifest_filename)))
+
+    def has_permutations(self, key):
+        '''
+        True if the stored result for key has closest permutations.
+        '''
+        data = privateer_xml.read_program_xml(
+            os.path.join(self.entry_location(key), 'program.xml'))
+        return any(glycan.permutations for glycan in data.glycans)
+
+    def store(self, key, job_location, compute_key=None):
+        '''
+        Copy the outputs of a finished run in job_location into the cache,
+        recording it as the latest result for compute_key.  Returns False
+        if there is no program.xml to store.
+        '''
+        if key is None:
+            return False
+        if self.has(key):
+            if compute_key is not None:
+                self.record_compute_key(compute_key, key)
+            return False
+        if not os.path.exists(os.path.join(job_location, 'program.xml')):
+            return False
+        names = output_files(job_location)
+        entry = self.entry_location(key)
+        make_directory(os.path.dirname(entry))
+        temp_entry = tempfile.mkdtemp(dir=os.path.dirname(entry))
+        try:
+            for name in names:
+                target = os.path.join(temp_entry, name)
+                make_directory(os.path.dirname(target))
+                shutil.copy2(os.path.join(job_location, name), target)
+            with open(os.path.join(temp_entry, manifest_filename), 'w') as f:
+                json.dump(names, f, indent=1)
+            os.rename(temp_entry, entry)
+        except OSError:
+            # Another job stored the same key first
+            shutil.rmtree(temp_entry, ignore_errors=True)
+            if not self.has(key):
+                raise
+        if compute_key is not None:
+            self.record_compute_key(compute_key, key)
+        self.evict(keep=key)
+        return True
+
+    def record_compute_key(self, compute_key, key):
+        path = self.compute_index_path(compute_key)
+        make_directory(os.path.dirname(path))
+        temp_path = path + '.tmp.{0}'.format(os.getpid())
+        with open(temp_path, 'w') as f:
+            f.write(key)
+        os.rename(temp_path, path)
+
+    def materialise(self, key, job_location):
+        '''
+        Copy the stored outputs for key into job_location, so later writes
+        there never reach the cache.  Returns the file names.
+        '''
+        entry = self.entry_location(key)
+        manifest = os.path.join(entry, manifest_filename)
+        with open(manifest) as f:
+            names = json.load(f)
+        for name in names:
+            source = os.path.join(entry, name)
+            target = os.path.join(job_location, name)
+            make_directory(os.path.dirname(target))
+            if os.path.lexists(target):
+                os.remove(target)
+            shutil.copy2(source, target)
+        # The manifest's mtime is the entry's last use, for eviction
+        os.utime(manifest, None)
+        return names
+
+    def entries(self):
+        '''
+        (last use, size in bytes, key) of every stored result.
+        '''
+        entries = []
+        if not os.path.isdir(self.location):
+            return entries
+        for prefix in os.listdir(self.location):
+            prefix_location = os.path.join(self.location, prefix)
+            if len(prefix) != 2 or not os.path.isdir(prefix_location):
+                continue
+            for key in os.listdir(prefix_location):
+                if len(key) != 40:
+                    # Entries being stored or evicted
+                    continue
+                entry = os.path.join(prefix_location, key)
+                try:
+                    last_use = os.path.getmtime(
+                        os.path.join(entry, manifest_filename))
+                    size = 0
+                    for directory, _dirs, names in os.walk(entry):
+                        for name in names:
+                            size += os.path.getsize(
+                                os.path.join(directory, name))
+                except OSError:
+                    # Being stored or removed by another job
+                    continue
+                entries.append((last_use, size, key))
+        return entries
+
+    def evict(self, keep=None):
+        '''
+        Remove the least recently used results until the cache is within
+        max_bytes, never removing keep.  Returns the keys removed.
+        '''
+        entries = sorted(self.entries())
+        total = sum(size for _last_use, size, _key in entries)
+        removed = []
+        for _last_use, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            entry = self.entry_location(key)
+            # Hide the entry first so has() is never true for a partial one
+            temp_entry = entry + '.evict.{0}'.format(os.getpid())
+            try:
+                os.rename(entry, temp_entry)
+            except OSError:
+                continue
+            shutil.rmtree(temp_entry, ignore_errors=True)
+            total -= size
+            removed.append(key)
+        return removed
+
+
+def output_files(job_location):
+    '''
+    Names, relative to job_location, of the outputs of a Privateer run:
+    the result files and every SVG program.xml refers to.
+    '''
+    names = [name for name in result_files
+             if os.path.exists(os.path.join(job_location, name))]
+    data = privateer_xml.read_program_xml(
+        os.path.join(job_location, 'program.xml'))
+    svg_names = set()
+    for glycan in data.glycans:
+        svg_names.add(glycan.svg)
+        for permutation in glycan.permutations or []:
+            svg_names.add(permutation.svg)
+    svg_names.discard(None)
+    for name in sorted(svg_names):
+        if os.path.isfile(os.path.join(job_location, name)):
+            names.append(os.path.normpath(name))
+    return names
+
+
+def swap_diagrams(job_location, rerender_location):
+    '''
+    Replace the SVGs in job_location with those of a diagram-only rerun
+    of the same model in rerender_location.  Glycans and permutations are
+    matched by position.  Returns False, leaving job_location untouched,
+    if the two runs do not line up.
+    '''
+    rerender_xml = os.path.join(rerender_location, 'program.xml')
+    if not os.path.exists(rerender_xml):
+        return False
+    old = privateer_xml.read_program_xml(
+        os.path.join(job_location, 'program.xml')).glycans
+    new = privateer_xml.read_program_xml(rerender_xml).glycans
+    if len(old) != len(new):
+        return False
+    pairs = []
+    for old_glycan, new_glycan in zip(old, new):
+        if old_glycan.wurcs != new_glycan.wurcs:
+            return False
+        pairs.append((old_glycan.svg, new_glycan.svg))
+        old_permutations = old_glycan.permutations or []
+        new_permutations = new_glycan.permutations or []
+        if len(old_permutations) != len(new_permutations):
+            return False
+        pairs.extend([(old_permutation.svg, new_permutation.svg)
+                      for old_permutation, new_permutation
+                      in zip(old_permutations, new_permutations)])
+    for old_name, new_name in pairs:
+        if old_name is None or new_name is None:
+            continue
+        source = os.path.join(rerender_location, new_name)
+        if not os.path.isfile(source):
+            continue
+        target = os.path.join(job_location, old_name)
+        if os.path.lexists(target):
+            os.remove(target)
+        shutil.copy2(source, target)
+    return True
+
+
+def materialise_args(key, job_location, location=None):
+    '''
+    Arguments to ccpem-python that materialise key into job_location.
+    '''
+    args = ['-m', 'ccpem_core.tasks.privateer.privateer_result_cache',
+            'materialise', key, job_location]
+    if location is not None:
+        args += ['--cache_location', location]
+    return args
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Privateer result cache')
+    parser.add_argument('action', choices=['materialise'])
+    parser.add_argument('key')
+    parser.add_argument('job_location')
+    parser.add_argument('--cache_location', default=None)
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    cache = ResultCache(args.cache_location)
+    if not cache.has(args.key):
+        print 'No cached Privateer result for {0}'.format(args.key)
+        return 1
+    names = cache.materialise(args.key, args.job_location)
+    print 'Reused cached Privateer result {0} ({1} files)'.format(
+        args.key, len(names))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
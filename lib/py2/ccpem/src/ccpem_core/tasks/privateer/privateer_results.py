@@ -14,7 +14,115 @@ from ccpem_core import process_manager
 from ccpem_core import ccpem_utils
 from ccpem_core.ccpem_utils.ccp4_log_parser import smartie
 from ccpem_core.data_model import metadata_utils
+from ccpem_core.tasks.privateer import privateer_lookup
+from ccpem_core.tasks.privateer import privateer_model
+from ccpem_core.tasks.privateer import privateer_report_cache
+from ccpem_core.tasks.privateer import privateer_svg
+from ccpem_core.tasks.privateer import privateer_xml
 import pyrvapi_ext as API
+import threading
+import json
+from xml.sax.saxutils import escape, quoteattr
+
+html_doctype = ('<!DOCTYPE html PUBLIC "-//W3C//DTD HTML 4.0 Transitional//EN" '
+                '"http://www.w3.org/TR/REC-html40/loose.dtd">')
+
+# (header, tooltip) pairs for the validation tables, after the '#' column
+pyranose_table_headers = [
+    ('Chain', 'Protein backbone chain ID monosaccharide is a part of'),
+    ('Name', 'Monosaccharide\'s PDB CCD code'),
+    ('Q', 'Total puckering amplitude, measured in Angstroems'),
+    ('Phi', 'Phi of monosaccharide'),
+    ('Theta', 'Theta of monosaccharide'),
+    ('Anomer', 'Anomer of monosaccharide'),
+    ('D/L<sup>2</sup>', 'Whenever N is displayed in the D/L column, it means that Privateer has been unable to determine the handedness based solely on the structure.'),
+    ('Conformation', 'Conformation of the sugar.'),
+    ('RSCC', 'Real Space Correlation Coefficient.'),
+    ('BFactor', 'BFactor of monosaccharide.'),
+    ('Diagnosic', 'Geometric quality of the monosaccharide.')]
+
+furanose_table_headers = [header for header in pyranose_table_headers
+                          if header[0] != 'Theta']
+
+batch_table_headers = [
+    ('Entry', 'Batch entry name'),
+    ('Status', 'Whether Privateer produced results for the entry'),
+    ('Pyranoses', 'Number of pyranoses validated'),
+    ('Furanoses', 'Number of furanoses validated'),
+    ('Glycans', 'Number of glycan trees detected'),
+    ('Issues', 'Number of sugars with a diagnostic other than Ok'),
+    ('Directory', 'Entry job directory, relative to this job')]
+
+# Chains with more glycans than this are split over several index entries
+glycans_per_panel = 25
+
+# Flush rvapi after every report step rather than once per report, to see
+# how far a failing report gets
+debug_flush = bool(os.environ.get('CCPEM_PRIVATEER_DEBUG_FLUSH'))
+
+
+def validation_table_html(table_id, title, headers, rows,
+                          number_tooltip='nth sugar detected in the model',
+                          start=0):
+    '''
+    Render a numbered validation table as one HTML string using the jsrview
+    table classes, so rvapi receives it in a single call rather than one
+    call per cell.  Rows are numbered from start + 1, and title may be
+    None for a table continuing an earlier one.
+    '''
+    html_lines = []
+    if title is not None:
+        html_lines.append('<p><b>{0}</b></p>'.format(escape(title)))
+    html_lines += ['<table class="table-blue" id={0}>'.format(quoteattr(table_id)),
+                   '<tr>',
+                   '<th class="table-blue-hh" title={0}>#</th>'.format(quoteattr(number_tooltip))]
+    for header, tooltip in headers:
+        html_lines.append('<th class="table-blue-hh" title={0}>{1}</th>'.format(
+            quoteattr(tooltip), header))
+    html_lines.append('</tr>')
+    for i, values in enumerate(rows):
+        html_lines.append(
+            '<tr><td class="table-blue-td">{0}</td>{1}</tr>'.format(
+                start + i + 1,
+                ''.join(['<td class="table-blue-td">{0}</td>'.format(escape(value))
+                         for value in values])))
+    html_lines.append('</table>')
+    return '\n'.join(html_lines)
+
+
+class ReportBatch(object):
+    '''
+    Tabs, sections, tables, graphs and text added to one rvapi document,
+    written out with a single flush when the batch closes.  Each flush
+    rewrites the task files, which is slow on network filesystems.  With
+    flush_each_step every step is also flushed as it is added.
+    '''
+    def __init__(self, flush_each_step=False):
+        self.flush_each_step = flush_each_step
+
+    def step(self):
+        if self.flush_each_step:
+            API.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Through pyrvapi_ext so pending graph data goes out too
+        API.flush()
+        return False
+
+
+def write_text_file(path, text):
+    '''
+    Write text to path in one step, so readers never see part of it.
+    '''
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8')
+    temp_path = '{0}.tmp.{1}'.format(path, os.getpid())
+    with open(temp_path, 'wb') as f:
+        f.write(text)
+    os.rename(temp_path, path)
 
 
 class PrivateerResultsViewer(object):
@@ -24,37 +132,120 @@ class PrivateerResultsViewer(object):
     '''
     def __init__(self,
                  job_location=None,
-                 xmlfilename=None):
+                 xmlfilename=None,
+                 write_glycan_view=True,
+                 flush_each_step=None,
+                 render=True):
 
         self.job_location = job_location
         self.xmlfilename = xmlfilename
+        self.write_glycan_view = write_glycan_view
         # setup doc
-        ccp4 = os.environ['CCPEM']
-        share_jsrview = os.path.join(ccp4, 'share', 'jsrview')
         self.directory = os.path.join(self.job_location, 'report')
         self.index = os.path.join(self.directory, 'index.html')
-        if os.path.exists(self.directory):
-            shutil.rmtree(self.directory)
+        self.glycanViewHTML = os.path.join(self.directory, 'glycanview.html')
         ccpem_utils.check_directory_and_make(self.directory)
-
-        # setup pages
-        pyrvapi.rvapi_init_document(self.job_location, self.directory, self.job_location,
-                                    1, 4,
-                                    share_jsrview, None, 'index.html', None, None)
-
-        pyrvapi.rvapi_flush()
-
+        self.report_cache = privateer_report_cache.ReportCache(self.directory)
+        self.artefact_keys = {}
+        self.svg_assets = privateer_svg.SVGAssetCache()
+        self.glycan_view_writer = None
+        if flush_each_step is None:
+            flush_each_step = debug_flush
+        self.batch = ReportBatch(flush_each_step)
 
         # get xml file from Buccaneer/Nautilus
         infile = 'program.xml'
         self.xmlfilename = os.path.join(self.job_location, infile)
+        validation_data = privateer_xml.read_program_xml(self.xmlfilename,
+                                                         section_hashes=True)
+        # IDs from a later database lookup take precedence over program.xml
+        self.glycan_ids = privateer_lookup.read_glycan_ids(
+            self.job_location, validation_data.section_hashes.get('Glycan'))
+        if self.glycan_ids is not None:
+            privateer_lookup.apply_glycan_ids(validation_data.glycans,
+                                              self.glycan_ids)
+
+        # Nothing to do if the report was built from identical outputs
+        self.artefact_keys = self.get_artefact_keys(validation_data)
+        self.validation_data = validation_data
+        if not render:
+            # Caller runs the report steps itself, as the benchmarks do
+            return
+        if (os.path.exists(self.index) and
+                (os.path.exists(self.glycanViewHTML) or
+                 not self.write_glycan_view) and
+                self.report_cache.is_current(self.artefact_keys)):
+            return
 
-        # set results table and graphs
+        # setup pages
+        self.init_document()
+
+        # set results table and graphs, written out together
         results_tab = 'results_tab'
-        if self.job_location is not None:
-            privateer_data = self.GetXML2Table('Privateer', results_tab, self.xmlfilename)
-            self.validation_summary_graph(privateer_data, results_tab)
-            self.display_glycan_chains(results_tab, self.xmlfilename)
+        with self.batch:
+            self.batch.step()
+            if self.job_location is not None:
+                self.GetXML2Table('Privateer', results_tab, validation_data)
+                self.validation_summary_graph(validation_data, results_tab)
+                self.display_glycan_chains(results_tab, validation_data)
+        self.wait_for_glycan_view()
+        self.report_cache.save()
+
+    def init_document(self):
+        ccp4 = os.environ['CCPEM']
+        share_jsrview = os.path.join(ccp4, 'share', 'jsrview')
+        pyrvapi.rvapi_init_document(self.job_location, self.directory, self.job_location,
+                                    1, 4,
+                                    share_jsrview, None, 'index.html', None, None)
+
+    def get_artefact_keys(self, validation_data):
+        '''
+        Cache key for each stored report artefact, from the program.xml
+        section and SVG files it is built from.  The graphs are always
+        redrawn, so have no key; the Pyranose section they come from is
+        already part of the validation table's
+        '''
+        section_hashes = validation_data.section_hashes
+        keys = {}
+        if len(validation_data.pyranoses):
+            keys['validation_table'] = privateer_report_cache.hash_strings(
+                'validation_table', section_hashes.get('Pyranose'))
+        if len(validation_data.furanoses):
+            keys['furanose_table'] = privateer_report_cache.hash_strings(
+                'furanose_table', section_hashes.get('Furanose'))
+        svg_names = set()
+        for glycan in validation_data.glycans:
+            svg_names.add(glycan.svg)
+            for permutation in glycan.permutations or []:
+                svg_names.add(permutation.svg)
+        svg_names.discard(None)
+        svg_keys = []
+        for svg_name in sorted(svg_names):
+            svg_key = privateer_report_cache.hash_strings(
+                svg_name,
+                self.svg_assets.digest(
+                    os.path.join(self.job_location, svg_name)))
+            svg_keys.append(svg_key)
+        glycan_ids = None
+        if self.glycan_ids is not None:
+            glycan_ids = json.dumps(self.glycan_ids, sort_keys=True)
+        keys['glycan_view'] = privateer_report_cache.hash_strings(
+            'glycan_view', section_hashes.get('Glycan'), glycan_ids, *svg_keys)
+        return keys
+
+    def cached_artefact(self, name, build):
+        '''
+        Reuse the stored artefact name if its key is unchanged, otherwise
+        call build() and store the result
+        '''
+        key = self.artefact_keys.get(name)
+        if key is None:
+            return build()
+        content = self.report_cache.get(name, key)
+        if content is None:
+            content = build()
+            self.report_cache.put(name, key, content)
+        return content
 
             
     def get_reference(self, process):
@@ -65,147 +256,48 @@ class PrivateerResultsViewer(object):
         reference_list = ["\'Privateer: software for the conformational validation of carbohydrate structures.\' \nAgirre J, Iglesias-Fernandez J, Rovira C, Davies GJ, Wilson KS, Cowtan KD. (2014). \nNat Struct Mol Biol. 2015 Nov 4;22(11):833-4. doi: 10.1038/nsmb.3115."]
         return reference_list
     
-    def GetXML2Table(self, process, results_tab, xmlfilename):
+    def GetXML2Table(self, process, results_tab, validation_data):
         '''
-        Get data from XML output and fill table
+        Fill tables from the records read from program.xml
         '''
 
-        data = collections.OrderedDict()
         tab_name = 'Sugar view'
-        tree = etree.parse(xmlfilename)  # self.xmlfilename)
-        PrivateerResult = tree.find('PrivateerResult')
-        ValidationData = PrivateerResult.find('ValidationData')
-        pyranoses = ValidationData.findall("Pyranose")
-        furanoses = ValidationData.findall("Furanse")
-        if len(pyranoses):
-            list_of_pyranoses = []
-            for pyranose in pyranoses:
-                i_pyranose_dict = collections.OrderedDict()
-                i_pyranose_dict['Chain'] = pyranose.find('SugarChain')
-                i_pyranose_dict['Name'] = pyranose.find('SugarName')
-                i_pyranose_dict['Q'] = pyranose.find('SugarQ')
-                i_pyranose_dict['Phi'] = pyranose.find('SugarPhi')
-                i_pyranose_dict['Theta'] = pyranose.find('SugarTheta')
-                i_pyranose_dict['Anomer'] = pyranose.find('SugarAnomer')
-                i_pyranose_dict['Hand'] = pyranose.find('SugarHand')
-                i_pyranose_dict['Conformation'] = pyranose.find('SugarConformation')
-                i_pyranose_dict['RSCC'] = pyranose.find('SugarRSCC')
-                i_pyranose_dict['BFactor'] = pyranose.find('SugarBFactor')
-                i_pyranose_dict['Diagnostic'] = pyranose.find('SugarDiagnostic')
-                list_of_pyranoses.append(i_pyranose_dict)
-            data['Pyranoses'] = list_of_pyranoses
-        if len(furanoses):
-            list_of_furanoses = []
-            for furanose in furanoses:
-                i_furanose_dict = collections.OrderedDict()
-                i_furanose_dict['Chain'] = furanose.find('SugarChain')
-                i_furanose_dict['Name'] = furanose.find('SugarName')
-                i_furanose_dict['Q'] = furanose.find('SugarQ')
-                i_furanose_dict['Phi'] = furanose.find('SugarPhi')
-                i_furanose_dict['Anomer'] = furanose.find('SugarAnomer')
-                i_furanose_dict['Hand'] = furanose.find('SugarHand')
-                i_furanose_dict['Conformation'] = furanose.find('SugarConformation')
-                i_furanose_dict['RSCC'] = furanose.find('SugarRSCC')
-                i_furanose_dict['BFactor'] = furanose.find('SugarBFactor')
-                i_furanose_dict['Diagnostic'] = furanose.find('SugarDiagnostic')
-                list_of_furanoses.append(i_furanose_dict)
-            data['Furanoses'] = list_of_furanoses
 
         validation_sec = 'validation_sec'
         validation_table = 'validation_table'
+        furanose_table = 'furanose_table'
         pyrvapi.rvapi_add_tab(results_tab, tab_name, True)
         pyrvapi.rvapi_add_section(
             validation_sec, 'Detailed Monosaccharide validation results', results_tab, 0, 0, 1, 1, False)
-        pyrvapi.rvapi_flush()
-        if "Pyranoses" in data:
-            # set tabs and sections
-            pyrvapi.rvapi_add_table(
-                validation_table, 'Detailed validation data for Pyranoses', validation_sec, 1, 0, 1, 1, False)
-            pyrvapi.rvapi_put_horz_theader(
-                validation_table, '#', 'nth sugar detected in the model', 0)
-            pyrvapi.rvapi_put_horz_theader(
-                validation_table, 'Chain', 'Protein backbone chain ID monosaccharide is a part of', 1)
-            pyrvapi.rvapi_put_horz_theader(validation_table, 'Name',
-                                        'Monosaccharide\'s PDB CCD code', 2)
-            pyrvapi.rvapi_put_horz_theader(validation_table, 'Q',
-                                        'Total puckering amplitude, measured in Angstroems', 3)
-            pyrvapi.rvapi_put_horz_theader(validation_table, 'Phi',
-                                        'Phi of monosaccharide', 4)
-            pyrvapi.rvapi_put_horz_theader(validation_table, 'Theta',
-                                        'Theta of monosaccharide', 5)
-            pyrvapi.rvapi_put_horz_theader(validation_table, 'Anomer',
-                                        'Anomer of monosaccharide', 6)
-            pyrvapi.rvapi_put_horz_theader(validation_table, 'D/L<sup>2</sup>',
-                                        'Whenever N is displayed in the D/L column, it means that Privateer has been unable to determine the handedness based solely on the structure.', 7)
-            pyrvapi.rvapi_put_horz_theader(validation_table, 'Conformation',
-                                        'Conformation of the sugar.', 8)
-            pyrvapi.rvapi_put_horz_theader(validation_table, 'RSCC',
-                                        'Real Space Correlation Coefficient.', 9)
-            pyrvapi.rvapi_put_horz_theader(validation_table, 'BFactor',
-                                        'BFactor of monosaccharide.', 10)
-            pyrvapi.rvapi_put_horz_theader(validation_table, 'Diagnosic',
-                                        'Geometric quality of the monosaccharide.', 11)
-
-            i = 0  # row
-            for entries in data['Pyranoses']:
-                j = 0  # column
-                for name in entries:
-                    if j == 0:
-                        pyrvapi.rvapi_put_table_string(
-                            validation_table, str(i + 1), i, j)  # fill in cycle number
-                        j += 1  
-                        pyrvapi.rvapi_put_table_string(
-                            validation_table, entries[name].text, i, j)  # fill in built values
-                    else:
-                        pyrvapi.rvapi_put_table_string(
-                            validation_table, entries[name].text, i, j)  # fill in built values
-                    j += 1
-                i += 1
-            pyrvapi.rvapi_flush()  
-        if "Furanoses" in data:
-            pyrvapi.rvapi_add_table(
-                validation_table, 'Detailed validation data for Furanoses', validation_sec, 1, 0, 1, 1, False)
-            pyrvapi.rvapi_put_horz_theader(
-                validation_table, '#', 'nth sugar detected in the model', 0)
-            pyrvapi.rvapi_put_horz_theader(
-                validation_table, 'Chain', 'Protein backbone chain ID monosaccharide is a part of', 1)
-            pyrvapi.rvapi_put_horz_theader(validation_table, 'Name',
-                                        'Monosaccharide\'s PDB CCD code', 2)
-            pyrvapi.rvapi_put_horz_theader(validation_table, 'Q',
-                                        'Total puckering amplitude, measured in Angstroems', 3)
-            pyrvapi.rvapi_put_horz_theader(validation_table, 'Phi',
-                                        'Phi of monosaccharide', 4)
-            pyrvapi.rvapi_put_horz_theader(validation_table, 'Anomer',
-                                        'Anomer of monosaccharide', 5)
-            pyrvapi.rvapi_put_horz_theader(validation_table, 'D/L<sup>2</sup>',
-                                        'Whenever N is displayed in the D/L column, it means that Privateer has been unable to determine the handedness based solely on the structure.', 6)
-            pyrvapi.rvapi_put_horz_theader(validation_table, 'Conformation',
-                                        'Conformation of the sugar.', 7)
-            pyrvapi.rvapi_put_horz_theader(validation_table, 'RSCC',
-                                        'Real Space Correlation Coefficient.', 8)
-            pyrvapi.rvapi_put_horz_theader(validation_table, 'BFactor',
-                                        'BFactor of monosaccharide.', 9)
-            pyrvapi.rvapi_put_horz_theader(validation_table, 'Diagnosic',
-                                        'Geometric quality of the monosaccharide.', 10)
-            
-            i = 0  # row
-            for entries in data['Furanoses']:
-                j = 0  # column
-                for name in entries:
-                    if j == 0:
-                        pyrvapi.rvapi_put_table_string(
-                            validation_table, str(i + 1), i, j)  # fill in cycle number
-                        j += 1  
-                        pyrvapi.rvapi_put_table_string(
-                            validation_table, entries[name].text, i, j)  # fill in built values
-                    else:
-                        pyrvapi.rvapi_put_table_string(
-                            validation_table, entries[name].text, i, j)  # fill in built values
-                    j += 1
-                i += 1
-            pyrvapi.rvapi_flush() 
-
-        return data
+        self.batch.step()
+        if len(validation_data.pyranoses):
+            self.put_validation_table(
+                validation_table, 'Detailed validation data for Pyranoses',
+                validation_sec, 1, pyranose_table_headers,
+                validation_data.pyranoses)
+            self.batch.step()
+        if len(validation_data.furanoses):
+            self.put_validation_table(
+                furanose_table, 'Detailed validation data for Furanoses',
+                validation_sec, 2, furanose_table_headers,
+                validation_data.furanoses)
+            self.batch.step()
+        if not (len(validation_data.pyranoses) or len(validation_data.furanoses)):
+            pyrvapi.rvapi_add_text(
+                'No sugars were detected in the input model.',
+                validation_sec, 1, 0, 1, 1)
+            self.batch.step()
+
+    def put_validation_table(self, table_id, title, section, row, headers, sugars):
+        '''
+        Add a whole validation table to section with a single rvapi call
+        '''
+        table_html = self.cached_artefact(
+            table_id,
+            lambda: validation_table_html(
+                table_id, title, headers,
+                [sugar.table_row() for sugar in sugars]))
+        pyrvapi.rvapi_add_text(table_html, section, row, 0, 1, 1)
 
     def validation_summary_graph(self,
                                 validationdata=None,
@@ -215,19 +307,8 @@ class PrivateerResultsViewer(object):
         Make <B-Factor> vs Real Space CC 
         '''
         # make graph widget
-        if "Pyranoses" in validationdata:
-            pyranoses = validationdata["Pyranoses"]
-
-            low_energy_pyranoses   = []
-            high_energy_pyranoses  = []
-            other_issues_pyranoses = []
-
-            for pyranose in pyranoses:
-                if "conformation" in pyranose["Diagnostic"].text.lower() :
-                    high_energy_pyranoses.append ( pyranose )
-                elif "Ok" in pyranose["Diagnostic"].text:
-                    low_energy_pyranoses.append ( pyranose )
-                else : other_issues_pyranoses.append ( pyranose )
+        if len(validationdata.pyranoses):
+            pyranoses = privateer_model.SugarTable(validationdata.pyranoses)
 
             graphWid1 = API.loggraph(results_tab)
             brdata = API.graph_data(graphWid1, 'Summary of detected pyranoses')
@@ -238,22 +319,15 @@ class PrivateerResultsViewer(object):
             dx_other_Alpha = API.graph_dataset(brdata, 'Phi', 'Phi', isint=False)
             dy_other_Alpha = API.graph_dataset(brdata, 'Other Issues', 'y3', isint=False)
 
-            ycol_Alpha = 'Theta'
-            xcol_Alpha = 'Phi'
+            ycol_Alpha = 'theta'
+            xcol_Alpha = 'phi'
             yaxlabel_Alpha = 'Theta'
-            xmax_ok_Alpha = len(low_energy_pyranoses)
-            xmax_conformation_Alpha = len(high_energy_pyranoses)
-            xmax_other_Alpha = len(other_issues_pyranoses)
-            for i in range(0, xmax_ok_Alpha):
-                dx_ok_Alpha.add_datum(float(low_energy_pyranoses[i][xcol_Alpha].text))
-                dy_ok_Alpha.add_datum(float(low_energy_pyranoses[i][ycol_Alpha].text))
-            for i in range(0, xmax_conformation_Alpha):
-                dx_conformation_Alpha.add_datum(float(high_energy_pyranoses[i][xcol_Alpha].text))
-                dy_conformation_Alpha.add_datum(float(high_energy_pyranoses[i][ycol_Alpha].text))
-            for i in range(0, xmax_other_Alpha):
-                dx_other_Alpha.add_datum(float(other_issues_pyranoses[i][xcol_Alpha].text))
-                dy_other_Alpha.add_datum(float(other_issues_pyranoses[i][ycol_Alpha].text))
-            plotAlpha = API.graph_plot(graphWid1, "Conformational landscape for pyranoses", xcol_Alpha, yaxlabel_Alpha)
+            xaxlabel_Alpha = 'Phi'
+            self.add_category_series(pyranoses, xcol_Alpha, ycol_Alpha,
+                                     [(dx_ok_Alpha, dy_ok_Alpha),
+                                      (dx_conformation_Alpha, dy_conformation_Alpha),
+                                      (dx_other_Alpha, dy_other_Alpha)])
+            plotAlpha = API.graph_plot(graphWid1, "Conformational landscape for pyranoses", xaxlabel_Alpha, yaxlabel_Alpha)
             plotAlpha.reset_xticks()
             plotAlpha.reset_yticks()
             for i in range(360, -1, -30):
@@ -276,31 +350,22 @@ class PrivateerResultsViewer(object):
             dx_other_Bravo = API.graph_dataset(brdata, 'BFactor', 'BFactor', isint=False)
             dy_other_Bravo = API.graph_dataset(brdata, 'Other Issues', 'y3', isint=False)
 
-            ycol_Bravo = 'RSCC'
-            xcol_Bravo = 'BFactor'
+            ycol_Bravo = 'rscc'
+            xcol_Bravo = 'bfactor'
             yaxlabel_Bravo = 'Real Space CC'
             xaxlabel_Bravo = 'Isotropic B-Factor'
-            xmax_ok_Bravo = len(low_energy_pyranoses)
-            xmax_conformation_Bravo = len(high_energy_pyranoses)
-            xmax_other_Bravo = len(other_issues_pyranoses)
-            xvalues = []
-            for i in range(0, xmax_ok_Bravo):
-                dx_ok_Bravo.add_datum(float(low_energy_pyranoses[i][xcol_Bravo].text))
-                dy_ok_Bravo.add_datum(float(low_energy_pyranoses[i][ycol_Bravo].text))
-                xvalues.append(float(low_energy_pyranoses[i][xcol_Bravo].text))
-            for i in range(0, xmax_conformation_Bravo):
-                dx_conformation_Bravo.add_datum(float(high_energy_pyranoses[i][xcol_Bravo].text))
-                dy_conformation_Bravo.add_datum(float(high_energy_pyranoses[i][ycol_Bravo].text))
-                xvalues.append(float(high_energy_pyranoses[i][xcol_Bravo].text))
-            for i in range(0, xmax_other_Bravo):
-                dx_other_Bravo.add_datum(float(other_issues_pyranoses[i][xcol_Bravo].text))
-                dy_other_Bravo.add_datum(float(other_issues_pyranoses[i][ycol_Bravo].text))
-                xvalues.append(float(other_issues_pyranoses[i][xcol_Bravo].text))
+            self.add_category_series(pyranoses, xcol_Bravo, ycol_Bravo,
+                                     [(dx_ok_Bravo, dy_ok_Bravo),
+                                      (dx_conformation_Bravo, dy_conformation_Bravo),
+                                      (dx_other_Bravo, dy_other_Bravo)])
+            xmax_Bravo = np.nanmax(pyranoses.column(xcol_Bravo))
+            if np.isnan(xmax_Bravo):
+                xmax_Bravo = 0.0
             plotBravo = API.graph_plot(graphWid1, "BFactor vs RSCC", xaxlabel_Bravo, yaxlabel_Bravo)
             plotBravo.reset_xticks()
             plotBravo.reset_yticks()
             yticks = [0.0, 0.5, 0.7, 1.0]
-            for i in range(0, int(max(xvalues)) + 20, 20):
+            for i in range(0, int(xmax_Bravo) + 20, 20):
                 plotBravo.add_xtick(i, '%d' % (i))
             for i in yticks:
                 plotBravo.add_ytick(i, '%.1f' % (i))
@@ -311,58 +376,61 @@ class PrivateerResultsViewer(object):
             dx_y_OTHER_Bravo = API.plot_line(plotBravo, brdata, dx_other_Bravo, dy_other_Bravo)
             dx_y_OTHER_Bravo.set_options(color='orange', marker='o', style=API.LINE_Off, width=2.5)
             plotBravo.set_legend('s', 'outsideGrid')
-            API.flush()
+            self.batch.step()
 
-    def display_glycan_chains(self, results_tab, xmlfilename):
-        tree = etree.parse(xmlfilename)  # self.xmlfilename)
-        PrivateerResult = tree.find('PrivateerResult')
-        ValidationData = PrivateerResult.find('ValidationData')
-        glycans = ValidationData.findall("Glycan")
-        list_of_glycans = []
-        if len(glycans):
-            list_of_glycans = []
-            for glycan in glycans:
-                i_glycan_dict = collections.OrderedDict()
-                i_glycan_dict['Chain'] = glycan.find('GlycanChain')
-                i_glycan_dict['WURCS'] = glycan.find('GlycanWURCS')
-                i_glycan_dict['GTCID'] = glycan.find('GlycanGTCID')
-                i_glycan_dict['GlyConnectID'] = glycan.find('GlycanGlyConnectID')
-                i_glycan_dict['SVG'] = glycan.find('GlycanSVG')
-                permutationList = glycan.find('GlycanPermutations')
-                if permutationList is not None:
-                    permutations = permutationList.findall('GlycanPermutation')
-                    list_of_permutations = []
-                    for permutation in permutations:
-                        i_permutation_dict = collections.OrderedDict()
-                        i_permutation_dict['PermutationWURCS'] = permutation.find('PermutationWURCS')
-                        i_permutation_dict['PermutationScore'] = permutation.find('PermutationScore')
-                        i_permutation_dict['anomerPermutations'] = permutation.find('anomerPermutations')
-                        i_permutation_dict['residuePermutations'] = permutation.find('residuePermutations')
-                        i_permutation_dict['residuePermutations'] = permutation.find('residuePermutations')
-                        i_permutation_dict['residueDeletions'] = permutation.find('residueDeletions')
-                        i_permutation_dict['PermutationGTCID'] = permutation.find('PermutationGTCID')
-                        i_permutation_dict['PermutationGlyConnectID'] = permutation.find('PermutationGlyConnectID')
-                        i_permutation_dict['PermutationSVG'] = permutation.find('PermutationSVG')
-                        list_of_permutations.append(i_permutation_dict)
-                    i_glycan_dict['Permutations'] = list_of_permutations
-                else:
-                    i_glycan_dict['Permutations'] = None
-                list_of_glycans.append(i_glycan_dict)
-        
+    def add_category_series(self, table, xcol, ycol, datasets):
+        '''
+        Fill (x, y) graph datasets for the ok, conformation and other
+        issue categories from the columns of a SugarTable
+        '''
+        categories = [privateer_model.SUGAR_OK,
+                      privateer_model.SUGAR_CONFORMATION,
+                      privateer_model.SUGAR_OTHER]
+        for category, (dx, dy) in zip(categories, datasets):
+            for x, y in zip(table.series(category, xcol).tolist(),
+                            table.series(category, ycol).tolist()):
+                dx.add_datum(x)
+                dy.add_datum(y)
+
+    def display_glycan_chains(self, results_tab, validation_data):
         tab_name = 'Glycan view'
         glycan_tab = 'glycan_tab'
         chain_sec = 'chain_sec'
 
-        self.glycanViewHTMLoutput = self.generate_HTML_glycan_view(list_of_glycans)
+        self.glycanViewHTMLoutput = self.cached_artefact(
+            'glycan_view',
+            lambda: self.generate_HTML_glycan_view(validation_data.glycans))
+        if self.write_glycan_view:
+            # On-disk copy for viewing outside rvapi, cached or not, written
+            # while rvapi takes the page
+            self.glycan_view_writer = threading.Thread(
+                target=write_text_file,
+                args=(self.glycanViewHTML, self.glycanViewHTMLoutput))
+            self.glycan_view_writer.start()
 
         pyrvapi.rvapi_add_tab(glycan_tab, tab_name, False)
         pyrvapi.rvapi_add_section(
             chain_sec, 'Detected Glycan chains in the input model', glycan_tab, 0, 0, 1, 1, False)
         pyrvapi.rvapi_add_text(self.glycanViewHTMLoutput,
                                     chain_sec, 1, 0, 1, 1)
-        pyrvapi.rvapi_flush()
+        self.batch.step()
     
+    def wait_for_glycan_view(self):
+        '''
+        Wait for glycanview.html to be written, so it is in place before
+        the report is marked current.
+        '''
+        if self.glycan_view_writer is not None:
+            self.glycan_view_writer.join()
+            self.glycan_view_writer = None
+
     def generate_HTML_glycan_view(self, list_of_glycans):
+        '''
+        Glycan view as a lightweight per-chain index.  Each chain's glycan
+        diagrams and permutation details are kept in inert templates and
+        only turned into DOM, together with the SVG symbols they draw, when
+        the chain's section is first expanded.
+        '''
         html = etree.Element('html')
         head = etree.Element('head')
         
@@ -371,194 +439,420 @@ class PrivateerResultsViewer(object):
         
         script = etree.Element('script')
 
-        script.text = "\nvar acc = document.getElementsByClassName(\"accordion\");\nvar i;\n\nfor (i = 0; i < acc.length; i++) {\n\t  acc[i].addEventListener(\"click\", function() {\n\t\tthis.classList.toggle(\"active\");\n\t\tvar panel = this.nextElementSibling;\n\t\tif (panel.style.maxHeight) {\n\t\t\tpanel.style.maxHeight = null;\n\t\t} else {\n\t\t\tpanel.style.maxHeight = panel.scrollHeight + \"px\";\n\t\t}\n\t});\n}" 
+        # Delegated handler so accordions inside lazily loaded panels work too
+        script.text = "\nvar loadedSymbols = {};\n\nfunction glycanTemplate(id) {\n\tvar source = document.getElementById(id);\n\tif (!source) {\n\t\treturn \"\";\n\t}\n\treturn source.text.replace(/<\\\\\\/(script)/gi, \"<\\/$1\");\n}\n\nfunction loadGlycanPanel(panel) {\n\tvar src = panel.getAttribute(\"data-src\");\n\tif (!src) {\n\t\treturn;\n\t}\n\tpanel.removeAttribute(\"data-src\");\n\tvar symbols = (panel.getAttribute(\"data-symbols\") || \"\").split(\" \");\n\tvar defs = \"\";\n\tfor (var i = 0; i < symbols.length; i++) {\n\t\tif (symbols[i] && !loadedSymbols[symbols[i]]) {\n\t\t\tloadedSymbols[symbols[i]] = true;\n\t\t\tdefs += glycanTemplate(symbols[i] + \"-src\");\n\t\t}\n\t}\n\tif (defs) {\n\t\tvar holder = document.createElement(\"div\");\n\t\tholder.innerHTML = \"<svg style=\\\"display:none\\\"><defs>\" + defs + \"</defs></svg>\";\n\t\tdocument.getElementById(\"glycan-symbols\").appendChild(holder);\n\t}\n\tpanel.innerHTML = glycanTemplate(src);\n}\n\ndocument.addEventListener(\"click\", function(event) {\n\tvar button = event.target;\n\twhile (button && !(button.classList && button.classList.contains(\"accordion\"))) {\n\t\tbutton = button.parentNode;\n\t}\n\tif (!button) {\n\t\treturn;\n\t}\n\tbutton.classList.toggle(\"active\");\n\tvar panel = button.nextElementSibling;\n\tif (panel.style.maxHeight) {\n\t\tpanel.style.maxHeight = null;\n\t} else {\n\t\tloadGlycanPanel(panel);\n\t\tpanel.style.maxHeight = panel.scrollHeight + \"px\";\n\t\tvar parent = panel.parentNode;\n\t\twhile (parent && parent.classList) {\n\t\t\tif (parent.classList.contains(\"panel\")) {\n\t\t\t\tparent.style.maxHeight = \"none\";\n\t\t\t}\n\t\t\tparent = parent.parentNode;\n\t\t}\n\t}\n});"
         
         head.append(style)
         html.append(head)
         
         body = etree.Element('body')
-        etree.tostring(script, method='html')
         html.append(body)
 
         divGlobal = etree.Element('div', attrib={'class': 'global'})
         explanationParagraph = etree.Element('p')
         explanationParagraph.text = "Below are graphical plots of the detected glycan trees. Placing your mouse pointer over any of the sugars will display a tooltip containing its residue name and number from the PDB file."
+        if not list_of_glycans:
+            explanationParagraph.text = "No glycan trees were detected in the input model."
         divGlobal.append(explanationParagraph)
-        
+        # Symbols are added here as the panels that use them are opened
+        divGlobal.append(etree.Element('div', attrib={'id': 'glycan-symbols'}))
+
+        glycans_by_chain = collections.OrderedDict()
         for glycan in list_of_glycans:
-            chainParagraph = etree.Element('p', attrib={'style': 'font-size:110%; padding:2px; margin-top:20px; margin-bottom:0px; font-weight:bold; margin-left:15px; clear:both'})
-            modelledGlycanChainID = glycan['Chain'].text
-            chainParagraph.text = "Chain " + modelledGlycanChainID
-            divGlobal.append(chainParagraph)
-            modelledGlycanSVGName = glycan['SVG'].text
-            modelledGlycanSVGPath = os.path.join(self.job_location, modelledGlycanSVGName)
-            if os.path.isfile(modelledGlycanSVGPath):
-                svg_file = open(modelledGlycanSVGPath, 'r')
-                svg_string = svg_file.read()
-                svg_file.close()
-
-                svg_string_partitioned = svg_string.partition("width=\"")
-                svg_width = ''
-                for symbol in svg_string_partitioned[2]:
-                    if symbol != "\"":
-                        svg_width = svg_width + symbol
-                    else:
-                        break
-                
-                ElementTreeSVGsource = etree.parse(modelledGlycanSVGPath)
-                ElementSVGsource = ElementTreeSVGsource.getroot()
-                
-                divBetweenPandSVG = etree.Element('div', attrib={'style': 'border-width:1px; padding-top:10px; padding-bottom:10px; border-color:black; border-style:solid; border-radius:15px;'})
-                divGlobal.append(divBetweenPandSVG)
-                
-                divSVG = etree.Element('div', attrib={'style': 'padding:10px;'})
-                divSVG.append(ElementSVGsource)
+            glycans_by_chain.setdefault(glycan.chain, []).append(glycan)
+
+        templates = []
+        used_svg_assets = collections.OrderedDict()
+        for chain, chain_glycans in glycans_by_chain.items():
+            pages = range(0, len(chain_glycans), glycans_per_panel)
+            for start in pages:
+                page_glycans = chain_glycans[start:start + glycans_per_panel]
+                panel_svg_assets = collections.OrderedDict()
+                blocks = []
+                for glycan in page_glycans:
+                    block = self.glycan_view_block(glycan, panel_svg_assets)
+                    if block is not None:
+                        blocks.append(block)
+                if not blocks:
+                    continue
+                used_svg_assets.update(panel_svg_assets)
+
+                button = etree.Element('button', attrib={'class': 'accordion'})
+                button.text = "Chain " + chain
+                if len(pages) > 1:
+                    button.text += " (glycans {0}-{1} of {2})".format(
+                        start + 1, start + len(page_glycans), len(chain_glycans))
+                else:
+                    button.text += " ({0} glycan{1})".format(
+                        len(blocks), '' if len(blocks) == 1 else 's')
+                divGlobal.append(button)
+
+                panel_id = 'glycan-panel-{0}'.format(len(templates))
+                sectionDiv = etree.Element('div', attrib={
+                    'class': 'panel',
+                    'data-src': panel_id,
+                    'data-symbols': ' '.join(
+                        [asset.symbol_id for asset in panel_svg_assets.values()])})
+                divGlobal.append(sectionDiv)
+                templates.append(glycan_view_template(panel_id, blocks))
+
+        # Each distinct diagram is defined once, on demand, and drawn with <use>
+        for asset in used_svg_assets.values():
+            templates.append(glycan_view_template(asset.symbol_id + '-src',
+                                                  [asset.symbol()],
+                                                  'text/x-glycan-svg'))
 
-                WURCSParagraph = etree.Element('p', attrib={'style': 'font-size:110%; font-weight:bold'})
-                WURCSParagraph.text = glycan['WURCS'].text
-                divSVG.append(WURCSParagraph)
+        body.append(divGlobal)
+        for template in templates:
+            body.append(template)
+        body.append(script)
+
+        finalHTMLoutput = etree.tostring(html,
+                        pretty_print=True, method="html", doctype=html_doctype)
+
+        return finalHTMLoutput
+
+    def glycan_view_block(self, glycan, used_svg_assets):
+        '''
+        Diagram, identifiers and closest permutations for one glycan, or
+        None if its SVG is missing.  SVG assets drawn are added to
+        used_svg_assets.
+        '''
+        modelledGlycanSVGName = glycan.svg
+        modelledGlycanSVGPath = os.path.join(self.job_location, modelledGlycanSVGName)
+        modelledGlycanSVG = self.svg_assets.get(modelledGlycanSVGPath)
+        if modelledGlycanSVG is None:
+            return None
+        used_svg_assets[modelledGlycanSVG.digest] = modelledGlycanSVG
+        
+        divBetweenPandSVG = etree.Element('div', attrib={'style': 'border-width:1px; padding-top:10px; padding-bottom:10px; border-color:black; border-style:solid; border-radius:15px;'})
+        
+        divSVG = etree.Element('div', attrib={'style': 'padding:10px;'})
+        divSVG.append(modelledGlycanSVG.reference())
+        WURCSParagraph = etree.Element('p', attrib={'style': 'font-size:110%; font-weight:bold'})
+        WURCSParagraph.text = glycan.wurcs
+        divSVG.append(WURCSParagraph)
+
+        if glycan.gtc_id != "Unable to find GlyTouCan ID":
+            GTCIDParagraph = etree.Element('p', attrib={'style': 'font-size:110%; font-weight:bold'})
+            GTCIDParagraph.text = 'GlyTouCan ID: ' + glycan.gtc_id
+            divSVG.append(GTCIDParagraph)
+        else:
+            GTCIDParagraph = etree.Element('p', attrib={'style': 'font-size:110%; font-weight:bold; color:#ff3300'})
+            GTCIDParagraph.text = 'GlyTouCan ID: Not Found'
+            divSVG.append(GTCIDParagraph)
+
+        if glycan.glyconnect_id != "Unable to find GlyConnect ID":
+            GlyConnectIDParagraph = etree.Element('p', attrib={'style': 'font-size:110%; font-weight:bold'})
+            GlyConnectIDParagraph.text = 'GlyConnect ID: ' + glycan.glyconnect_id
+            divSVG.append(GlyConnectIDParagraph)
+        else:
+            GlyConnectIDParagraph = etree.Element('p', attrib={'style': 'font-size:110%; font-weight:bold; color:#ff3300'})
+            GlyConnectIDParagraph.text = 'GlyConnect ID: Not Found'
+            divSVG.append(GlyConnectIDParagraph)
+            if glycan.permutations is not None:
+                button = etree.Element('button', attrib={'class': 'accordion'})
+                button.text = 'Closest permutations detected on GlyConnect database'
+                divSVG.append(button)
+                sectionDiv = etree.Element('div', attrib={'class': 'panel'})
+                sectionDivStyle = etree.Element('div', attrib={'style': 'border-width: 1px; padding-top: 10px; padding-bottom:10px; border-color:black; border-style:solid; border-radius:15px;'})
+                permutationList = glycan.permutations
+
+                for permutation in permutationList:
+                    permutationDivBorder = etree.Element('div', attrib={'style': 'border-width: 1px; padding-top: 10px; padding-bottom:10px; border-color:grey; border-style:dashed; border-radius:20px;'})
+                    permutationGlycanSVGName = permutation.svg
+                    permutationGlycanSVGPath = os.path.join(self.job_location, permutationGlycanSVGName)
+                    permutationGlycanSVG = self.svg_assets.get(permutationGlycanSVGPath)
+                    if permutationGlycanSVG is not None:
+                        used_svg_assets[permutationGlycanSVG.digest] = permutationGlycanSVG
+                        permutationDivBorder.append(permutationGlycanSVG.reference())
 
-                if glycan['GTCID'].text != "Unable to find GlyTouCan ID":
-                    GTCIDParagraph = etree.Element('p', attrib={'style': 'font-size:110%; font-weight:bold'})
-                    GTCIDParagraph.text = 'GlyTouCan ID: ' + glycan['GTCID'].text
-                    divSVG.append(GTCIDParagraph)
-                else:
-                    GTCIDParagraph = etree.Element('p', attrib={'style': 'font-size:110%; font-weight:bold; color:#ff3300'})
-                    GTCIDParagraph.text = 'GlyTouCan ID: Not Found'
-                    divSVG.append(GTCIDParagraph)
-
-                if glycan['GlyConnectID'].text != "Unable to find GlyConnect ID":
-                    GlyConnectIDParagraph = etree.Element('p', attrib={'style': 'font-size:110%; font-weight:bold'})
-                    GlyConnectIDParagraph.text = 'GlyConnect ID: ' + glycan['GlyConnectID'].text
-                    divSVG.append(GlyConnectIDParagraph)
-                else:
-                    GlyConnectIDParagraph = etree.Element('p', attrib={'style': 'font-size:110%; font-weight:bold; color:#ff3300'})
-                    GlyConnectIDParagraph.text = 'GlyConnect ID: Not Found'
-                    divSVG.append(GlyConnectIDParagraph)
-                    if glycan['Permutations'] is not None:
-                        button = etree.Element('button', attrib={'class': 'accordion'})
-                        button.text = 'Closest permutations detected on GlyConnect database'
-                        divSVG.append(button)
-                        sectionDiv = etree.Element('div', attrib={'class': 'panel'})
-                        sectionDivStyle = etree.Element('div', attrib={'style': 'border-width: 1px; padding-top: 10px; padding-bottom:10px; border-color:black; border-style:solid; border-radius:15px;'})
-                        permutationList = glycan['Permutations']
-
-                        for permutation in permutationList:
-                            permutationDivBorder = etree.Element('div', attrib={'style': 'border-width: 1px; padding-top: 10px; padding-bottom:10px; border-color:grey; border-style:dashed; border-radius:20px;'})
-                            permutationGlycanSVGName = permutation['PermutationSVG'].text
-                            permutationGlycanSVGPath = os.path.join(self.job_location, permutationGlycanSVGName)
-                            if os.path.isfile(permutationGlycanSVGPath):
-                                svg_file_permutation = open(permutationGlycanSVGPath, 'r')
-                                svg_string = svg_file_permutation.read()
-                                svg_file_permutation.close()
-
-                                svg_string_partitioned_permutation = svg_string.partition("width=\"")
-                                svg_width_permutation = ''
-                                for symbol in svg_string_partitioned[2]:
-                                    if symbol != "\"":
-                                        svg_width_permutation = svg_width_permutation + symbol
-                                    else:
-                                        break
-                                
-                                permutationElementTreeSVGsource = etree.parse(permutationGlycanSVGPath)
-                                permutationElementSVGsource = permutationElementTreeSVGsource.getroot()
-                                permutationDivBorder.append(permutationElementSVGsource)
-
-                                
-                                WURCSParagraphPermutation = etree.Element('p', attrib={'style': 'font-size:110%; font-weight:bold'})
-                                WURCSParagraphPermutation.text = permutation['PermutationWURCS'].text
-                                permutationDivBorder.append(WURCSParagraphPermutation)
-
-                                permutation['PermutationScore'].text
-                                PermutationScore = etree.Element('p', attrib={'style': 'font-size:110%;'})
-                                PermutationScore.text = 'Permutation Score(out of 100): '
-                                if float(permutation['PermutationScore'].text) <= 1.00:
-                                    spanText = etree.Element('span', attrib={'style': 'color:#00ff00; font-weight: bold'})
-                                    spanText.text = permutation['PermutationScore'].text
-                                    PermutationScore.append(spanText)
-                                elif float(permutation['PermutationScore'].text) > 1.00 and float(permutation['PermutationScore'].text) <= 10.00:
-                                    spanText = etree.Element('span', attrib={'style': 'color:#ffa500; font-weight: bold'})
-                                    spanText.text = permutation['PermutationScore'].text
-                                    PermutationScore.append(spanText)                                    
-                                elif float(permutation['PermutationScore'].text) > 10.00:
-                                    spanText = etree.Element('span', attrib={'style': 'color:#ff3300; font-weight: bold'})
-                                    spanText.text = permutation['PermutationScore'].text
-                                    PermutationScore.append(spanText)                                     
-
-                                permutationDivBorder.append(PermutationScore)
-
-
-                                anomerPermutations = etree.Element('p', attrib={'style': 'font-size:110%;'})
-                                anomerPermutations.text = 'Anomer Permutations: '
-                                spanTextAnomer = etree.Element('span', attrib={'style': 'font-weight: bold'})
-                                spanTextAnomer.text = permutation['anomerPermutations'].text
-                                anomerPermutations.append(spanTextAnomer)
-                                permutationDivBorder.append(anomerPermutations)
-
-
-                                residuePermutations = etree.Element('p', attrib={'style': 'font-size:110%;'})
-                                residuePermutations.text = 'Residue Permutations: '
-                                spanTextResidue = etree.Element('span', attrib={'style': 'font-weight: bold'})
-                                spanTextResidue.text = permutation['residuePermutations'].text
-                                residuePermutations.append(spanTextResidue)                            
-                                permutationDivBorder.append(residuePermutations)
-
-
-                                residueDeletions = etree.Element('p', attrib={'style': 'font-size:110%;'})
-                                residueDeletions.text = 'Residue Deletions: '
-                                spanTextDeletions = etree.Element('span', attrib={'style': 'font-weight: bold'})
-                                spanTextDeletions.text = permutation['residueDeletions'].text
-                                residueDeletions.append(spanTextDeletions)                                   
-                                permutationDivBorder.append(residueDeletions)
-
-
-                                PermutationGTCIDParagraph = etree.Element('p', attrib={'style': 'font-size:110%;'})
-                                PermutationGTCIDParagraph.text = 'GlyTouCan ID: ' 
-                                spanTextPermutationGTCID = etree.Element('span', attrib={'style': 'font-weight: bold'})
-                                spanTextPermutationGTCID.text = permutation['PermutationGTCID'].text
-                                PermutationGTCIDParagraph.append(spanTextPermutationGTCID)  
-                                permutationDivBorder.append(PermutationGTCIDParagraph)
-
-
-                                PermutationGlyConnectIDParagraph = etree.Element('p', attrib={'style': 'font-size:110%;'})
-                                PermutationGlyConnectIDParagraph.text = 'Glyconnect ID: '
-                                spanTextPermutationGlyConnectID = etree.Element('span', attrib={'style': 'font-weight: bold'})
-                                spanTextPermutationGlyConnectID.text = permutation['PermutationGlyConnectID'].text
-                                PermutationGlyConnectIDParagraph.append(spanTextPermutationGlyConnectID)  
-                                permutationDivBorder.append(PermutationGlyConnectIDParagraph)
-
-                                
-                                divSeperator = etree.Element('div', attrib={'style': 'padding:10px; '})
-                                permutationDivBorder.append(divSeperator)
-                                sectionDivStyle.append(permutationDivBorder)
                         
-                        sectionDiv.append(sectionDivStyle)
-                        divSVG.append(sectionDiv)
-                
-                
-                divBetweenPandSVG.append(divSVG)
-                divCLEAR = etree.Element('div', attrib={'style': 'clear:both'})
-                divBetweenPandSVG.append(divCLEAR)
-                divGlobal.append(divBetweenPandSVG)
+                        WURCSParagraphPermutation = etree.Element('p', attrib={'style': 'font-size:110%; font-weight:bold'})
+                        WURCSParagraphPermutation.text = permutation.wurcs
+                        permutationDivBorder.append(WURCSParagraphPermutation)
+
+                        PermutationScore = etree.Element('p', attrib={'style': 'font-size:110%;'})
+                        PermutationScore.text = 'Permutation Score(out of 100): '
+                        if permutation.score <= 1.00:
+                            spanText = etree.Element('span', attrib={'style': 'color:#00ff00; font-weight: bold'})
+                            spanText.text = permutation.score_text
+                            PermutationScore.append(spanText)
+                        elif permutation.score > 1.00 and permutation.score <= 10.00:
+                            spanText = etree.Element('span', attrib={'style': 'color:#ffa500; font-weight: bold'})
+                            spanText.text = permutation.score_text
+                            PermutationScore.append(spanText)                                    
+                        elif permutation.score > 10.00:
+                            spanText = etree.Element('span', attrib={'style': 'color:#ff3300; font-weight: bold'})
+                            spanText.text = permutation.score_text
+                            PermutationScore.append(spanText)                                     
+
+                        permutationDivBorder.append(PermutationScore)
+
+
+                        anomerPermutations = etree.Element('p', attrib={'style': 'font-size:110%;'})
+                        anomerPermutations.text = 'Anomer Permutations: '
+                        spanTextAnomer = etree.Element('span', attrib={'style': 'font-weight: bold'})
+                        spanTextAnomer.text = permutation.anomer_permutations
+                        anomerPermutations.append(spanTextAnomer)
+                        permutationDivBorder.append(anomerPermutations)
+
+
+                        residuePermutations = etree.Element('p', attrib={'style': 'font-size:110%;'})
+                        residuePermutations.text = 'Residue Permutations: '
+                        spanTextResidue = etree.Element('span', attrib={'style': 'font-weight: bold'})
+                        spanTextResidue.text = permutation.residue_permutations
+                        residuePermutations.append(spanTextResidue)                            
+                        permutationDivBorder.append(residuePermutations)
+
+
+                        residueDeletions = etree.Element('p', attrib={'style': 'font-size:110%;'})
+                        residueDeletions.text = 'Residue Deletions: '
+                        spanTextDeletions = etree.Element('span', attrib={'style': 'font-weight: bold'})
+                        spanTextDeletions.text = permutation.residue_deletions
+                        residueDeletions.append(spanTextDeletions)                                   
+                        permutationDivBorder.append(residueDeletions)
+
+
+                        PermutationGTCIDParagraph = etree.Element('p', attrib={'style': 'font-size:110%;'})
+                        PermutationGTCIDParagraph.text = 'GlyTouCan ID: ' 
+                        spanTextPermutationGTCID = etree.Element('span', attrib={'style': 'font-weight: bold'})
+                        spanTextPermutationGTCID.text = permutation.gtc_id
+                        PermutationGTCIDParagraph.append(spanTextPermutationGTCID)  
+                        permutationDivBorder.append(PermutationGTCIDParagraph)
+
+
+                        PermutationGlyConnectIDParagraph = etree.Element('p', attrib={'style': 'font-size:110%;'})
+                        PermutationGlyConnectIDParagraph.text = 'Glyconnect ID: '
+                        spanTextPermutationGlyConnectID = etree.Element('span', attrib={'style': 'font-weight: bold'})
+                        spanTextPermutationGlyConnectID.text = permutation.glyconnect_id
+                        PermutationGlyConnectIDParagraph.append(spanTextPermutationGlyConnectID)  
+                        permutationDivBorder.append(PermutationGlyConnectIDParagraph)
+
+                        
+                        divSeperator = etree.Element('div', attrib={'style': 'padding:10px; '})
+                        permutationDivBorder.append(divSeperator)
+                        sectionDivStyle.append(permutationDivBorder)
                 
-                # modelledGlycanWURCS = glycan['WURCS'].text
-                # modelledGlycanGTCID = glycan['GTCID'].text
-                # modelledGlycanGlyConnectID = glycan['GlyConnectID'].text
-            
+                sectionDiv.append(sectionDivStyle)
+                divSVG.append(sectionDiv)
         
-        body.append(divGlobal)
-        body.append(script)
+        divBetweenPandSVG.append(divSVG)
+        divCLEAR = etree.Element('div', attrib={'style': 'clear:both'})
+        divBetweenPandSVG.append(divCLEAR)
+        return divBetweenPandSVG
 
-        self.glycanViewHTML = os.path.join(self.directory, 'glycanview.html')
-        
-        etree.ElementTree(html).write(self.glycanViewHTML, pretty_print=True, encoding='unicode', method='html')
-        parser = etree.HTMLParser()
-        glycanViewHACK = etree.parse(self.glycanViewHTML, parser)
 
-        finalHTMLoutput = etree.tostring(glycanViewHACK,
-                        pretty_print=True, method="html")
+def glycan_view_template(template_id, elements, template_type='text/x-glycan-panel'):
+    '''
+    Inert <script> holding the HTML of elements, for the glycan view to
+    parse when it is needed.
+    '''
+    markup = ''.join([etree.tostring(element, method="html")
+                      for element in elements])
+    template = etree.Element('script', attrib={'type': template_type,
+                                               'id': template_id})
+    # Script content is raw text, so a closing tag must not end it early
+    template.text = re.sub(r'</(script)', r'<\\/\1', markup, flags=re.IGNORECASE)
+    return template
 
-        return finalHTMLoutput
+
+class PrivateerLiveReport(PrivateerResultsViewer):
+    '''
+    Report filled in while Privateer runs.  Each update adds the sugars and
+    glycans written to program.xml since the last one, as further table
+    chunks and glycan blocks, so the first results show long before the
+    run ends.  PrivateerResultsViewer replaces it when the job finishes.
+    '''
+    results_tab = 'results_tab'
+    glycan_tab = 'glycan_tab'
+    status_sec = 'status_sec'
+    chain_sec = 'chain_sec'
+
+    def __init__(self, job_location):
+        self.job_location = job_location
+        self.write_glycan_view = False
+        ccp4 = os.environ['CCPEM']
+        share_jsrview = os.path.join(ccp4, 'share', 'jsrview')
+        self.directory = os.path.join(self.job_location, 'report')
+        self.index = os.path.join(self.directory, 'index.html')
+        ccpem_utils.check_directory_and_make(self.directory)
+        # The finished report must not be mistaken for a current one
+        privateer_report_cache.ReportCache(self.directory).clear()
+        self.svg_assets = privateer_svg.SVGAssetCache()
+        self.follower = privateer_xml.ProgramXMLFollower(
+            os.path.join(self.job_location, 'program.xml'))
+        self.sugar_counts = {'Pyranose': 0, 'Furanose': 0}
+        self.pending_glycans = []
+        self.defined_symbols = set()
+        self.next_rows = {}
+
+        pyrvapi.rvapi_init_document(self.job_location, self.directory, self.job_location,
+                                    1, 4,
+                                    share_jsrview, None, 'index.html', None, None)
+        pyrvapi.rvapi_add_tab(self.results_tab, 'Sugar view', True)
+        pyrvapi.rvapi_add_section(
+            self.status_sec, 'Privateer is running', self.results_tab, 0, 0, 1, 1, True)
+        self.add_text('Validated sugars and glycans are added as Privateer '
+                      'writes them.  The full report replaces this one when '
+                      'the job finishes.', self.status_sec)
+        pyrvapi.rvapi_add_tab(self.glycan_tab, 'Glycan view', False)
+        pyrvapi.rvapi_add_section(
+            self.chain_sec, 'Detected Glycan chains in the input model', self.glycan_tab, 0, 0, 1, 1, True)
+        pyrvapi.rvapi_flush()
+
+    def add_text(self, text, section):
+        '''
+        Add text to the next free row of section
+        '''
+        row = self.next_rows.get(section, 0)
+        pyrvapi.rvapi_add_text(text, section, row, 0, 1, 1)
+        self.next_rows[section] = row + 1
+
+    def update(self):
+        '''
+        Add the records written since the last update.  Returns True if
+        the report changed.
+        '''
+        data = self.follower.poll()
+        changed = False
+        for tag, row, headers, sugars in (
+                ('Pyranose', 1, pyranose_table_headers, data.pyranoses),
+                ('Furanose', 2, furanose_table_headers, data.furanoses)):
+            if sugars:
+                self.add_sugar_rows(tag, row, headers, sugars)
+                changed = True
+        self.pending_glycans.extend(data.glycans)
+        if self.pending_glycans and self.add_glycans():
+            changed = True
+        if changed:
+            pyrvapi.rvapi_flush()
+        return changed
+
+    def add_sugar_rows(self, tag, row, headers, sugars):
+        '''
+        Continue the validation table for tag with sugars
+        '''
+        section = tag.lower() + '_sec'
+        start = self.sugar_counts[tag]
+        if not start:
+            pyrvapi.rvapi_add_section(
+                section, 'Detailed validation data for {0}s'.format(tag),
+                self.results_tab, row, 0, 1, 1, True)
+        self.add_text(
+            validation_table_html(
+                '{0}_table_{1}'.format(tag.lower(), start), None, headers,
+                [sugar.table_row() for sugar in sugars], start=start),
+            section)
+        self.sugar_counts[tag] += len(sugars)
+
+    def add_glycans(self):
+        '''
+        Add the pending glycans whose diagrams have been written, with the
+        symbols they draw that are not defined yet.  Returns True if any
+        were added.
+        '''
+        blocks = []
+        pending = []
+        used_svg_assets = collections.OrderedDict()
+        for glycan in self.pending_glycans:
+            try:
+                block = self.glycan_view_block(glycan, used_svg_assets)
+            except etree.XMLSyntaxError:
+                block = None
+            if block is None:
+                pending.append(glycan)
+            else:
+                blocks.append(block)
+        self.pending_glycans = pending
+        if not blocks:
+            return False
+        new_assets = [asset for digest, asset in used_svg_assets.items()
+                      if digest not in self.defined_symbols]
+        self.defined_symbols.update(used_svg_assets)
+        markup = [etree.tostring(block, method="html") for block in blocks]
+        if new_assets:
+            markup.insert(0, etree.tostring(
+                privateer_svg.symbol_definitions(new_assets), method="html"))
+        self.add_text(''.join(markup), self.chain_sec)
+        return True
+
+
+class PrivateerBatchResultsViewer(object):
+    '''
+    Summary report for a Privateer batch, one row per entry
+    '''
+    def __init__(self,
+                 job_location,
+                 batch_results):
+        self.job_location = job_location
+        ccp4 = os.environ['CCPEM']
+        share_jsrview = os.path.join(ccp4, 'share', 'jsrview')
+        self.directory = os.path.join(self.job_location, 'report')
+        ccpem_utils.check_directory_and_make(self.directory)
+
+        pyrvapi.rvapi_init_document(self.job_location, self.directory, self.job_location,
+                                    1, 4,
+                                    share_jsrview, None, 'index.html', None, None)
+        batch_tab = 'batch_tab'
+        batch_sec = 'batch_sec'
+        pyrvapi.rvapi_add_tab(batch_tab, 'Batch summary', True)
+        pyrvapi.rvapi_add_section(
+            batch_sec, 'Validated models', batch_tab, 0, 0, 1, 1, True)
+        rows = []
+        for result in batch_results:
+            rows.append([result['name'],
+                         result['status'],
+                         str(result.get('pyranoses', '')),
+                         str(result.get('furanoses', '')),
+                         str(result.get('glycans', '')),
+                         str(result.get('issues', '')),
+                         os.path.relpath(result['job_location'], self.job_location)])
+        pyrvapi.rvapi_add_text(
+            validation_table_html('batch_table',
+                                  'Per-model results, detailed reports are in each entry\'s report directory',
+                                  batch_table_headers, rows,
+                                  number_tooltip='nth model in the batch'),
+            batch_sec, 0, 0, 1, 1)
+        pyrvapi.rvapi_flush()
+
+
+# rvapi keeps one document per process, so reports are built one at a time
+report_lock = threading.Lock()
+
+
+def build_report(job_location):
+    '''
+    Build or bring up to date the report of job_location and return the
+    path of its index.  Safe to call from a worker thread.
+    '''
+    with report_lock:
+        return PrivateerResultsViewer(job_location=job_location).index
+
+
+def build_batch_report(job_location, batch_results):
+    '''
+    As build_report, for the summary report of a batch.
+    '''
+    with report_lock:
+        PrivateerBatchResultsViewer(job_location=job_location,
+                                    batch_results=batch_results)
+        return os.path.join(job_location, 'report', 'index.html')
+
+
+def refresh_glycan_ids(job_location, expression_system=None,
+                       database_path=None):
+    '''
+    Re-resolve the job's GlyTouCan and GlyConnect IDs for
+    expression_system, an expression_system_mode value, against the local
+    database index and bring the report up to date, without re-running
+    Privateer.  Returns the path of the report's index, as build_report.
+    '''
+    validation_data = privateer_xml.read_program_xml(
+        os.path.join(job_location, 'program.xml'), section_hashes=True)
+    privateer_lookup.update_glycan_ids(job_location, validation_data,
+                                       expression_system, database_path)
+    return build_report(job_location)
 
 
 def main(target_dir=None):
@@ -570,8 +864,6 @@ def main(target_dir=None):
         pl_dir = target_dir
     job_location = pl_dir
     rvapi_dir = pl_dir + '/report'
-    if os.path.exists(rvapi_dir):
-        shutil.rmtree(rvapi_dir)
 
     # set up viewer
     app = QtGui.QApplication(sys.argv)
@@ -581,8 +873,29 @@ def main(target_dir=None):
     ccpem_utils.check_directory_and_make(rvapi_dir)
     os.chdir(pl_dir)
     if os.path.exists(job_location):
-        rv = PrivateerResultsViewer(job_location=job_location)
-        web_window.load(QtCore.QUrl(rv.index))
+        # Build on a worker so the window stays responsive meanwhile
+        web_window.setHtml('<p>Building report...</p>')
+        result = {}
+
+        def build():
+            result['index'] = build_report(job_location)
+
+        builder = threading.Thread(target=build)
+        builder.daemon = True
+        builder.start()
+
+        def check_built():
+            if builder.is_alive():
+                return
+            timer.stop()
+            if 'index' in result:
+                web_window.load(QtCore.QUrl(result['index']))
+            else:
+                web_window.setHtml('<p>Unable to build report, see the console.</p>')
+
+        timer = QtCore.QTimer()
+        timer.timeout.connect(check_built)
+        timer.start(200)
         app.exec_()
 
 
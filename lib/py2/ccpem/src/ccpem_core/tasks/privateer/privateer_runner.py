@@ -0,0 +1,191 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+'''
+Launcher that runs Privateer within this host's core budget.
+
+    ccpem-python -m ccpem_core.tasks.privateer.privateer_runner \\
+        --budget_location <directory> --cores <n> -- privateer <args>
+
+Waits for cores from privateer_scheduler.CoreBudget, runs the command with
+-cores set to the granted number and releases the cores when it exits.
+With --progress_location the command's output is passed through a
+privateer_progress.ProgressTracker as it is printed, and with
+--live_report the results written there so far are added to a
+privateer_results.PrivateerLiveReport while the command runs.
+'''
+
+import sys
+import time
+import signal
+import argparse
+import threading
+import subprocess
+from ccpem_core import ccpem_utils
+from ccpem_core.tasks.privateer import privateer_progress
+from ccpem_core.tasks.privateer import privateer_scheduler
+from ccpem_core.tasks.privateer import privateer_structure
+
+# Seconds between checks of the running command's outputs
+poll_interval = 1.0
+
+
+def runner_args(budget_location, cores, progress_location=None,
+                live_report=False):
+    '''
+    Arguments to ccpem-python that run a command through this launcher.
+    '''
+    args = ['-m', 'ccpem_core.tasks.privateer.privateer_runner',
+            '--budget_location', budget_location]
+    if cores is not None:
+        args += ['--cores', str(cores)]
+    if progress_location is not None:
+        args += ['--progress_location', progress_location]
+        if live_report:
+            args.append('--live_report')
+    return args + ['--']
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Run Privateer within the host core budget')
+    parser.add_argument('--budget_location', required=True)
+    parser.add_argument('--cores', type=int, default=None)
+    parser.add_argument('--progress_location', default=None)
+    parser.add_argument('--live_report', action='store_true',
+                        help='Build the report in progress_location as results appear')
+    parser.add_argument('command', nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+    if args.command and args.command[0] == '--':
+        args.command = args.command[1:]
+    if not args.command:
+        parser.error('No command to run')
+    return args
+
+
+def total_sugars(command):
+    '''
+    Sugar residues in the model Privateer is given, or None.
+    '''
+    try:
+        model = command[command.index('-pdbin') + 1]
+        extra_codes = []
+        if '-valstring' in command:
+            extra_codes.append(command[command.index('-valstring') + 1])
+        return sum(privateer_structure.count_sugar_residues(
+            model, extra_codes).values())
+    except (ValueError, IndexError, IOError, OSError):
+        return None
+
+
+def pass_output(stream, tracker):
+    '''
+    Copy stream to stdout line by line, counting progress markers.
+    '''
+    for line in iter(stream.readline, b''):
+        sys.stdout.write(line)
+        sys.stdout.flush()
+        tracker.feed(line)
+    stream.close()
+
+
+def start_live_report(job_location):
+    try:
+        # Report modules need rvapi, only load them when asked
+        from ccpem_core.tasks.privateer import privateer_results
+        return privateer_results.PrivateerLiveReport(job_location)
+    except Exception as e:
+        ccpem_utils.print_warning(
+            message='Live report unavailable: {0}'.format(e))
+        return None
+
+
+def update_live_report(report):
+    '''
+    Add new results to report.  Returns report, or None once it has
+    failed, as it must never stop the run.
+    '''
+    try:
+        report.update()
+        return report
+    except Exception as e:
+        ccpem_utils.print_warning(
+            message='Live report stopped: {0}'.format(e))
+        return None
+
+
+def run_tracked(command, progress_location, live_report=False):
+    '''
+    Run command, writing its progress to progress_location while it runs
+    and, with live_report, the results so far to its report.
+    '''
+    tracker = privateer_progress.ProgressTracker(progress_location,
+                                                 total_sugars(command))
+    tracker.write(force=True)
+    report = None
+    if live_report:
+        report = start_live_report(progress_location)
+    process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT)
+    # Output is read on its own thread so the outputs are still scanned
+    # while Privateer is quiet or buffering
+    reader = threading.Thread(target=pass_output,
+                              args=(process.stdout, tracker))
+    reader.daemon = True
+    reader.start()
+    try:
+        while process.poll() is None:
+            time.sleep(poll_interval)
+            tracker.scan_outputs()
+            tracker.write()
+            if report is not None:
+                report = update_live_report(report)
+        reader.join()
+    finally:
+        if process.poll() is None:
+            process.terminate()
+            process.wait()
+        tracker.scan_outputs()
+        tracker.write(status='finished' if process.returncode == 0
+                      else 'failed', force=True)
+    return process.returncode
+
+
+def terminate(signum, frame):
+    # Unwind through the finally blocks so the child stops and cores free
+    raise SystemExit(128 + signum)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    budget = privateer_scheduler.CoreBudget(args.budget_location)
+    requested = args.cores or budget.total_cores
+    signal.signal(signal.SIGTERM, terminate)
+    process = None
+    try:
+        granted = budget.acquire(requested)
+        if granted != requested:
+            ccpem_utils.print_warning(
+                message='Privateer given {0} of {1} requested cores'.format(
+                    granted, requested))
+        sys.stdout.flush()
+        command = args.command + ['-cores', str(granted)]
+        if args.progress_location is not None:
+            return run_tracked(command, args.progress_location,
+                               args.live_report)
+        process = subprocess.Popen(command)
+        return process.wait()
+    finally:
+        if process is not None and process.poll() is None:
+            process.terminate()
+            process.wait()
+        budget.release()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+'''
+Machine-wide core budget shared by concurrent Privateer processes.
+
+Running and queued processes are recorded in a small JSON state file in
+the per-user CCP-EM directory, one per host, guarded by an exclusive lock
+on a sibling lock file, so the jobs of every project on a machine share
+it.  A process asks for the cores it was configured with and is given
+at most what is free, leaving a share for anything queued behind it;
+with no cores free it waits in FIFO order instead of oversubscribing.
+Entries of processes that died without releasing are pruned.
+'''
+
+import os
+import json
+import time
+import errno
+import socket
+import multiprocessing
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+budget_prefix = '.privateer_cores'
+
+
+def default_budget_location():
+    return os.path.join(os.path.expanduser('~'), '.ccpem', 'privateer')
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+class CoreBudget(object):
+    '''
+    Cores in use by Privateer on this host, shared through budget_location.
+    '''
+    def __init__(self, budget_location=None, total_cores=None,
+                 poll_interval=2.0):
+        if budget_location is None:
+            budget_location = default_budget_location()
+        try:
+            os.makedirs(budget_location)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        if total_cores is None:
+            total_cores = multiprocessing.cpu_count()
+        self.total_cores = max(1, total_cores)
+        self.poll_interval = poll_interval
+        # Per host, so a home directory on a shared filesystem is not one
+        # budget
+        name = '{0}.{1}'.format(budget_prefix, socket.gethostname())
+        self.state_path = os.path.join(budget_location, name + '.json')
+        self.lock_path = os.path.join(budget_location, name + '.lock')
+        self.pid = os.getpid()
+
+    def _locked(self, update):
+        '''
+        Run update(state) under the budget lock and save the state.
+        '''
+        with open(self.lock_path, 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                state = {'running': {}, 'queue': []}
+                if os.path.exists(self.state_path):
+                    try:
+                        with open(self.state_path) as f:
+                            state = json.load(f)
+                    except ValueError:
+                        pass
+                state['running'] = dict(
+                    (pid, cores) for pid, cores in state['running'].items()
+                    if process_alive(int(pid)))
+                state['queue'] = [pid for pid in state['queue']
+                                  if process_alive(pid)]
+                result = update(state)
+                temp_path = self.state_path + '.tmp'
+                with open(temp_path, 'w') as f:
+                    json.dump(state, f)
+                os.rename(temp_path, self.state_path)
+                return result
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def try_acquire(self, requested):
+        '''
+        Cores granted now for a request of requested cores, or 0 if this
+        process has to keep waiting.  Joins the queue on first call.
+        '''
+        requested = max(1, min(requested, self.total_cores))
+
+        def update(state):
+            if self.pid not in state['queue']:
+                state['queue'].append(self.pid)
+            if state['queue'][0] != self.pid:
+                return 0
+            free = self.total_cores - sum(state['running'].values())
+            if free < 1:
+                return 0
+            # Leave a share for processes already queued behind this one
+            waiting = len(state['queue'])
+            granted = min(requested, free,
+                          max(1, self.total_cores // waiting))
+            state['queue'].pop(0)
+            state['running'][str(self.pid)] = granted
+            return granted
+        return self._locked(update)
+
+    def acquire(self, requested, timeout=None):
+        '''
+        Wait until cores are available and return how many were granted,
+        or 0 on timeout.
+        '''
+        start = time.time()
+        while True:
+            granted = self.try_acquire(requested)
+            if granted:
+                return granted
+            if timeout is not None and time.time() - start > timeout:
+                self.release()
+                return 0
+            time.sleep(self.poll_interval)
+
+    def release(self):
+        '''
+        Give back this process's cores and leave the queue.
+        '''
+        def update(state):
+            state['running'].pop(str(self.pid), None)
+            if self.pid in state['queue']:
+                state['queue'].remove(self.pid)
+        self._locked(update)
+
+    def in_use(self):
+        return self._locked(lambda state: sum(state['running'].values()))
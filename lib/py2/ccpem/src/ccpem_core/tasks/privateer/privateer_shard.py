@@ -0,0 +1,244 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+'''
+Per-chain sharding of a model across parallel Privateer runs.
+
+Chains carrying sugars are grouped with the glycans linked to them,
+including glycans modelled as separate chains, and the groups are spread
+over shards by sugar count.  Each shard is written as a sub-model holding
+only its chains, Privateer is run on every shard in its own directory and
+the results are merged with privateer_merge.
+
+    ccpem-python -m ccpem_core.tasks.privateer.privateer_shard \\
+        <model> <job_location> <chains> [<chains> ...]
+'''
+
+import os
+import sys
+import argparse
+import numpy as np
+from ccpem_core.tasks.privateer import privateer_merge
+from ccpem_core.tasks.privateer import privateer_structure
+
+# Protein atoms glycans are attached to, (residue, atom)
+attachment_atoms = frozenset([('ASN', 'ND2'), ('SER', 'OG'), ('THR', 'OG1'),
+                              ('TRP', 'CD1'), ('HYP', 'OD1')])
+
+# Glycan chain to attachment atom distance, Angstrom
+link_distance = 3.0
+
+shard_prefix = 'shard_'
+
+
+def shard_directory(index):
+    return '{0}{1:02d}'.format(shard_prefix, index + 1)
+
+
+def chain_clusters(path, extra_codes=()):
+    '''
+    Chains of path grouped with the sugar-only chains linked to them,
+    as a list of (sugar residue count, [chain, ...]) in model order.
+    Chains without sugars are left out.
+    '''
+    codes = privateer_structure.sugar_codes_with(extra_codes)
+    order = []
+    sugar_residues = {}
+    has_polymer = set()
+    sugar_atoms = {}
+    attachments = []
+    with privateer_structure.open_text(path) as f:
+        for record in privateer_structure.atom_records(path, f):
+            code, residue, atom = record[1], record[2], record[3]
+            chain = residue[0]
+            if chain not in sugar_residues:
+                order.append(chain)
+                sugar_residues[chain] = set()
+            if privateer_structure.is_selected(record, codes):
+                sugar_residues[chain].add((code,) + tuple(residue))
+                sugar_atoms.setdefault(chain, []).append(record[4:])
+            elif code not in privateer_structure.water_codes:
+                has_polymer.add(chain)
+                if (code, atom) in attachment_atoms:
+                    attachments.append((chain, record[4:]))
+
+    clusters = dict((chain, [chain]) for chain in order
+                    if chain in has_polymer and sugar_residues[chain])
+    if attachments:
+        attachment_chains = [chain for chain, _xyz in attachments]
+        attachment_xyz = np.array(
+            [[float(value) for value in xyz] for _chain, xyz in attachments])
+    for chain in order:
+        if chain in has_polymer or not sugar_residues[chain]:
+            continue
+        # Glycan modelled as its own chain, goes with the chain it is on
+        target = chain
+        if attachments:
+            xyz = np.array([[float(value) for value in atom]
+                            for atom in sugar_atoms[chain]])
+            distances = np.sqrt(((xyz[:, None, :] -
+                                  attachment_xyz[None, :, :]) ** 2).sum(axis=2))
+            nearest = np.unravel_index(np.argmin(distances), distances.shape)
+            if distances[nearest] <= link_distance:
+                target = attachment_chains[nearest[1]]
+        if target == chain:
+            clusters[chain] = [chain]
+        elif target in clusters:
+            clusters[target].append(chain)
+        else:
+            # Protein chain whose only glycans are modelled apart
+            clusters[target] = [target, chain]
+
+    result = []
+    for chain in order:
+        if chain in clusters:
+            count = sum(len(sugar_residues[member]) for member in clusters[chain])
+            result.append((count, clusters[chain]))
+    return result
+
+
+def plan_shards(path, shards, extra_codes=()):
+    '''
+    Chain lists of at most shards sub-models, balanced by sugar count.
+    Fewer than two lists means the model is not worth sharding.
+    '''
+    clusters = chain_clusters(path, extra_codes)
+    bins = [[0, []] for _i in range(min(shards, len(clusters)))]
+    for count, chains in sorted(clusters, key=lambda cluster: -cluster[0]):
+        lightest = min(bins, key=lambda shard: shard[0])
+        lightest[0] += count
+        lightest[1].extend(chains)
+    order = [chain for _count, chains in clusters for chain in chains]
+    return [sorted(chains, key=order.index) for _count, chains in bins]
+
+
+def model_extension(path):
+    if privateer_structure.is_mmcif(path):
+        return '.cif'
+    return '.pdb'
+
+
+def shard_model_path(job_location, index, model_path):
+    return os.path.join(job_location, shard_directory(index),
+                        'model' + model_extension(model_path))
+
+
+def write_shards(model_path, job_location, chain_lists):
+    '''
+    Write one sub-model per chain list, keeping every non-coordinate
+    record of the first model.  Returns the sub-model paths.
+    '''
+    shard_of = {}
+    for index, chains in enumerate(chain_lists):
+        for chain in chains:
+            shard_of[chain] = index
+    paths = [shard_model_path(job_location, index, model_path)
+             for index in range(len(chain_lists))]
+    outputs = []
+    try:
+        for path in paths:
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            outputs.append(open(path, 'w'))
+        with privateer_structure.open_text(model_path) as f:
+            if privateer_structure.is_mmcif(model_path):
+                split_mmcif(f, shard_of, outputs)
+            else:
+                split_pdb(f, shard_of, outputs)
+    finally:
+        for output in outputs:
+            output.close()
+    return paths
+
+
+def split_pdb(lines, shard_of, outputs):
+    for line in lines:
+        record = line[:6]
+        if record.startswith(('ATOM', 'HETATM', 'ANISOU', 'TER')):
+            index = shard_of.get(line[21:22])
+            if index is not None:
+                outputs[index].write(line)
+        elif record.startswith('ENDMDL'):
+            # First model only
+            break
+        elif record.startswith(('MODEL', 'CONECT', 'MASTER', 'END')):
+            continue
+        else:
+            for output in outputs:
+                output.write(line)
+    for output in outputs:
+        output.write('END\n')
+
+
+def split_mmcif(lines, shard_of, outputs):
+    columns = []
+    chain_column = None
+    model_column = None
+    in_atom_site = False
+    for line in lines:
+        if line.startswith('_atom_site.'):
+            name = line.split('.', 1)[1].strip()
+            columns.append(name)
+            in_atom_site = True
+        elif in_atom_site and not line.startswith(('#', '_', 'loop_', 'data_')):
+            if chain_column is None:
+                for name in ('auth_asym_id', 'label_asym_id'):
+                    if name in columns:
+                        chain_column = columns.index(name)
+                        break
+                if 'pdbx_PDB_model_num' in columns:
+                    model_column = columns.index('pdbx_PDB_model_num')
+            tokens = privateer_structure.mmcif_token.findall(line)
+            if chain_column is None or len(tokens) < len(columns):
+                continue
+            if (model_column is not None and
+                    tokens[model_column] not in ('1', '?', '.')):
+                continue
+            index = shard_of.get(tokens[chain_column])
+            if index is not None:
+                outputs[index].write(line)
+            continue
+        else:
+            in_atom_site = False
+        for output in outputs:
+            output.write(line)
+
+
+def split_args(model_path, job_location, chain_lists):
+    '''
+    Arguments to ccpem-python that write the sub-models.
+    '''
+    return (['-m', 'ccpem_core.tasks.privateer.privateer_shard',
+             model_path, job_location] +
+            [','.join(chains) for chains in chain_lists])
+
+
+def merge_args(job_location, shard_locations):
+    '''
+    Arguments to ccpem-python that merge the shard outputs.
+    '''
+    return privateer_merge.merge_args(job_location, shard_locations)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Split a model into per-chain shards')
+    parser.add_argument('model')
+    parser.add_argument('job_location')
+    parser.add_argument('chains', nargs='+',
+                        help='Comma separated chain IDs of each shard')
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    chain_lists = [chains.split(',') for chains in args.chains]
+    paths = write_shards(args.model, args.job_location, chain_lists)
+    for path, chains in zip(paths, chain_lists):
+        print 'Chains {0} written to {1}'.format(' '.join(chains), path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,224 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+'''
+Streaming reader for the carbohydrate atoms of a model.
+
+PDB and mmCIF files are read line by line and only the coordinates of
+residues whose Chemical Component Dictionary code is a known sugar are
+kept, so large assemblies are never held in memory.
+
+Models are screened before Privateer is run; for a model without any
+hetero residue other than water, so with no sugar whatever its code, an
+empty program.xml is written instead:
+
+    ccpem-python -m ccpem_core.tasks.privateer.privateer_structure \\
+        <model> <job_location> [--code XYZ]
+'''
+
+import os
+import re
+import sys
+import gzip
+import argparse
+import numpy as np
+from ccpem_core.tasks.privateer import privateer_xml
+
+# CCD codes of monosaccharides Privateer validates
+sugar_codes = frozenset([
+    # Hexoses
+    'GLC', 'BGC', 'GAL', 'GLA', 'MAN', 'BMA', 'ALL', 'AFD', 'GUP', 'GL0',
+    'TAL', 'IDR', 'A2G', 'NGA', 'NAG', 'NDG', 'BM3', 'GCS',
+    'PA1', 'X6X', '1GN', 'GCU', 'BDP', 'GTR', 'ADA', 'IDS', 'MAV',
+    'BEM', 'LGU', 'GC4', 'GCV', 'KDN', 'KDO', 'KDA', 'KDB',
+    # Deoxy sugars
+    'FUC', 'FUL', 'FCA', 'FCB', 'RAM', 'RM4', 'XXR', 'QUI', 'G6D', 'PA6',
+    'DDA', 'RAE', 'TYV', 'ABE', 'PAR',
+    # Pentoses
+    'XYP', 'XYS', 'XYZ', 'LXC', 'HSY', 'ARA', 'ARB', 'AHR', 'FUB', 'BXY',
+    'BXX', 'RIP', 'RIB', 'LDY', 'BDR', 'SOE',
+    # Sialic acids
+    'SIA', 'SLB', 'NGC', 'NGE',
+    # Heptoses and others
+    'GMH', 'MUB', 'MUR', 'AMU', 'NAA', 'MAG', 'FRU', 'BDF', 'SGN', 'SUS'])
+
+# Hetero residues never near a glycan of interest
+water_codes = frozenset(['HOH', 'WAT', 'DOD', 'H2O'])
+
+mmcif_token = re.compile(r"'[^']*'|\"[^\"]*\"|\S+")
+
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path)
+
+
+def is_mmcif(path):
+    name = path.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    return name.endswith('.cif') or name.endswith('.mmcif')
+
+
+def pdb_atom_records(lines):
+    '''
+    (hetero, code, residue, atom, x, y, z) for every atom of the first
+    model, coordinates left as text.
+    '''
+    for line in lines:
+        if line.startswith('ATOM') or line.startswith('HETATM'):
+            yield (line.startswith('HETATM'), line[17:20].strip(),
+                   (line[21], line[22:27]), line[12:16].strip(),
+                   line[30:38], line[38:46], line[46:54])
+        elif line.startswith('ENDMDL'):
+            # First model only
+            return
+
+
+def mmcif_atom_records(lines):
+    '''
+    As pdb_atom_records, from the atom_site loop of an mmCIF file.
+    '''
+    columns = []
+    for line in lines:
+        if line.startswith('_atom_site.'):
+            columns.append(line.split('.', 1)[1].strip())
+            continue
+        if not columns:
+            continue
+        if line.startswith(('#', '_', 'loop_', 'data_')):
+            # End of the atom_site loop
+            return
+        tokens = mmcif_token.findall(line)
+        if len(tokens) < len(columns):
+            continue
+        row = dict(zip(columns, tokens))
+        if row.get('pdbx_PDB_model_num', '1') not in ('1', '?', '.'):
+            # First model only
+            return
+        residue = (row.get('auth_asym_id', row.get('label_asym_id')),
+                   row.get('auth_seq_id', row.get('label_seq_id')),
+                   row.get('pdbx_PDB_ins_code'))
+        yield (row.get('group_PDB') == 'HETATM',
+               row.get('label_comp_id', row.get('auth_comp_id')), residue,
+               row.get('label_atom_id', row.get('auth_atom_id', '')).strip('"\''),
+               row.get('Cartn_x'), row.get('Cartn_y'), row.get('Cartn_z'))
+
+
+def atom_records(path, f):
+    if is_mmcif(path):
+        return mmcif_atom_records(f)
+    return pdb_atom_records(f)
+
+
+def is_selected(record, codes, hetero=False):
+    '''
+    True for atoms of residues in codes or, with hetero, of any hetero
+    residue other than water.
+    '''
+    is_hetero, code = record[0], record[1]
+    return code in codes or (hetero and is_hetero and
+                             code not in water_codes)
+
+
+def sugar_codes_with(extra_codes):
+    return sugar_codes.union([code.upper() for code in extra_codes if code])
+
+
+def sugar_coordinates(path, extra_codes=(), hetero=False):
+    '''
+    (n, 3) array of the orthogonal coordinates of every sugar atom in
+    the first model of path.  extra_codes are treated as sugars too, e.g.
+    a custom sugar not yet in the CCD.  With hetero, atoms of all hetero
+    residues other than water are included, so sugars missing from
+    sugar_codes are still covered.
+    '''
+    codes = sugar_codes_with(extra_codes)
+    atoms = []
+    with open_text(path) as f:
+        for record in atom_records(path, f):
+            if is_selected(record, codes, hetero):
+                try:
+                    atoms.append([float(value) for value in record[4:]])
+                except (TypeError, ValueError):
+                    continue
+    return np.array(atoms, dtype='f8').reshape(-1, 3)
+
+
+def count_sugar_residues(path, extra_codes=(), limit=None, hetero=False):
+    '''
+    Number of sugar residues in the first model of path, by CCD code, as
+    a dict.  Reading stops once limit residues have been seen.  With
+    hetero, every hetero residue other than water is counted, as in
+    sugar_coordinates.
+    '''
+    codes = sugar_codes_with(extra_codes)
+    residues = set()
+    counts = {}
+    with open_text(path) as f:
+        for record in atom_records(path, f):
+            if not is_selected(record, codes, hetero):
+                continue
+            residue = (record[1],) + tuple(record[2])
+            if residue in residues:
+                continue
+            residues.add(residue)
+            counts[record[1]] = counts.get(record[1], 0) + 1
+            if limit is not None and len(residues) >= limit:
+                break
+    return counts
+
+
+def has_sugars(path, extra_codes=()):
+    '''
+    True if the first model of path may contain a sugar residue.  Any
+    hetero residue other than water counts, as sugar_codes only lists
+    the common sugars and Privateer knows many more; a model is only
+    taken to have no sugars when it has no such residue at all.
+    '''
+    return bool(count_sugar_residues(path, extra_codes, limit=1,
+                                     hetero=True))
+
+
+def screen_args(model_path, job_location, extra_codes=()):
+    '''
+    Arguments to ccpem-python that screen model_path for sugars, writing
+    an empty program.xml to job_location if it has no hetero residues
+    other than water.
+    '''
+    args = ['-m', 'ccpem_core.tasks.privateer.privateer_structure',
+            model_path, job_location]
+    for code in extra_codes:
+        if code:
+            args += ['--code', code]
+    return args
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Count the sugar residues of a model')
+    parser.add_argument('model')
+    parser.add_argument('job_location')
+    parser.add_argument('--code', action='append', default=[])
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+    counts = count_sugar_residues(args.model, args.code, hetero=True)
+    if counts:
+        print 'Sugar and hetero residues in {0}: {1}'.format(
+            args.model, ', '.join(['{0} {1}'.format(counts[code], code)
+                                   for code in sorted(counts)]))
+        return 0
+    print 'No sugar or hetero residues in {0}, Privateer not run'.format(
+        args.model)
+    privateer_xml.write_empty_program_xml(
+        os.path.join(args.job_location, 'program.xml'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
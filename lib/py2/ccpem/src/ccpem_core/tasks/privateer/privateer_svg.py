@@ -0,0 +1,214 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+'''
+SVG asset cache for the Privateer glycan view.
+
+Glycan and permutation diagrams are read and parsed at most once per file
+and deduplicated by content, so a diagram shared by several chains is
+emitted once as a <symbol> and referenced with <use>.
+
+Privateer gives each residue a <title> tooltip naming its chain and
+number, so the title text is left out of the content hash and of the
+symbol.  Each <use> carries the tooltips of its own file instead, on
+transparent copies of the titled shapes.
+'''
+
+import os
+import re
+import copy
+import hashlib
+from lxml import etree
+
+svg_ns = 'http://www.w3.org/2000/svg'
+xlink_ns = 'http://www.w3.org/1999/xlink'
+svg_nsmap = {None: svg_ns, 'xlink': xlink_ns}
+
+# Residue tooltips, whose text is blanked before hashing
+title_pattern = re.compile(br'(<title(?:\s[^>]*)?>)(.*?)(</title>)', re.S)
+
+
+def strip_titles(content):
+    '''
+    content with the text of every <title> removed, and the texts removed.
+    '''
+    titles = [match.group(2) for match in title_pattern.finditer(content)]
+    return title_pattern.sub(br'\1\3', content), titles
+
+
+def is_title(element):
+    return (isinstance(element.tag, basestring) and
+            etree.QName(element).localname == 'title')
+
+
+class SVGAsset(object):
+    '''
+    One unique diagram, parsed from content with its titles stripped.  The
+    parsed root is kept only to build its symbol and tooltip overlays.
+    '''
+    __slots__ = ('digest', 'symbol_id', 'root', 'width', 'height',
+                 'view_box', 'titled')
+
+    def __init__(self, digest, content):
+        self.digest = digest
+        self.symbol_id = 'glycan-svg-' + digest[:16]
+        self.root = etree.fromstring(content)
+        # Elements carrying a tooltip, in document order like the titles
+        self.titled = [element.getparent() for element in self.root.iter()
+                       if is_title(element)]
+        self.width = self.root.get('width')
+        self.height = self.root.get('height')
+        self.view_box = self.root.get('viewBox')
+        if self.view_box is None:
+            try:
+                self.view_box = '0 0 {0:g} {1:g}'.format(float(self.width),
+                                                         float(self.height))
+            except (TypeError, ValueError):
+                self.view_box = None
+
+    def symbol(self):
+        '''
+        <symbol> holding the diagram content, for the shared definitions.
+        '''
+        symbol = etree.Element('{%s}symbol' % svg_ns,
+                               attrib={'id': self.symbol_id},
+                               nsmap=svg_nsmap)
+        if self.view_box is not None:
+            symbol.set('viewBox', self.view_box)
+        for child in self.root:
+            symbol.append(copy.deepcopy(child))
+        for title in [element for element in symbol.iter() if is_title(element)]:
+            title.getparent().remove(title)
+        return symbol
+
+    def reference(self, titles=()):
+        '''
+        Inline <svg> of the original size that draws the shared symbol,
+        with titles, the raw text of the file's <title>s, as tooltips.
+        '''
+        attrib = {}
+        for name in ('width', 'height'):
+            value = getattr(self, name)
+            if value is not None:
+                attrib[name] = value
+        if self.view_box is not None:
+            attrib['viewBox'] = self.view_box
+        svg = etree.Element('{%s}svg' % svg_ns, attrib=attrib,
+                            nsmap=svg_nsmap)
+        etree.SubElement(svg, '{%s}use' % svg_ns,
+                         attrib={'{%s}href' % xlink_ns: '#' + self.symbol_id})
+        for element, title in zip(self.titled, titles):
+            text = etree.fromstring(b'<title>' + title + b'</title>').text
+            if element is self.root:
+                etree.SubElement(svg, '{%s}title' % svg_ns).text = text
+            else:
+                svg.append(self.tooltip(element, text))
+        return svg
+
+    def tooltip(self, element, text):
+        '''
+        Invisible copy of the shapes of a titled element, titled text.
+        '''
+        overlay = etree.Element('{%s}g' % svg_ns, attrib={'opacity': '0'})
+        etree.SubElement(overlay, '{%s}title' % svg_ns).text = text
+        for child in element:
+            if not is_title(child):
+                overlay.append(copy.deepcopy(child))
+        return overlay
+
+
+class SVGDiagram(object):
+    '''
+    One SVG file: its shared asset and its own tooltips.
+    '''
+    __slots__ = ('asset', 'titles')
+
+    def __init__(self, asset, titles):
+        self.asset = asset
+        self.titles = titles
+
+    @property
+    def digest(self):
+        return self.asset.digest
+
+    @property
+    def symbol_id(self):
+        return self.asset.symbol_id
+
+    def symbol(self):
+        return self.asset.symbol()
+
+    def reference(self):
+        return self.asset.reference(self.titles)
+
+
+class SVGAssetCache(object):
+    '''
+    Cache of SVG files keyed by path, mtime and size, with parsed assets
+    shared between files of identical content but for their titles.
+    '''
+    def __init__(self):
+        self.files = {}
+        self.assets = {}
+
+    def _read(self, path):
+        if not os.path.isfile(path):
+            return None, None
+        stat = os.stat(path)
+        stamp = (stat.st_mtime, stat.st_size)
+        cached = self.files.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1], None
+        with open(path, 'rb') as f:
+            content, titles = strip_titles(f.read())
+        digest = hashlib.sha1(content).hexdigest()
+        self.files[path] = (stamp, digest, titles)
+        return digest, content
+
+    def digest(self, path):
+        '''
+        Content hash of the SVG at path, or None if it does not exist.
+        The file is hashed, not parsed.
+        '''
+        return self._read(path)[0]
+
+    def get(self, path):
+        '''
+        SVGDiagram for path, or None if it does not exist.  Parses the
+        file if no file of the same content has been parsed yet.
+        '''
+        digest, content = self._read(path)
+        if digest is None:
+            return None
+        if digest not in self.assets:
+            if content is None:
+                # Only hashed so far, read it again to parse it
+                del self.files[path]
+                digest, content = self._read(path)
+                if digest is None:
+                    return None
+            try:
+                self.assets[digest] = SVGAsset(digest, content)
+            except etree.XMLSyntaxError:
+                # Possibly still being written, read it again next time
+                del self.files[path]
+                raise
+        return SVGDiagram(self.assets[digest], self.files[path][2])
+
+
+def symbol_definitions(assets):
+    '''
+    Hidden <svg> holding one <symbol> per asset, to go before any <use>.
+    '''
+    svg = etree.Element('{%s}svg' % svg_ns,
+                        attrib={'style': 'display:none'},
+                        nsmap=svg_nsmap)
+    defs = etree.SubElement(svg, '{%s}defs' % svg_ns)
+    for asset in assets:
+        defs.append(asset.symbol())
+    return svg
@@ -0,0 +1,218 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+'''
+Synthetic Privateer outputs of any size, for benchmarks.
+
+write_synthetic_job writes a program.xml with the given number of sugars,
+grouped into glycans spread over chains, and a glycan diagram per glycan.
+With permutations every other glycan has no GlyConnect match and carries
+closest permutations with their own diagrams.  Values are drawn from a
+seeded generator so the same arguments always give the same files.
+'''
+
+import os
+import random
+from lxml import etree
+from ccpem_core.tasks.privateer import privateer_merge
+from ccpem_core.tasks.privateer import privateer_svg
+
+# (code, SNFG shape, colour) of the sugars used
+sugar_kinds = [('NAG', 'square', '#0072bc'),
+               ('MAN', 'circle', '#00a651'),
+               ('BMA', 'circle', '#00a651'),
+               ('GAL', 'circle', '#ffd400'),
+               ('FUC', 'triangle', '#ed1c24')]
+
+furanose_codes = ['FUB', 'AHR']
+
+diagnostics = ['Ok', 'Ok', 'Ok', 'Ok', 'check conformation',
+               'Anomer/Config mismatch', 'Ok']
+
+# Sugars per glycan, per chain and permutations per unmatched glycan
+glycan_size = 5
+chain_size = 200
+permutations_per_glycan = 3
+
+# Every nth sugar is a furanose
+furanose_every = 50
+
+wurcs_example = ('WURCS=2.0/3,5,4/[a2122h-1b_1-5_2*NCC/3=O][a1122h-1b_1-5]'
+                 '[a1122h-1a_1-5]/1-1-2-3-3/a4-b1_b4-c1_c3-d1_c6-e1')
+
+
+def sugar_record(rng, ring, chain, name):
+    element = etree.Element('Furanose' if ring == 'furanose' else 'Pyranose')
+    fields = [('SugarChain', chain),
+              ('SugarName', name),
+              ('SugarQ', '{0:.3f}'.format(rng.uniform(0.45, 0.65))),
+              ('SugarPhi', '{0:.2f}'.format(rng.uniform(0.0, 360.0)))]
+    if ring != 'furanose':
+        fields.append(('SugarTheta', '{0:.2f}'.format(rng.choice(
+            [rng.uniform(0.0, 15.0), rng.uniform(0.0, 180.0)]))))
+    fields += [('SugarAnomer', rng.choice(['alpha', 'beta'])),
+               ('SugarHand', 'D'),
+               ('SugarConformation', '3t2' if ring == 'furanose' else '4c1'),
+               ('SugarRSCC', '{0:.2f}'.format(rng.uniform(0.3, 0.95))),
+               ('SugarBFactor', '{0:.2f}'.format(rng.uniform(10.0, 150.0))),
+               ('SugarDiagnostic', rng.choice(diagnostics))]
+    for tag, text in fields:
+        etree.SubElement(element, tag).text = text
+    return element
+
+
+def svg_tag(name):
+    return '{%s}%s' % (privateer_svg.svg_ns, name)
+
+
+def glycan_svg(residues):
+    '''
+    SNFG style diagram of residues, a list of (name, kind), drawn left to
+    right with a tooltip per residue as Privateer does.
+    '''
+    svg = etree.Element(svg_tag('svg'), nsmap={None: privateer_svg.svg_ns})
+    width = 40 * len(residues) + 20
+    svg.set('width', str(width))
+    svg.set('height', '60')
+    svg.set('viewBox', '0 0 {0} 60'.format(width))
+    for i, (name, (code, shape, colour)) in enumerate(residues):
+        x = width - 30 - 40 * i
+        if i:
+            etree.SubElement(svg, svg_tag('line'), x1=str(x + 10), y1='30',
+                             x2=str(x + 40), y2='30', stroke='black')
+        group = etree.SubElement(svg, svg_tag('g'))
+        if name is not None:
+            etree.SubElement(group, svg_tag('title')).text = name
+        if shape == 'square':
+            etree.SubElement(group, svg_tag('rect'), x=str(x - 10), y='20',
+                             width='20', height='20', fill=colour,
+                             stroke='black')
+        elif shape == 'triangle':
+            etree.SubElement(group, svg_tag('polygon'), fill=colour, stroke='black',
+                             points='{0},20 {1},40 {2},40'.format(
+                                 x, x - 10, x + 10))
+        else:
+            etree.SubElement(group, svg_tag('circle'), cx=str(x), cy='30', r='10',
+                             fill=colour, stroke='black')
+    return etree.tostring(svg, xml_declaration=True, encoding='UTF-8')
+
+
+def permutation_record(rng, job_location, svg, residues):
+    element = etree.Element('GlycanPermutation')
+    fields = [('PermutationWURCS', wurcs_example),
+              ('PermutationScore', '{0:.2f}'.format(rng.uniform(0.0, 20.0))),
+              ('anomerPermutations', str(rng.randint(0, 2))),
+              ('residuePermutations', str(rng.randint(0, 2))),
+              ('residueDeletions', str(rng.randint(0, 1))),
+              ('PermutationGTCID', 'G{0:05d}AB'.format(rng.randint(0, 99999))),
+              ('PermutationGlyConnectID', str(rng.randint(1, 5000))),
+              ('PermutationSVG', svg)]
+    for tag, text in fields:
+        etree.SubElement(element, tag).text = text
+    with open(os.path.join(job_location, svg), 'wb') as f:
+        f.write(glycan_svg([(None, kind) for _name, kind in residues]))
+    return element
+
+
+def glycan_record(rng, job_location, chain, number, residues, permutations):
+    '''
+    Glycan element for residues, writing its diagrams to job_location.
+    '''
+    svg = 'glycan-{0}-{1}.svg'.format(chain, number)
+    with open(os.path.join(job_location, svg), 'wb') as f:
+        f.write(glycan_svg(residues))
+    matched = not permutations or number % 2 == 0
+    element = etree.Element('Glycan')
+    fields = [('GlycanChain', chain),
+              ('GlycanWURCS', wurcs_example),
+              ('GlycanGTCID', 'G{0:05d}CD'.format(number % 100000)
+               if matched else 'Unable to find GlyTouCan ID'),
+              ('GlycanGlyConnectID', str(number)
+               if matched else 'Unable to find GlyConnect ID'),
+              ('GlycanSVG', svg)]
+    for tag, text in fields:
+        etree.SubElement(element, tag).text = text
+    if not matched:
+        permutation_list = etree.SubElement(element, 'GlycanPermutations')
+        for k in range(permutations_per_glycan):
+            permutation_list.append(permutation_record(
+                rng, job_location,
+                'glycan-{0}-{1}-permutation-{2}.svg'.format(chain, number, k),
+                residues[:len(residues) - k] or residues))
+    return element
+
+
+def synthetic_sugars(sugars, seed=1):
+    '''
+    (chain, residue number, code, ring, kind) for each of sugars sugars.
+    '''
+    rng = random.Random(seed)
+    chains = privateer_merge.chain_id_pool()
+    chain = next(chains)
+    for i in range(sugars):
+        if i and i % chain_size == 0:
+            chain = next(chains)
+        number = i % chain_size + 1
+        kind = sugar_kinds[0] if i % glycan_size < 2 else rng.choice(sugar_kinds)
+        if i % furanose_every == furanose_every - 1:
+            yield chain, number, rng.choice(furanose_codes), 'furanose', kind
+        else:
+            yield chain, number, kind[0], 'pyranose', kind
+
+
+def synthetic_glycans(sugars, seed=1):
+    '''
+    (chain, [(sugar name, kind), ...]) for each glycan of the sugars.
+    '''
+    residues = []
+    glycan_chain = None
+    for i, (chain, number, code, _ring, kind) in enumerate(
+            synthetic_sugars(sugars, seed)):
+        if residues and (chain != glycan_chain or i % glycan_size == 0):
+            yield glycan_chain, residues
+            residues = []
+        glycan_chain = chain
+        residues.append(('{0}-/{1}/{2}/'.format(code, chain, number), kind))
+    if residues:
+        yield glycan_chain, residues
+
+
+def write_synthetic_job(job_location, sugars, permutations=False, seed=1):
+    '''
+    Write program.xml and glycan diagrams for sugars sugars to
+    job_location, streaming so memory use does not grow with size.
+    Returns a dict of what was written.
+    '''
+    if not os.path.exists(job_location):
+        os.makedirs(job_location)
+    counts = {'sugars': sugars, 'glycans': 0, 'svg_files': 0}
+    xmlfilename = os.path.join(job_location, 'program.xml')
+    with etree.xmlfile(xmlfilename, encoding='UTF-8') as xf:
+        xf.write_declaration()
+        with xf.element('PrivateerResult'):
+            with xf.element('ValidationData'):
+                # Pyranoses, then furanoses, then glycans, as Privateer does
+                for stream, ring in enumerate(('pyranose', 'furanose')):
+                    rng = random.Random(seed * 3 + stream)
+                    for chain, number, code, sugar_ring, _kind in \
+                            synthetic_sugars(sugars, seed):
+                        if sugar_ring == ring:
+                            xf.write(sugar_record(
+                                rng, ring, chain,
+                                '{0}-/{1}/{2}/'.format(code, chain, number)))
+                rng = random.Random(seed * 3 + 2)
+                for chain, residues in synthetic_glycans(sugars, seed):
+                    counts['glycans'] += 1
+                    glycan = glycan_record(rng, job_location, chain,
+                                           counts['glycans'], residues,
+                                           permutations)
+                    xf.write(glycan)
+                    counts['svg_files'] += 1 + len(
+                        glycan.findall('GlycanPermutations/GlycanPermutation'))
+    counts['program_xml_bytes'] = os.path.getsize(xmlfilename)
+    return counts
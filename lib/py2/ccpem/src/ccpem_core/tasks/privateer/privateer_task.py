@@ -8,11 +8,21 @@
 #
 
 import os
+import sys
 from ccpem_core.ccpem_utils import ccpem_argparser
 from ccpem_core import process_manager
 from ccpem_core.tasks import task_utils
 from ccpem_core import settings
+from ccpem_core import ccpem_utils
 from ccpem_core.tasks.privateer import privateer_results
+from ccpem_core.tasks.privateer import privateer_database
+from ccpem_core.tasks.privateer import privateer_batch
+from ccpem_core.tasks.privateer import privateer_runner
+from ccpem_core.tasks.privateer import privateer_scheduler
+from ccpem_core.tasks.privateer import privateer_result_cache
+from ccpem_core.tasks.privateer import privateer_mrc
+from ccpem_core.tasks.privateer import privateer_structure
+from ccpem_core.tasks.privateer import privateer_shard
 
 class Privateer(task_utils.CCPEMTask):
     '''
@@ -32,11 +42,52 @@ class Privateer(task_utils.CCPEMTask):
         documentation_link='http://legacy.ccp4.ac.uk/html/privateer.html',
         references=None)
 
+    # CCPEM_PRIVATEER_COMMAND replaces Privateer, e.g. with the
+    # privateer_fake stand-in for headless runs
     commands = {'refmac': settings.which(program='refmac5'),
             'coot': settings.which(program='coot'),
-            'privateer': settings.which('privateer')
+            'privateer': (os.environ.get('CCPEM_PRIVATEER_COMMAND') or
+                          settings.which('privateer'))
             }
 
+    # Role of every parser argument.  Compute arguments change the
+    # analysis Privateer does, presentation arguments only how the glycan
+    # diagrams are drawn and job arguments neither.
+    arg_roles = {'input_model':                 'compute',
+                 'input_map':                   'compute',
+                 'resolution':                  'compute',
+                 'glytoucan':                   'compute',
+                 'closestmatch':                'compute',
+                 'allpermutations':             'compute',
+                 'mask_radius':                 'compute',
+                 'expression_system_mode':      'compute',
+                 'undefinedsugar':              'compute',
+                 'input_code':                  'compute',
+                 'input_anomer':                'compute',
+                 'input_handedness':            'compute',
+                 'input_ring_conformation':     'compute',
+                 'input_conformation_pyranose': 'compute',
+                 'input_conformation_furanose': 'compute',
+                 'ring_oxygen':                 'compute',
+                 'ring_C1':                     'compute',
+                 'ring_C2':                     'compute',
+                 'ring_C3':                     'compute',
+                 'ring_C4':                     'compute',
+                 'ring_C5':                     'compute',
+                 'batch_manifest':              'compute',
+                 'crop_map':                    'compute',
+                 'crop_margin':                 'compute',
+                 'shards':                      'compute',
+                 'diagram_style':               'presentation',
+                 'diagram_orientation':         'presentation',
+                 'color_scheme':                'presentation',
+                 'color_scheme_outlines':       'presentation',
+                 'job_title':                   'job',
+                 'ncpus':                       'job',
+                 'keywords':                    'job',
+                 'use_result_cache':            'job',
+                 'live_report':                 'job'}
+
     def __init__ ( self,
                    database_path  = None,
                    args           = None,
@@ -71,6 +122,13 @@ class Privateer(task_utils.CCPEMTask):
                               nargs           = '*',
                               default         = None )
 
+        parser.add_argument (   '-batch_manifest',
+                                '--batch_manifest',
+                                help            = 'Manifest of models to validate as a batch, one "model [map [resolution]]" per line or a JSON list',
+                                type            = str,
+                                metavar         = 'Batch manifest',
+                                default         = None )
+
         parser.add_argument (   '-input_map',
                                 '--input_map',
                                 help            = 'Input map',
@@ -319,6 +377,27 @@ class Privateer(task_utils.CCPEMTask):
                                 type            = str,
                                 default='black' )
 
+        parser.add_argument(    '-crop_map',
+                                '--crop_map',
+                                help='Crop the map to the neighbourhood of the carbohydrates before validation',
+                                metavar='Crop map around sugars',
+                                type=bool,
+                                default=False)
+
+        parser.add_argument(    '-crop_margin',
+                                '--crop_margin',
+                                help='Margin (Angstrom) kept around the carbohydrate atoms when cropping the map',
+                                metavar='Crop margin (Angstrom)',
+                                type=float,
+                                default=10.0)
+
+        parser.add_argument(    '-shards',
+                                '--shards',
+                                help='Split the model by chain into up to this many parts validated in parallel',
+                                metavar='Model shards',
+                                type=int,
+                                default=1)
+
         parser.add_argument(    '-ncpus',
                                 '--ncpus',
                                 help='Number of CPU threads for Privateer',
@@ -333,28 +412,104 @@ class Privateer(task_utils.CCPEMTask):
             type=str,
             metavar='Keywords',
             default='')
+
+        parser.add_argument(    '-use_result_cache',
+                                '--use_result_cache',
+                                help='Reuse stored Privateer results when the inputs and options match an earlier run',
+                                metavar='Reuse earlier results',
+                                type=bool,
+                                default=True)
+
+        parser.add_argument(    '-live_report',
+                                '--live_report',
+                                help='Add results to the report as Privateer writes them, rather than only when it finishes',
+                                metavar='Live report',
+                                type=bool,
+                                default=True)
         
         return parser
 
-    def run_pipeline ( self, job_id = None, db_inject = None ):
+    def batch_entries(self):
         '''
-        Generate job classes and process.  Run=false for reloading.
+        Entries to validate as a batch, from the manifest or from several
+        input models.  Empty for a single model.
         '''
-        # Get data from multiple inputs
-        
-        # Get processes
-        pr = PrivateerCLI ( name                        = self.task_info.name,
+        if self.args.batch_manifest() is not None:
+            return privateer_batch.read_manifest(self.args.batch_manifest())
+        models = self.args.input_model()
+        if isinstance(models, list) and len(models) > 1:
+            return privateer_batch.entries_from_models(
+                models, self.args.input_map(), self.args.resolution())
+        return []
+
+    def extra_sugar_codes(self):
+        '''
+        Custom sugar code, screened and cropped around like the CCD sugars.
+        '''
+        if self.args.undefinedsugar():
+            return [self.args.input_code()]
+        return []
+
+    def preflight_issues(self, input_model=None, input_map=None,
+                         resolution=None):
+        '''
+        privateer_mrc.PreflightIssue list for every input map, checked
+        against its resolution and model.  Messages of a batch are
+        prefixed with the entry name.  input_model, input_map and
+        resolution replace the task's arguments for a single model when
+        given, e.g. the values being entered in the window.
+        '''
+        extra_codes = self.extra_sugar_codes()
+        batch_entries = self.batch_entries()
+        if batch_entries:
+            inputs = [(entry.name + ': ', entry.input_model, entry.input_map,
+                       entry.resolution) for entry in batch_entries]
+        else:
+            if input_model is None:
+                input_model = self.args.input_model()
+            if input_map is None:
+                input_map = self.args.input_map()
+            if resolution is None:
+                resolution = self.args.resolution()
+            inputs = [('', self.model_path(input_model), input_map,
+                       resolution)]
+        issues = []
+        for prefix, input_model, input_map, resolution in inputs:
+            if not input_map:
+                continue
+            for issue in privateer_mrc.preflight_map(
+                    input_map, resolution, input_model, extra_codes):
+                issues.append(issue._replace(message=prefix + issue.message))
+        return issues
+
+    def privateer_cli(self,
+                      name,
+                      prdatabase_path,
+                      job_location,
+                      input_model,
+                      input_map,
+                      resolution,
+                      ncpus,
+                      live_report=False,
+                      diagrams_only=False):
+        '''
+        PrivateerCLI for one model with the task's validation settings.
+        With diagrams_only the GlyTouCan and GlyConnect searches are left
+        out, for a rerun that only redraws the glycan diagrams.
+        '''
+        search = not diagrams_only
+        return PrivateerCLI ( name                        = name,
                            command                      = self.commands['privateer'],
-                           prdatabase_path              = os.path.join(os.environ['CCPEM'], 'lib/data/privateer_database.json'),
-                           job_location                 = self.job_location,
-                           input_model                  = self.args.input_model( ),
-                           input_map                    = self.args.input_map ( ),
-                           resolution                   = self.args.resolution ( ),
-                           glytoucan                    = self.args.glytoucan ( ),
-                           closestmatch                 = self.args.closestmatch ( ),
-                           allpermutations              = self.args.allpermutations ( ),
+                           prdatabase_path              = prdatabase_path,
+                           job_location                 = job_location,
+                           input_model                  = input_model,
+                           input_map                    = input_map,
+                           resolution                   = resolution,
+                           glytoucan                    = search and self.args.glytoucan ( ),
+                           closestmatch                 = search and self.args.closestmatch ( ),
+                           allpermutations              = search and self.args.allpermutations ( ),
                            mask_radius                  = self.args.mask_radius ( ),
-                           expression_system_mode       = self.args.expression_system_mode ( ),
+                           expression_system_mode       = search and self.args.expression_system_mode ( ),
                            undefinedsugar               = self.args.undefinedsugar ( ),
                            input_code                   = self.args.input_code ( ),
                            input_anomer                 = self.args.input_anomer ( ),
@@ -367,15 +522,270 @@ class Privateer(task_utils.CCPEMTask):
                            ring_C2                      = self.args.ring_C2 ( ),
                            ring_C3                      = self.args.ring_C3 ( ),
                            ring_C4                      = self.args.ring_C4 ( ),
+                           ring_C5                      = self.args.ring_C5 ( ),
                            diagram_style                = self.args.diagram_style ( ),
                            diagram_orientation          = self.args.diagram_orientation ( ),
                            color_scheme                 = self.args.color_scheme ( ),
                            color_scheme_outlines        = self.args.color_scheme_outlines ( ),
-                           ncpus                        = self.args.ncpus ( ) )
-        pl = [[pr.process]]
+                           ncpus                        = ncpus,
+                           live_report                  = live_report,
+                           # Jobs of every project on this host share one budget
+                           budget_location              = privateer_scheduler.default_budget_location ( ) )
+
+    def args_with_role(self, role):
+        '''
+        Names of the parser arguments with role compute, presentation or job.
+        '''
+        return sorted([name for name, arg_role in self.arg_roles.items()
+                       if arg_role == role])
+
+    def cached_process(self, cli_args, shards=1, live_report=False):
+        '''
+        Pipeline stages to run for the PrivateerCLI made from cli_args
+        (privateer_cli keyword arguments), and the PrivateerCachedRun to
+        finish them with.
+
+        A model without sugars only gets a process writing an empty
+        program.xml.  A stored result with the same key is copied in by a
+        materialise process.  One differing only in presentation arguments
+        is copied in the same way while Privateer is run on the model alone,
+        without the map analysis or database searches, to redraw the
+        diagrams, if the Privateer executable supports a run without a
+        map.  Otherwise the map is cropped if asked and Privateer runs
+        in full, on up to shards sub-models in parallel.  With live_report an unsharded full run
+        builds its report as it goes.
+        '''
+        job_location = cli_args['job_location']
+        input_map = cli_args['input_map']
+        input_model = self.model_path(cli_args['input_model'])
+        extra_codes = self.extra_sugar_codes()
+        try:
+            has_sugars = privateer_structure.has_sugars(input_model, extra_codes)
+        except (IOError, OSError):
+            # Leave unreadable models for Privateer to report
+            has_sugars = True
+        if not has_sugars:
+            process = process_manager.CCPEMProcess (
+                               name               = cli_args['name'],
+                               command            = sys.executable,
+                               args               = privateer_structure.screen_args(
+                                                        input_model,
+                                                        job_location,
+                                                        extra_codes),
+                               location           = job_location,
+                               stdin              = None )
+            return [[process]], None
+        # Processes run side by side before Privateer
+        preparation = []
+        if self.args.crop_map() and input_map is not None:
+            cropped_map = os.path.join(job_location, 'cropped_map.mrc')
+            preparation.append(process_manager.CCPEMProcess (
+                               name               = '{0} crop map'.format(cli_args['name']),
+                               command            = sys.executable,
+                               args               = privateer_mrc.crop_args(
+                                                        input_model,
+                                                        input_map,
+                                                        cropped_map,
+                                                        self.args.crop_margin(),
+                                                        extra_codes),
+                               location           = job_location,
+                               stdin              = None ))
+            cli_args = dict(cli_args, input_map=cropped_map)
+        pr = self.privateer_cli(live_report=live_report, **cli_args)
+        privateer_stages = [[pr.process]]
+        chain_lists = []
+        if shards > 1:
+            try:
+                chain_lists = privateer_shard.plan_shards(input_model, shards,
+                                                          extra_codes)
+            except (IOError, OSError):
+                chain_lists = []
+        if len(chain_lists) > 1:
+            preparation.append(process_manager.CCPEMProcess (
+                               name               = '{0} split model'.format(cli_args['name']),
+                               command            = sys.executable,
+                               args               = privateer_shard.split_args(
+                                                        input_model,
+                                                        job_location,
+                                                        chain_lists),
+                               location           = job_location,
+                               stdin              = None ))
+            privateer_stages = self.shard_stages(cli_args, input_model,
+                                                 chain_lists)
+        stages = privateer_stages
+        if preparation:
+            stages = [preparation] + privateer_stages
+        if not self.args.use_result_cache():
+            return stages, None
+        # Key on the map given, not the crop written later
+        key_args = list(pr.compute_args)
+        if self.args.crop_map() and input_map is not None:
+            key_args[key_args.index('-mapin') + 1] = input_map
+            key_args += ['-crop_margin', self.args.crop_margin()]
+        if len(chain_lists) > 1:
+            key_args += ['-shards', len(chain_lists)]
+        result_cache = privateer_result_cache.ResultCache()
+        try:
+            compute_key = result_cache.compute_key(self.commands['privateer'],
+                                                   key_args)
+        except (IOError, OSError):
+            return stages, None
+        result_key = result_cache.result_key(compute_key, pr.presentation_args)
+        if result_cache.has(result_key):
+            process = process_manager.CCPEMProcess (
+                               name               = cli_args['name'],
+                               command            = sys.executable,
+                               args               = privateer_result_cache.materialise_args(
+                                                        result_key, job_location),
+                               location           = job_location,
+                               stdin              = None )
+            return [[process]], None
+
+        cached_run = PrivateerCachedRun(result_key, compute_key)
+        try:
+            match = result_cache.compute_match(compute_key)
+            # Permutation diagrams come from the closest match search,
+            # which a diagram-only rerun leaves out
+            if match is not None and result_cache.has_permutations(match):
+                match = None
+            # The rerun leaves out -mapin, which older Privateer needs
+            if match is not None and not result_cache.model_only_supported(
+                    self.commands['privateer']):
+                match = None
+        except (IOError, OSError):
+            match = None
+        if match is not None and input_map is not None:
+            materialise = process_manager.CCPEMProcess (
+                               name               = '{0} reuse'.format(cli_args['name']),
+                               command            = sys.executable,
+                               args               = privateer_result_cache.materialise_args(
+                                                        match, job_location),
+                               location           = job_location,
+                               stdin              = None )
+            cached_run.rerender_location = os.path.join(job_location,
+                                                        'rerender')
+            ccpem_utils.check_directory_and_make(cached_run.rerender_location)
+            rerender_args = dict(cli_args,
+                                 name='{0} diagrams'.format(cli_args['name']),
+                                 job_location=cached_run.rerender_location,
+                                 input_map=None,
+                                 resolution=None,
+                                 diagrams_only=True)
+            return [[materialise,
+                     self.privateer_cli(**rerender_args).process]], cached_run
+        return stages, cached_run
+
+    def shard_stages(self, cli_args, input_model, chain_lists):
+        '''
+        Stages running Privateer on each sub-model of chain_lists, sharing
+        the cores of cli_args, then merging their program.xml.
+        '''
+        job_location = cli_args['job_location']
+        workers, cores = privateer_batch.pool_size(cli_args['ncpus'],
+                                                   len(chain_lists))
+        processes = []
+        shard_locations = []
+        for index in range(len(chain_lists)):
+            shard_location = os.path.join(
+                job_location, privateer_shard.shard_directory(index))
+            ccpem_utils.check_directory_and_make(shard_location)
+            shard_locations.append(shard_location)
+            processes.append(self.privateer_cli(**dict(
+                cli_args,
+                name           = '{0} chains {1}'.format(
+                                     cli_args['name'], ' '.join(chain_lists[index])),
+                job_location   = shard_location,
+                input_model    = privateer_shard.shard_model_path(
+                                     job_location, index, input_model),
+                ncpus          = cores)).process)
+        merge = process_manager.CCPEMProcess (
+                               name               = '{0} merge'.format(cli_args['name']),
+                               command            = sys.executable,
+                               args               = privateer_shard.merge_args(
+                                                        job_location,
+                                                        shard_locations),
+                               location           = job_location,
+                               stdin              = None )
+        return privateer_batch.stages(processes, workers) + [[merge]]
+
+    def model_path(self, input_model):
+        # -input_model takes several models, Privateer reads one
+        if isinstance(input_model, list):
+            return input_model[0]
+        return input_model
+
+    def run_pipeline ( self, job_id = None, db_inject = None ):
+        '''
+        Generate job classes and process.  Run=false for reloading.
+        '''
+        # Get data from multiple inputs
+        prdatabase_path = privateer_database.default_database_path()
+        for issue in self.preflight_issues():
+            ccpem_utils.print_warning(
+                message='Map check {0}: {1}'.format(issue.level,
+                                                    issue.message))
+        
+        # Get processes
+        batch_entries = self.batch_entries()
+        if batch_entries:
+            workers, cores = privateer_batch.pool_size(self.args.ncpus(),
+                                                       len(batch_entries))
+            entry_stages = []
+            cached_runs = {}
+            for entry in batch_entries:
+                entry_location = entry.job_location(self.job_location)
+                ccpem_utils.check_directory_and_make(entry_location)
+                stages, cached_runs[entry.name] = self.cached_process(dict(
+                    name           = '{0} {1}'.format(self.task_info.name, entry.name),
+                    prdatabase_path= prdatabase_path,
+                    job_location   = entry_location,
+                    input_model    = entry.input_model,
+                    input_map      = entry.input_map,
+                    resolution     = entry.resolution,
+                    ncpus          = cores))
+                entry_stages.append((entry.name, stages))
+            # Entries run from a pool, the next starting as any finishes
+            plan_path = os.path.join(self.job_location,
+                                     privateer_batch.batch_plan_filename)
+            privateer_batch.write_plan(plan_path, entry_stages)
+            pl = [[process_manager.CCPEMProcess (
+                        name               = '{0} batch'.format(self.task_info.name),
+                        command            = sys.executable,
+                        args               = privateer_batch.run_args(plan_path,
+                                                                      workers),
+                        location           = self.job_location,
+                        stdin              = None )]]
+
+            custom_finish = PrivateerBatchOnFinish(
+                job_location=self.job_location,
+                batch_entries=batch_entries,
+                cached_runs=cached_runs)
+        else:
+            pl, cached_run = self.cached_process(dict(
+                name           = self.task_info.name,
+                prdatabase_path= prdatabase_path,
+                job_location   = self.job_location,
+                input_model    = self.args.input_model( ),
+                input_map      = self.args.input_map ( ),
+                resolution     = self.args.resolution ( ),
+                ncpus          = self.args.ncpus ( )),
+                shards=self.args.shards(),
+                live_report=self.args.live_report())
+
+            custom_finish = PrivateerResultsOnFinish(
+                job_location=self.job_location,
+                cached_run=cached_run)
 
-        custom_finish = PrivateerResultsOnFinish(
-            job_location=self.job_location)
+        # Index is built once per installation and reused by lookups
+        if (os.path.isfile(prdatabase_path) and
+                not privateer_database.is_current(prdatabase_path)):
+            pl[0].append(process_manager.CCPEMProcess (
+                        name               = '{0} database index'.format(self.task_info.name),
+                        command            = sys.executable,
+                        args               = privateer_database.index_args(
+                                                 prdatabase_path),
+                        location           = self.job_location,
+                        stdin              = None ))
 
         # Run pipeline
         # os.chdir(self.job_location)
@@ -422,11 +832,14 @@ class PrivateerCLI(object):
                    ring_C2,
                    ring_C3,
                    ring_C4,
+                   ring_C5,
                    diagram_style,
                    diagram_orientation,
                    color_scheme,
                    color_scheme_outlines,
-                   ncpus):
+                   ncpus,
+                   live_report=False,
+                   budget_location=None):
         self.command                        = command
         self.prdatabase_path                = prdatabase_path
         self.job_location                   = job_location
@@ -450,14 +863,29 @@ class PrivateerCLI(object):
         self.ring_C2                        = ring_C2
         self.ring_C3                        = ring_C3
         self.ring_C4                        = ring_C4
+        self.ring_C5                        = ring_C5
         self.diagram_style                  = diagram_style
         self.diagram_orientation            = diagram_orientation
         self.color_scheme                   = color_scheme
         self.color_scheme_outlines          = color_scheme_outlines
         self.ncpus                          = ncpus
+        self.live_report                    = live_report
+        self.budget_location                = budget_location
        
         self.args                             = []
         self.set_args                         ()
+        self.compute_args                     = list(self.args)
+        self.presentation_args                = []
+        self.set_presentation_args            ()
+        self.args                             += self.presentation_args
+        if self.budget_location is not None:
+            # Launcher waits for a share of the cores and sets -cores
+            self.args = (privateer_runner.runner_args(self.budget_location,
+                                                      self.ncpus,
+                                                      self.job_location,
+                                                      self.live_report) +
+                         [self.command] + self.args)
+            self.command = sys.executable
 
         self.process = process_manager.CCPEMProcess (
                            name               = name,
@@ -467,14 +895,20 @@ class PrivateerCLI(object):
                            stdin              = None )
 
     def set_args ( self ):
+        input_model = self.input_model
+        # -input_model takes several models, Privateer reads one
+        if isinstance(input_model, list):
+            input_model = input_model[0]
         self.args.append('-pdbin')
-        self.args.append(self.input_model)
+        self.args.append(input_model)
 
-        self.args.append('-mapin')
-        self.args.append(self.input_map)
+        if self.input_map is not None:
+            self.args.append('-mapin')
+            self.args.append(self.input_map)
 
-        self.args.append('-resolution')
-        self.args.append(self.resolution)
+        if self.resolution is not None:
+            self.args.append('-resolution')
+            self.args.append(self.resolution)
 
         self.args.append('-radiusin')
         self.args.append(self.mask_radius)
@@ -625,22 +1059,6 @@ class PrivateerCLI(object):
                 QtGui.QMessageBox.critical        ( None, 'Error', text )
                 return False
 
-        if self.diagram_style:
-            if self.diagram_style == "Old Privateer":
-                self.args.append                  ('-oldstyle')
-
-        if self.diagram_orientation:
-            if self.diagram_orientation == "vertical":
-                self.args.append                  ('-vertical')
-        
-        if self.color_scheme:
-            if self.color_scheme == "Old Style":
-                self.args.append                  ('-oldstyle')
-
-        if self.color_scheme_outlines:
-            if self.color_scheme == "white":
-                self.args.append                  ('-invert')
-
         if self.expression_system_mode:
             self.args.append                  ('-expression')
             self.args.append                  (self.expression_system_mode)
@@ -660,22 +1078,103 @@ class PrivateerCLI(object):
             if self.allpermutations and not self.closestmatch:
                 self.args.append                  ( '-all_permutations' )
         
-        if self.ncpus is not None:
+        if self.ncpus is not None and self.budget_location is None:
             self.args.append                  ('-cores')
             self.args.append                  (self.ncpus)
 
+    def set_presentation_args ( self ):
+        '''
+        Diagram options, kept apart as they do not change the analysis.
+        '''
+        if self.diagram_style:
+            if self.diagram_style == "Old Privateer":
+                self.presentation_args.append     ('-oldstyle')
+
+        if self.diagram_orientation:
+            if self.diagram_orientation == "vertical":
+                self.presentation_args.append     ('-vertical')
+        
+        if self.color_scheme:
+            if self.color_scheme == "Old Style":
+                if '-oldstyle' not in self.presentation_args:
+                    self.presentation_args.append ('-oldstyle')
+
+        if self.color_scheme_outlines:
+            if self.color_scheme_outlines == "white":
+                self.presentation_args.append     ('-invert')
+
+class PrivateerCachedRun(object):
+    '''
+    Result cache keys of a run, and where its diagrams are redrawn when
+    the analysis was reused from an earlier run.
+    '''
+    def __init__(self, result_key, compute_key, rerender_location=None):
+        self.result_key = result_key
+        self.compute_key = compute_key
+        self.rerender_location = rerender_location
+
+    def finish(self, job_location):
+        '''
+        Swap in redrawn diagrams and add the outputs to the result cache.
+        '''
+        try:
+            if self.rerender_location is not None:
+                if not privateer_result_cache.swap_diagrams(
+                        job_location, self.rerender_location):
+                    ccpem_utils.print_warning(
+                        message='Redrawn glycan diagrams do not match, '
+                                'keeping earlier ones')
+                    return
+            privateer_result_cache.ResultCache().store(
+                self.result_key, job_location, self.compute_key)
+        except (IOError, OSError) as e:
+            ccpem_utils.print_warning(
+                message='Unable to store Privateer result: {0}'.format(e))
+
+
 class PrivateerResultsOnFinish(process_manager.CCPEMPipelineCustomFinish):
     '''
     Generate RVAPI results on finish.
     '''
 
     def __init__(self,
-                 job_location):
+                 job_location,
+                 cached_run=None):
         super(PrivateerResultsOnFinish, self).__init__()
         self.job_location = job_location
+        self.cached_run = cached_run
 
     def on_finish(self, parent_pipeline=None, job_location=None):
+        # keep outputs for later runs with the same inputs and options
+        if self.cached_run is not None:
+            self.cached_run.finish(self.job_location)
         # generate RVAPI report
-        results = privateer_results.PrivateerResultsViewer(
-            job_location=self.job_location)
-        
\ No newline at end of file
+        privateer_results.build_report(self.job_location)
+
+
+class PrivateerBatchOnFinish(process_manager.CCPEMPipelineCustomFinish):
+    '''
+    Generate each entry's RVAPI report, the batch index and a batch
+    summary on finish.
+    '''
+
+    def __init__(self,
+                 job_location,
+                 batch_entries,
+                 cached_runs=None):
+        super(PrivateerBatchOnFinish, self).__init__()
+        self.job_location = job_location
+        self.batch_entries = batch_entries
+        self.cached_runs = cached_runs or {}
+
+    def on_finish(self, parent_pipeline=None, job_location=None):
+        for entry in self.batch_entries:
+            entry_location = entry.job_location(self.job_location)
+            cached_run = self.cached_runs.get(entry.name)
+            if cached_run is not None:
+                cached_run.finish(entry_location)
+            if os.path.exists(os.path.join(entry_location, 'program.xml')):
+                privateer_results.build_report(entry_location)
+        batch_results = privateer_batch.write_batch_index(
+            self.job_location, self.batch_entries)
+        privateer_results.build_batch_report(self.job_location, batch_results)
@@ -0,0 +1,182 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+'''
+Single pass reader for Privateer program.xml, and the empty program.xml
+written for models without sugars.
+
+The file is walked once with iterparse and every Pyranose, Furanose and
+Glycan element is turned into a privateer_model record and cleared
+straight away, so the report builders never hold the lxml tree.
+ProgramXMLFollower reads a program.xml still being written the same way,
+a few records at a time.
+'''
+
+import os
+import hashlib
+from lxml import etree
+from ccpem_core.tasks.privateer import privateer_model
+
+
+record_tags = ('Pyranose', 'Furanose', 'Glycan')
+
+# program.xml tag names, in model argument order
+sugar_tags = ['SugarChain', 'SugarName', 'SugarQ', 'SugarPhi',
+              'SugarTheta', 'SugarAnomer', 'SugarHand',
+              'SugarConformation', 'SugarRSCC', 'SugarBFactor',
+              'SugarDiagnostic']
+
+glycan_tags = ['GlycanChain', 'GlycanWURCS', 'GlycanGTCID',
+               'GlycanGlyConnectID', 'GlycanSVG']
+
+permutation_tags = ['PermutationWURCS', 'PermutationScore',
+                    'anomerPermutations', 'residuePermutations',
+                    'residueDeletions', 'PermutationGTCID',
+                    'PermutationGlyConnectID', 'PermutationSVG']
+
+
+def read_program_xml(xmlfilename, section_hashes=False):
+    '''
+    Read program.xml in one streaming pass and return
+    PrivateerValidationData.  With section_hashes the data also carries a
+    content digest of the Pyranose, Furanose and Glycan sections.
+    '''
+    data = privateer_model.PrivateerValidationData()
+    digests = {}
+    context = etree.iterparse(xmlfilename,
+                              events=('end',),
+                              tag=record_tags)
+    for _event, element in context:
+        if not is_record(element):
+            continue
+        if section_hashes:
+            if element.tag not in digests:
+                digests[element.tag] = hashlib.sha1()
+            digests[element.tag].update(etree.tostring(element))
+        add_record(data, element)
+        release_element(element)
+    del context
+    if section_hashes:
+        data.section_hashes = dict(
+            (tag, digest.hexdigest()) for tag, digest in digests.items())
+    return data
+
+
+class ProgramXMLFollower(object):
+    '''
+    Reads the records of a program.xml that is still being written.  Each
+    poll parses only the bytes added since the last one and returns the
+    records completed in them.  If the file is replaced or truncated it
+    is read again from the start, skipping the records already returned.
+    '''
+    def __init__(self, xmlfilename, block_size=1 << 20):
+        self.xmlfilename = xmlfilename
+        self.block_size = block_size
+        # Records returned so far, per tag
+        self.returned = dict((tag, 0) for tag in record_tags)
+        self.restart(None)
+
+    def restart(self, identity):
+        self.identity = identity
+        self.offset = 0
+        self.seen = dict((tag, 0) for tag in record_tags)
+        self.parser = etree.XMLPullParser(events=('end',), tag=record_tags)
+
+    def poll(self):
+        '''
+        PrivateerValidationData holding the records completed since the
+        last poll.
+        '''
+        data = privateer_model.PrivateerValidationData()
+        try:
+            stat = os.stat(self.xmlfilename)
+        except OSError:
+            return data
+        identity = (stat.st_dev, stat.st_ino)
+        if identity != self.identity or stat.st_size < self.offset:
+            self.restart(identity)
+        try:
+            with open(self.xmlfilename, 'rb') as f:
+                f.seek(self.offset)
+                for block in iter(lambda: f.read(self.block_size), b''):
+                    self.offset += len(block)
+                    self.parser.feed(block)
+                    self.read_events(data)
+        except etree.XMLSyntaxError:
+            # Rewritten in place under us, start again next poll
+            self.restart(None)
+        return data
+
+    def read_events(self, data):
+        for _event, element in self.parser.read_events():
+            if not is_record(element):
+                continue
+            self.seen[element.tag] += 1
+            if self.seen[element.tag] > self.returned[element.tag]:
+                self.returned[element.tag] += 1
+                add_record(data, element)
+            release_element(element)
+
+
+def write_empty_program_xml(xmlfilename):
+    '''
+    Write a program.xml with an empty ValidationData section, read as no
+    sugars and no glycans.
+    '''
+    root = etree.Element('PrivateerResult')
+    etree.SubElement(root, 'ValidationData')
+    etree.ElementTree(root).write(xmlfilename, pretty_print=True,
+                                  xml_declaration=True, encoding='UTF-8')
+
+
+def is_record(element):
+    parent = element.getparent()
+    return parent is not None and parent.tag == 'ValidationData'
+
+
+def add_record(data, element):
+    '''
+    Append the record for a Pyranose, Furanose or Glycan element to data.
+    '''
+    if element.tag == 'Pyranose':
+        data.pyranoses.append(pyranose_record(element))
+    elif element.tag == 'Furanose':
+        data.furanoses.append(furanose_record(element))
+    else:
+        data.glycans.append(glycan_record(element))
+
+
+def pyranose_record(element):
+    return privateer_model.PrivateerSugar(
+        'pyranose', *[element.findtext(tag) for tag in sugar_tags])
+
+
+def furanose_record(element):
+    return privateer_model.PrivateerSugar(
+        'furanose', *[element.findtext(tag) for tag in sugar_tags])
+
+
+def glycan_record(element):
+    fields = [element.findtext(tag) for tag in glycan_tags]
+    permutation_list = element.find('GlycanPermutations')
+    if permutation_list is not None:
+        fields.append(
+            [privateer_model.GlycanPermutation(
+                *[permutation.findtext(tag) for tag in permutation_tags])
+             for permutation in permutation_list.iterfind('GlycanPermutation')])
+    return privateer_model.PrivateerGlycan(*fields)
+
+
+def release_element(element):
+    '''
+    Free a processed element and any siblings already read before it.
+    '''
+    element.clear()
+    parent = element.getparent()
+    while element.getprevious() is not None:
+        del parent[0]
@@ -9,19 +9,75 @@
 
 
 import os
+import cgi
 
 from PyQt4 import QtGui, QtCore, QtWebKit
 
 from ccpem_gui.utils import window_utils
+from ccpem_core import ccpem_utils
 from ccpem_core.ccpem_utils import ccpem_file_types
 from ccpem_core.tasks.privateer import privateer_task
 from ccpem_core.tasks.privateer import privateer_results
+from ccpem_core.tasks.privateer import privateer_mrc
+from ccpem_core.tasks.privateer import privateer_progress
 from ccpem_gui.utils import gui_process
 from ccpem_gui.utils import command_line_launch
 from ccpem_core.ccpem_utils import get_test_data_path
 from ccpem_core.test_data.tasks import privateer as test_data
 
 
+class PrivateerReportWorker(QtCore.QThread):
+    '''
+    Builds a job's report off the GUI thread, with refresh_ids after
+    looking its glycan IDs up again for expression_system.
+    '''
+    report_ready = QtCore.pyqtSignal()
+    report_failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, job_location, parent=None, refresh_ids=False,
+                 expression_system=None):
+        super(PrivateerReportWorker, self).__init__(parent)
+        self.job_location = job_location
+        self.refresh_ids = refresh_ids
+        self.expression_system = expression_system
+
+    def run(self):
+        try:
+            if self.refresh_ids:
+                privateer_results.refresh_glycan_ids(self.job_location,
+                                                     self.expression_system)
+            else:
+                privateer_results.build_report(self.job_location)
+        except Exception as e:
+            self.report_failed.emit(str(e))
+        else:
+            self.report_ready.emit()
+
+
+class PrivateerPreflightWorker(QtCore.QThread):
+    '''
+    Runs the input map pre-flight check off the GUI thread, as it reads
+    the whole model.
+    '''
+    issues_ready = QtCore.pyqtSignal(object)
+
+    def __init__(self, task, input_model, input_map, resolution, parent=None):
+        super(PrivateerPreflightWorker, self).__init__(parent)
+        self.task = task
+        self.input_model = input_model
+        self.input_map = input_map
+        self.resolution = resolution
+
+    def run(self):
+        try:
+            issues = self.task.preflight_issues(input_model=self.input_model,
+                                                input_map=self.input_map,
+                                                resolution=self.resolution)
+        except (IOError, OSError, ValueError) as e:
+            issues = [privateer_mrc.PreflightIssue('error', str(e))]
+        self.issues_ready.emit(issues)
+
+
 class PrivateerWindow(window_utils.CCPEMTaskWindow):
     '''
     Privateer window.
@@ -32,8 +88,14 @@ class PrivateerWindow(window_utils.CCPEMTaskWindow):
                  task,
                  parent=None):
         self.results_dock = None
+        self.rv_view = None
+        self.report_worker = None
+        self.preflight_worker = None
+        self.preflight_running = False
+        self.preflight_pending = False
         super(PrivateerWindow, self).__init__(task=task,
                                              parent=parent)
+        self.set_progress_ui()
 
 
     def set_args(self):
@@ -79,6 +141,18 @@ class PrivateerWindow(window_utils.CCPEMTaskWindow):
             required=True)
         self.args_widget.args_layout.addWidget(self.resolution_input)
 
+        # Map pre-flight check
+        self.preflight_label = QtGui.QLabel()
+        self.preflight_label.setWordWrap(True)
+        self.preflight_label.hide()
+        self.args_widget.args_layout.addWidget(self.preflight_label)
+        self.model_input.value_line.editingFinished.connect(
+            self.check_input_map)
+        self.map_input.value_line.editingFinished.connect(
+            self.check_input_map)
+        self.resolution_input.value_line.editingFinished.connect(
+            self.check_input_map)
+
         # Radius-in
         self.maskradius_input = window_utils.NumberArgInput(
             parent=self,
@@ -247,6 +321,11 @@ class PrivateerWindow(window_utils.CCPEMTaskWindow):
             args=self.args)
         self.glytoucan_settings_frame.add_extension_widget(self.all_permutations_enable)
 
+        refresh_ids_button = QtGui.QPushButton('Refresh glycan IDs of this job')
+        refresh_ids_button.clicked.connect(self.refresh_glycan_ids)
+        refresh_ids_button.setToolTip('Look the glycans found up again in the local GlyTouCan and GlyConnect database and update the report, without re-running Privateer')
+        self.glytoucan_settings_frame.add_extension_widget(refresh_ids_button)
+
 
 
         # Privateer parallelism settings
@@ -280,6 +359,58 @@ class PrivateerWindow(window_utils.CCPEMTaskWindow):
         set_privateer_ncpus_half_cpus_button.setToolTip("Use half of the available Cores available on the CPU on Privateer")
         privateer_ncpus_layout.addWidget(set_privateer_ncpus_half_cpus_button)
 
+        self.shards = window_utils.NumberArgInput(
+            parent=self,
+            arg_name='shards',
+            minimum=1,
+            required=False,
+            args=self.args)
+        self.parallelism_settings.add_extension_widget(self.shards)
+
+        self.check_input_map()
+
+    def check_input_map(self):
+        '''
+        Check the input map from its header and a sample of voxels, before
+        the job is run, with the values currently entered.  The check runs
+        on a worker thread; edits made meanwhile are checked once it ends.
+        '''
+        if self.preflight_running:
+            self.preflight_pending = True
+            return
+        self.preflight_running = True
+        self.preflight_pending = False
+        try:
+            resolution = float(self.resolution_input.value_line.text())
+        except ValueError:
+            resolution = None
+        self.preflight_worker = PrivateerPreflightWorker(
+            self.task,
+            str(self.model_input.value_line.text()).strip() or None,
+            str(self.map_input.value_line.text()).strip(),
+            resolution,
+            self)
+        self.preflight_worker.issues_ready.connect(self.show_preflight_issues)
+        self.preflight_worker.start()
+
+    def show_preflight_issues(self, issues):
+        '''
+        Show problems found by the input map check, if any.
+        '''
+        self.preflight_running = False
+        if self.preflight_pending:
+            self.check_input_map()
+            return
+        if not issues:
+            self.preflight_label.hide()
+            return
+        colors = {'error': 'red', 'warning': 'darkorange'}
+        lines = ['<font color="{0}">{1}: {2}</font>'.format(
+                     colors[issue.level], issue.level.capitalize(),
+                     cgi.escape(issue.message))
+                 for issue in issues]
+        self.preflight_label.setText('<br>'.join(lines))
+        self.preflight_label.show()
 
     # Detect number of CPUs
     def set_privateer_all_cores(self):
@@ -311,28 +442,144 @@ class PrivateerWindow(window_utils.CCPEMTaskWindow):
 
 
 
-    def set_rv_ui(self):
+    def set_progress_ui(self):
+        '''
+        Status bar progress of the running Privateer processes, polled from
+        their progress files.
+        '''
+        self.progress_label = QtGui.QLabel()
+        self.progress_bar = QtGui.QProgressBar()
+        self.progress_bar.setMaximumWidth(200)
+        self.statusBar().addPermanentWidget(self.progress_label)
+        self.statusBar().addPermanentWidget(self.progress_bar)
+        self.progress_label.hide()
+        self.progress_bar.hide()
+        self.progress_timer = QtCore.QTimer(self)
+        self.progress_timer.timeout.connect(self.update_progress)
+        # Polled only while a job runs, including one reopened mid-run
         if self.task.job_location is not None:
-            report = os.path.join(self.task.job_location,
-                                    'report/index.html')
-            if os.path.exists(report):
-                self.rv_view = QtWebKit.QWebView()
-                self.rv_view.load(QtCore.QUrl(report))
-                self.results_dock = QtGui.QDockWidget('Results',
-                                                        self,
-                                                        QtCore.Qt.Widget)
-                self.results_dock.setToolTip('Results overview')
-                self.results_dock.setWidget(self.rv_view)
-                self.tabifyDockWidget(self.setup_dock, self.results_dock)
-                self.results_dock.show()
-                self.results_dock.raise_()
-    
+            progress = privateer_progress.job_progress(self.task.job_location)
+            if progress is not None and progress['status'] == 'running':
+                self.progress_timer.start(1000)
+        self.update_progress()
+
+    def update_progress(self):
+        progress = None
+        if self.task.job_location is not None:
+            progress = privateer_progress.job_progress(self.task.job_location)
+        if progress is None:
+            self.progress_label.hide()
+            self.progress_bar.hide()
+            return
+        if progress['status'] == 'running' and self.results_dock is None:
+            # Live report, filled in as Privateer writes results
+            self.show_report()
+        self.progress_label.setText(privateer_progress.describe(progress))
+        total = progress['total_sugars']
+        if progress['status'] != 'running':
+            self.progress_bar.setRange(0, 1)
+            self.progress_bar.setValue(1)
+        elif total:
+            self.progress_bar.setRange(0, total)
+            self.progress_bar.setValue(min(progress['counts']['sugars'], total))
+        else:
+            # Busy indicator when the number of sugars is not known
+            self.progress_bar.setRange(0, 0)
+        self.progress_label.show()
+        self.progress_bar.show()
+
+    def set_rv_ui(self):
+        '''
+        Show the job's report, building it first on a worker thread, with a
+        placeholder until it is ready if no report is shown yet.
+        '''
+        if self.task.job_location is None:
+            return
+        if not os.path.exists(os.path.join(self.task.job_location,
+                                           'program.xml')):
+            self.show_report()
+            return
+        self.start_report_worker()
+
+    def refresh_glycan_ids(self):
+        '''
+        Update the finished job's glycan IDs from the local database, for
+        the expression system now chosen, and show its report again.
+        '''
+        if (self.task.job_location is None or
+                not os.path.exists(os.path.join(self.task.job_location,
+                                                'program.xml'))):
+            self.statusBar().showMessage(
+                'No Privateer results to refresh glycan IDs for', 5000)
+            return
+        self.start_report_worker(
+            refresh_ids=True,
+            expression_system=self.args.expression_system_mode.value)
+
+    def start_report_worker(self, refresh_ids=False, expression_system=None):
+        if self.report_worker is not None and self.report_worker.isRunning():
+            return
+        if self.rv_view is None:
+            placeholder = QtGui.QLabel('Building report...')
+            placeholder.setAlignment(QtCore.Qt.AlignCenter)
+            self.set_results_widget(placeholder)
+        self.report_worker = PrivateerReportWorker(
+            self.task.job_location,
+            self,
+            refresh_ids=refresh_ids,
+            expression_system=expression_system)
+        self.report_worker.report_ready.connect(self.show_report)
+        self.report_worker.report_failed.connect(self.show_report_error)
+        self.report_worker.start()
+
+    def show_report(self):
+        '''
+        Load the job's report, if there is one, in the results dock.
+        '''
+        if self.task.job_location is None:
+            return False
+        report = os.path.join(self.task.job_location,
+                                'report/index.html')
+        if not os.path.exists(report):
+            return False
+        if self.rv_view is None:
+            self.rv_view = QtWebKit.QWebView()
+            self.set_results_widget(self.rv_view)
+        self.rv_view.load(QtCore.QUrl(report))
+        self.results_dock.show()
+        self.results_dock.raise_()
+        return True
+
+    def show_report_error(self, message):
+        ccpem_utils.print_error(
+            message='Unable to build Privateer report: {0}'.format(message))
+        if not self.show_report():
+            self.set_results_widget(QtGui.QLabel(
+                'Unable to build report: {0}'.format(message)))
+
+    def set_results_widget(self, widget):
+        if self.results_dock is None:
+            self.results_dock = QtGui.QDockWidget('Results',
+                                                    self,
+                                                    QtCore.Qt.Widget)
+            self.results_dock.setToolTip('Results overview')
+            self.tabifyDockWidget(self.setup_dock, self.results_dock)
+        self.results_dock.setWidget(widget)
+        self.results_dock.show()
+        self.results_dock.raise_()
+
+    def set_on_job_running_custom(self):
+        self.progress_timer.start(1000)
+
     def set_on_job_finish_custom(self):
         # results = privateer_results.PrivateerResultsViewer(
         #     job_location=self.task.job_location)
         self.launcher.set_tree_view()
         self.launcher_dock.raise_()
         self.launcher_dock.show()
+        # Show the final progress, there is nothing left to poll
+        self.progress_timer.stop()
+        self.update_progress()
         self.set_rv_ui()
 
     def run_coot_custom ( self ):
@@ -0,0 +1,100 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+
+import unittest
+import os
+import json
+import shutil
+import sys
+import tempfile
+from ccpem_core.tasks.privateer import privateer_batch
+
+
+class Test(unittest.TestCase):
+    '''
+    Unit test for the batch manifest reader of privateer_batch.
+    '''
+    def setUp(self):
+        self.test_output = tempfile.mkdtemp()
+
+    def tearDown(self):
+        if os.path.exists(path=self.test_output):
+            shutil.rmtree(self.test_output)
+
+    def path(self, name):
+        return os.path.join(self.test_output, name)
+
+    def test_read_text_manifest(self):
+        manifest = self.path('manifest.txt')
+        with open(manifest, 'w') as f:
+            f.write('# model map resolution\n'
+                    'a.pdb map.mrc 3.5\n'
+                    '\n'
+                    'models/b.cif - 2.0  # no map\n'
+                    'c.pdb\n')
+        entries = privateer_batch.read_manifest(manifest)
+        self.assertEqual([entry.name for entry in entries],
+                         ['0001_a', '0002_b', '0003_c'])
+        self.assertEqual([entry.input_model for entry in entries],
+                         [self.path('a.pdb'), self.path('models/b.cif'),
+                          self.path('c.pdb')])
+        self.assertEqual([entry.input_map for entry in entries],
+                         [self.path('map.mrc'), None, None])
+        self.assertEqual([entry.resolution for entry in entries],
+                         [3.5, 2.0, None])
+
+    def test_read_json_manifest(self):
+        manifest = self.path('manifest.json')
+        with open(manifest, 'w') as f:
+            json.dump([{'input_model': 'a.pdb',
+                        'input_map': '/maps/a.mrc',
+                        'resolution': '4'},
+                       {'input_model': 'a.pdb'}], f)
+        entries = privateer_batch.read_manifest(manifest)
+        self.assertEqual([entry.name for entry in entries],
+                         ['0001_a', '0002_a'])
+        self.assertEqual(entries[0].input_map, '/maps/a.mrc')
+        self.assertEqual(entries[0].resolution, 4.0)
+        self.assertIsNone(entries[1].input_map)
+
+    def plan_entry(self, name, command, args=()):
+        location = self.path(name)
+        os.mkdir(location)
+        return {'name': name,
+                'stages': [[{'name': name, 'command': command,
+                             'args': list(args), 'location': location}]]}
+
+    def test_run_plan(self):
+        '''
+        Failed entries, including ones whose command can not be started,
+        are reported without stopping the others.
+        '''
+        plan = [self.plan_entry('ok', sys.executable, ['-c', 'pass']),
+                self.plan_entry('exit', sys.executable,
+                                ['-c', 'import sys; sys.exit(3)']),
+                self.plan_entry('missing', self.path('no_such_program')),
+                self.plan_entry('after', sys.executable, ['-c', 'pass'])]
+        self.assertEqual(sorted(privateer_batch.run_plan(plan, 2)),
+                         ['exit', 'missing'])
+        plan_path = self.path('plan.json')
+        with open(plan_path, 'w') as f:
+            json.dump(plan, f)
+        self.assertEqual(privateer_batch.main([plan_path, '--workers', '2']), 1)
+        with open(plan_path, 'w') as f:
+            json.dump([plan[0]], f)
+        self.assertEqual(privateer_batch.main([plan_path]), 0)
+
+    def test_manifest_without_model(self):
+        manifest = self.path('manifest.json')
+        with open(manifest, 'w') as f:
+            json.dump([{'input_map': 'a.mrc'}], f)
+        self.assertRaises(ValueError, privateer_batch.read_manifest, manifest)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+
+import unittest
+import os
+import json
+import shutil
+import tempfile
+from ccpem_core.tasks.privateer import privateer_database
+
+# Same residues, different linkage
+wurcs_b4 = ('WURCS=2.0/2,2,1/[a2122h-1b_1-5_2*NCC/3=O][a1122h-1b_1-5]'
+            '/1-2/a4-b1')
+wurcs_b3 = ('WURCS=2.0/2,2,1/[a2122h-1b_1-5_2*NCC/3=O][a1122h-1b_1-5]'
+            '/1-2/a3-b1')
+wurcs_other = 'WURCS=2.0/1,1,0/[a1122h-1a_1-5]/1/'
+
+
+class Test(unittest.TestCase):
+    '''
+    Unit test for the database index of privateer_database.
+    '''
+    def setUp(self):
+        self.test_output = tempfile.mkdtemp()
+        self.json_path = os.path.join(self.test_output,
+                                      'privateer_database.json')
+        self.write_database([
+            {'AccessionNumber': 'G00001AA', 'Sequence': wurcs_b4,
+             'glyconnect': {'id': 11}},
+            {'AccessionNumber': 'G00002AA', 'Sequence': wurcs_b3},
+            {'AccessionNumber': 'G00003AA', 'Sequence': wurcs_other,
+             'glyconnect': {'id': 33}}])
+
+    def tearDown(self):
+        if os.path.exists(path=self.test_output):
+            shutil.rmtree(self.test_output)
+
+    def write_database(self, entries):
+        with open(self.json_path, 'w') as f:
+            json.dump(entries, f)
+
+    def test_lookup(self):
+        index = privateer_database.PrivateerDatabaseIndex.for_database(
+            self.json_path)
+        self.assertEqual(len(index), 3)
+        entry = index.lookup(wurcs_b4)
+        self.assertEqual((entry.gtc_id, entry.glyconnect_id), ('G00001AA', 11))
+        self.assertIsNone(index.lookup(wurcs_b3).glyconnect_id)
+        self.assertIsNone(index.lookup(wurcs_b4 + '_c1-d1'))
+
+    def test_same_composition(self):
+        index = privateer_database.PrivateerDatabaseIndex.for_database(
+            self.json_path)
+        self.assertEqual(
+            sorted(entry.gtc_id for entry in index.same_composition(wurcs_b3)),
+            ['G00001AA', 'G00002AA'])
+        self.assertEqual(
+            [entry.gtc_id for entry in index.same_composition(wurcs_other)],
+            ['G00003AA'])
+        self.assertEqual(index.same_composition('not wurcs'), [])
+
+    def test_rebuilt_when_database_changes(self):
+        path = privateer_database.ensure_index(self.json_path)
+        self.assertTrue(privateer_database.is_current(self.json_path, path))
+        self.write_database([{'AccessionNumber': 'G00004AA',
+                              'Sequence': wurcs_other}])
+        os.utime(self.json_path, (0, 0))
+        self.assertFalse(privateer_database.is_current(self.json_path, path))
+        index = privateer_database.PrivateerDatabaseIndex.for_database(
+            self.json_path)
+        self.assertEqual(index.lookup(wurcs_other).gtc_id, 'G00004AA')
+
+if __name__ == '__main__':
+    unittest.main()
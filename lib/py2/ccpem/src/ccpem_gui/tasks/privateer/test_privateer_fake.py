@@ -0,0 +1,114 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+
+import unittest
+import os
+import shutil
+import tempfile
+from ccpem_core.tasks.privateer import privateer_task
+from ccpem_core.tasks.privateer import privateer_fake
+
+
+class Test(unittest.TestCase):
+    '''
+    Unit test for the privateer stand-in: the arguments PrivateerCLI
+    builds must be accepted by parse_privateer_args.
+    '''
+    def setUp(self):
+        self.test_output = tempfile.mkdtemp()
+        self.files = {}
+        for name in ('model.pdb', 'map.mrc', 'privateer_database.json'):
+            self.files[name] = os.path.join(self.test_output, name)
+            open(self.files[name], 'w').close()
+
+    def tearDown(self):
+        if os.path.exists(path=self.test_output):
+            shutil.rmtree(self.test_output)
+
+    def cli_args(self, **kwargs):
+        settings = dict(name='Privateer',
+                        command='privateer',
+                        prdatabase_path=self.files['privateer_database.json'],
+                        job_location=self.test_output,
+                        input_model=self.files['model.pdb'],
+                        input_map=self.files['map.mrc'],
+                        resolution=3.2,
+                        glytoucan=False,
+                        closestmatch=False,
+                        allpermutations=False,
+                        mask_radius=2.5,
+                        expression_system_mode=None,
+                        undefinedsugar=False,
+                        input_code=None,
+                        input_anomer=None,
+                        input_handedness=None,
+                        input_ring_conformation=None,
+                        input_conformation_pyranose=None,
+                        input_conformation_furanose=None,
+                        ring_oxygen=None,
+                        ring_C1=None,
+                        ring_C2=None,
+                        ring_C3=None,
+                        ring_C4=None,
+                        ring_C5=None,
+                        diagram_style=None,
+                        diagram_orientation=None,
+                        color_scheme=None,
+                        color_scheme_outlines=None,
+                        ncpus=4)
+        settings.update(kwargs)
+        cli = privateer_task.PrivateerCLI(**settings)
+        return [str(arg) for arg in cli.args]
+
+    def test_default_args(self):
+        options = privateer_fake.parse_privateer_args(self.cli_args())
+        self.assertEqual(options['-pdbin'], self.files['model.pdb'])
+        self.assertEqual(options['-resolution'], 3.2)
+        self.assertEqual(options['-cores'], 4)
+
+    def test_glytoucan_args(self):
+        options = privateer_fake.parse_privateer_args(self.cli_args(
+            glytoucan=True, allpermutations=True, diagram_style='Old Privateer',
+            diagram_orientation='vertical', color_scheme_outlines='white'))
+        for flag in ('-glytoucan', '-all_permutations', '-oldstyle',
+                     '-vertical', '-invert'):
+            self.assertTrue(options[flag])
+
+    def test_pyranose_valstring(self):
+        options = privateer_fake.parse_privateer_args(self.cli_args(
+            undefinedsugar=True, input_code='Z9D', input_anomer='beta',
+            input_handedness='-D-', input_ring_conformation='pyranose',
+            input_conformation_pyranose='4c1', ring_oxygen='O5',
+            ring_C1='C1', ring_C2='C2', ring_C3='C3', ring_C4='C4',
+            ring_C5='C5'))
+        self.assertEqual(options['-valstring'],
+                         ['Z9D', 'O5', 'C1', 'C2', 'C3', 'C4', 'C5',
+                          'B', 'D', '4c1'])
+        self.assertEqual(options['-codein'], 'Z9D')
+
+    def test_furanose_valstring(self):
+        options = privateer_fake.parse_privateer_args(self.cli_args(
+            undefinedsugar=True, input_code='Z9F', input_handedness='-L-',
+            input_ring_conformation='furanose',
+            input_conformation_furanose='3t2', ring_oxygen='O4',
+            ring_C1='C1', ring_C2='C2', ring_C3='C3', ring_C4='C4'))
+        self.assertEqual(options['-valstring'],
+                         ['Z9F', 'O4', 'C1', 'C2', 'C3', 'C4', 'L', '3t2'])
+
+    def test_rejected_args(self):
+        args = self.cli_args()
+        self.assertRaises(privateer_fake.FakeUsageError,
+                          privateer_fake.parse_privateer_args,
+                          args + ['-valstring', 'Z9D', 'O5'])
+        self.assertRaises(privateer_fake.FakeUsageError,
+                          privateer_fake.parse_privateer_args,
+                          args + ['-glytoucan'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+
+import unittest
+import os
+import json
+import shutil
+import tempfile
+from ccpem_core.tasks.privateer import privateer_database
+from ccpem_core.tasks.privateer import privateer_lookup
+from ccpem_core.tasks.privateer import privateer_model
+
+wurcs_human = 'WURCS=2.0/1,1,0/[a2122h-1b_1-5]/1/'
+wurcs_yeast = 'WURCS=2.0/1,1,0/[a1122h-1a_1-5]/1/'
+wurcs_no_taxonomy = 'WURCS=2.0/1,1,0/[a2112h-1b_1-5]/1/'
+wurcs_missing = 'WURCS=2.0/1,1,0/[a1221m-1a_1-5]/1/'
+
+
+class Test(unittest.TestCase):
+    '''
+    Unit test for the glycan ID lookup of privateer_lookup.
+    '''
+    def setUp(self):
+        self.test_output = tempfile.mkdtemp()
+        json_path = os.path.join(self.test_output, 'privateer_database.json')
+        with open(json_path, 'w') as f:
+            json.dump([
+                {'AccessionNumber': 'G00001AA', 'Sequence': wurcs_human,
+                 'glyconnect': {'id': 1, 'taxonomy': [
+                     {'species': 'Homo sapiens', 'taxonomy_id': 9606}]}},
+                {'AccessionNumber': 'G00002AA', 'Sequence': wurcs_yeast,
+                 'glyconnect': {'id': 2, 'taxonomy': [
+                     {'species': 'Saccharomyces cerevisiae'}]}},
+                {'AccessionNumber': 'G00003AA', 'Sequence': wurcs_no_taxonomy,
+                 'glyconnect': {'id': 3}}], f)
+        self.index = privateer_database.PrivateerDatabaseIndex.for_database(
+            json_path)
+        self.glycans = [privateer_model.PrivateerGlycan('A', wurcs, None,
+                                                        None, 'glycan.svg')
+                        for wurcs in (wurcs_human, wurcs_yeast,
+                                      wurcs_no_taxonomy, wurcs_missing)]
+
+    def tearDown(self):
+        if os.path.exists(path=self.test_output):
+            shutil.rmtree(self.test_output)
+
+    def glyconnect_ids(self, expression_system):
+        ids = privateer_lookup.lookup_glycan_ids(self.glycans, self.index,
+                                                 expression_system)
+        return [ids[glycan.wurcs][1] for glycan in self.glycans]
+
+    def test_expression_systems(self):
+        self.assertEqual(self.index.lookup(wurcs_human).expression_systems,
+                         ('mammalian', 'human'))
+        self.assertEqual(self.index.lookup(wurcs_yeast).expression_systems,
+                         ('fungal', 'yeast'))
+        self.assertEqual(
+            self.index.lookup(wurcs_no_taxonomy).expression_systems, ())
+
+    def test_lookup_any_expression_system(self):
+        not_found = privateer_lookup.glyconnect_id_not_found
+        self.assertEqual(self.glyconnect_ids('undefined'),
+                         ['1', '2', '3', not_found])
+        self.assertEqual(self.glyconnect_ids(None),
+                         ['1', '2', '3', not_found])
+
+    def test_lookup_filtered_by_expression_system(self):
+        '''
+        GlyConnect IDs not recorded for the expression system are left
+        out, GlyTouCan IDs are not.
+        '''
+        not_found = privateer_lookup.glyconnect_id_not_found
+        self.assertEqual(self.glyconnect_ids('mammalian'),
+                         ['1', not_found, not_found, not_found])
+        self.assertEqual(self.glyconnect_ids('yeast'),
+                         [not_found, '2', not_found, not_found])
+        ids = privateer_lookup.lookup_glycan_ids(self.glycans, self.index,
+                                                 'insect')
+        self.assertEqual(ids[wurcs_human][0], 'G00001AA')
+        self.assertEqual(ids[wurcs_missing][0],
+                         privateer_lookup.gtc_id_not_found)
+
+if __name__ == '__main__':
+    unittest.main()
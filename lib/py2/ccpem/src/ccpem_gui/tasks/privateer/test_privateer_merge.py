@@ -0,0 +1,106 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+
+import unittest
+import os
+import json
+import shutil
+import tempfile
+from ccpem_core.tasks.privateer import privateer_merge
+from ccpem_core.tasks.privateer import privateer_xml
+
+
+def pyranose(chain, number):
+    return ('<Pyranose><SugarChain>{0}</SugarChain>'
+            '<SugarName>NAG-/{0}/{1}/</SugarName><SugarQ>0.5</SugarQ>'
+            '<SugarPhi>1.0</SugarPhi><SugarTheta>2.0</SugarTheta>'
+            '<SugarAnomer>beta</SugarAnomer><SugarHand>D</SugarHand>'
+            '<SugarConformation>4c1</SugarConformation>'
+            '<SugarRSCC>0.8</SugarRSCC><SugarBFactor>30.0</SugarBFactor>'
+            '<SugarDiagnostic>yes</SugarDiagnostic></Pyranose>').format(
+                chain, number)
+
+
+def glycan(chain, svg):
+    return ('<Glycan><GlycanChain>{0}</GlycanChain>'
+            '<GlycanWURCS>WURCS</GlycanWURCS><GlycanGTCID>G1</GlycanGTCID>'
+            '<GlycanGlyConnectID>1</GlycanGlyConnectID>'
+            '<GlycanSVG>{1}</GlycanSVG></Glycan>').format(chain, svg)
+
+
+class Test(unittest.TestCase):
+    '''
+    Unit test for the program.xml merge of privateer_merge.
+    '''
+    def setUp(self):
+        self.test_output = tempfile.mkdtemp()
+
+    def tearDown(self):
+        if os.path.exists(path=self.test_output):
+            shutil.rmtree(self.test_output)
+
+    def write_input(self, name, records, svgs=()):
+        location = os.path.join(self.test_output, name)
+        os.mkdir(location)
+        with open(os.path.join(location, 'program.xml'), 'w') as f:
+            f.write('<PrivateerResult><ValidationData>{0}'
+                    '</ValidationData></PrivateerResult>'.format(
+                        ''.join(records)))
+        for svg in svgs:
+            with open(os.path.join(location, svg), 'w') as f:
+                f.write(name)
+        return location
+
+    def test_chain_id_pool(self):
+        pool = privateer_merge.chain_id_pool()
+        chains = [next(pool) for _i in range(63)]
+        self.assertEqual(chains[:3], ['A', 'B', 'C'])
+        self.assertEqual(chains[61:], ['9', 'AA'])
+
+    def test_chain_remapping(self):
+        '''
+        A chain ID already taken by an earlier input is given a free one,
+        in chain fields and sugar names alike.
+        '''
+        first = self.write_input('first', [pyranose('A', 1), pyranose('B', 1)])
+        second = self.write_input('second', [pyranose('A', 5),
+                                             glycan('A', 'glycan.svg')],
+                                  ['glycan.svg'])
+        output = os.path.join(self.test_output, 'merged')
+        os.mkdir(output)
+        self.assertEqual(
+            privateer_merge.merge_program_xml(output, [first, second]), 4)
+        data = privateer_xml.read_program_xml(
+            os.path.join(output, 'program.xml'))
+        self.assertEqual([sugar.chain for sugar in data.pyranoses],
+                         ['A', 'B', 'C'])
+        self.assertEqual(data.pyranoses[2].name, 'NAG-/C/5/')
+        self.assertEqual(data.glycans[0].chain, 'C')
+        self.assertEqual(data.glycans[0].svg,
+                         os.path.join('..', 'second', 'glycan.svg'))
+        with open(os.path.join(output,
+                               privateer_merge.merge_map_filename)) as f:
+            mapping = json.load(f)
+        self.assertEqual([entry['chains'] for entry in mapping],
+                         [{}, {'A': 'C'}])
+
+    def test_keep_chains(self):
+        first = self.write_input('first', [pyranose('A', 1)])
+        second = self.write_input('second', [pyranose('A', 2)])
+        output = os.path.join(self.test_output, 'merged')
+        os.mkdir(output)
+        privateer_merge.merge_program_xml(output, [first, second],
+                                          keep_chains=True)
+        data = privateer_xml.read_program_xml(
+            os.path.join(output, 'program.xml'))
+        self.assertEqual([sugar.name for sugar in data.pyranoses],
+                         ['NAG-/A/1/', 'NAG-/A/2/'])
+
+if __name__ == '__main__':
+    unittest.main()
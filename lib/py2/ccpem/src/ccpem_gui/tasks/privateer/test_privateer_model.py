@@ -0,0 +1,62 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+
+import unittest
+import math
+from ccpem_core.tasks.privateer import privateer_model
+
+
+def sugar(ring='pyranose', name='NAG-/A/1/', q='0.560', theta='4.20',
+          diagnostic='Ok'):
+    return privateer_model.PrivateerSugar(
+        ring, 'A', name, q, '10.50', theta, 'beta', 'D', '4c1', '0.80',
+        '30.00', diagnostic)
+
+
+class Test(unittest.TestCase):
+    '''
+    Unit test for the result model of privateer_model.
+    '''
+    def test_numeric_fields(self):
+        record = sugar()
+        self.assertAlmostEqual(record.q, 0.56)
+        self.assertAlmostEqual(record.bfactor, 30.0)
+        self.assertTrue(math.isnan(sugar(q='n/a').q))
+        self.assertIsNone(sugar(ring='furanose', theta=None).theta)
+
+    def test_text_as_written(self):
+        record = sugar()
+        self.assertEqual(record.text('q'), '0.560')
+        self.assertEqual(record.text('name'), 'NAG-/A/1/')
+        self.assertEqual(sugar(ring='furanose', theta=None).text('theta'), '')
+        self.assertEqual(record.table_row()[:3], ['A', 'NAG-/A/1/', '0.560'])
+
+    def test_text_interned(self):
+        '''
+        Sugars share one copy of each repeated string.
+        '''
+        first = sugar(name=''.join(['NAG-/A/', '1/']),
+                      q=''.join(['0.5', '60']))
+        second = sugar(name=''.join(['NAG-/A/', '1/']),
+                       q=''.join(['0.5', '60']))
+        self.assertIs(first.name, second.name)
+        self.assertIs(first.text('q'), second.text('q'))
+
+    def test_classify_diagnostic(self):
+        self.assertEqual(privateer_model.classify_diagnostic('Ok'),
+                         privateer_model.SUGAR_OK)
+        self.assertEqual(
+            privateer_model.classify_diagnostic(
+                'Conformation might be mistaken'),
+            privateer_model.SUGAR_CONFORMATION)
+        self.assertEqual(privateer_model.classify_diagnostic(None),
+                         privateer_model.SUGAR_OTHER)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+from ccpem_core.tasks.privateer import privateer_mrc
+
+
+def write_map(path, shape=(20, 20, 20), voxel=1.0, starts=(0, 0, 0),
+              origin=(0.0, 0.0, 0.0)):
+    '''
+    Float MRC map of shape (sections, rows, columns) with values rising
+    along each axis.
+    '''
+    header = np.zeros(1, dtype=privateer_mrc.header_dtype('<'))[0]
+    header['ns'], header['nr'], header['nc'] = shape
+    header['mode'] = 2
+    header['ncstart'], header['nrstart'], header['nsstart'] = starts
+    header['mx'], header['my'], header['mz'] = shape[2], shape[1], shape[0]
+    header['cella'] = [shape[2] * voxel, shape[1] * voxel, shape[0] * voxel]
+    header['cellb'] = [90.0, 90.0, 90.0]
+    header['mapc'], header['mapr'], header['maps'] = 1, 2, 3
+    header['origin'] = origin
+    header['map'] = 'MAP '
+    data = np.indices(shape).sum(axis=0).astype('<f4')
+    with open(path, 'wb') as f:
+        f.write(header.tostring())
+        f.write(data.tostring())
+
+
+def write_model(path, coordinates):
+    with open(path, 'w') as f:
+        for i, (x, y, z) in enumerate(coordinates):
+            f.write('HETATM{0:>5} C1   NAG A{1:>4}    '
+                    '{2:>8.3f}{3:>8.3f}{4:>8.3f}  1.00 20.00\n'.format(
+                        i + 1, i + 1, x, y, z))
+        f.write('END\n')
+
+
+class Test(unittest.TestCase):
+    '''
+    Unit test for the MRC map checks of privateer_mrc.
+    '''
+    def setUp(self):
+        self.test_output = tempfile.mkdtemp()
+        self.map_path = os.path.join(self.test_output, 'map.mrc')
+        self.model_path = os.path.join(self.test_output, 'model.pdb')
+
+    def tearDown(self):
+        if os.path.exists(path=self.test_output):
+            shutil.rmtree(self.test_output)
+
+    def levels(self):
+        return [issue.level for issue in privateer_mrc.preflight_map(
+            self.map_path, 3.0, self.model_path)]
+
+    def test_preflight_model_inside(self):
+        write_map(self.map_path)
+        write_model(self.model_path, [(5.0, 5.0, 5.0), (10.0, 10.0, 10.0)])
+        self.assertEqual(self.levels(), [])
+
+    def test_preflight_model_outside(self):
+        write_map(self.map_path)
+        write_model(self.model_path, [(50.0, 5.0, 5.0), (60.0, 5.0, 5.0)])
+        self.assertEqual(self.levels(), ['error'])
+
+    def test_preflight_origin(self):
+        '''
+        A map placed by its origin field is only warned about.
+        '''
+        write_map(self.map_path, origin=(100.0, 0.0, 0.0))
+        write_model(self.model_path, [(105.0, 5.0, 5.0), (110.0, 5.0, 5.0)])
+        issues = privateer_mrc.preflight_map(self.map_path, 3.0,
+                                             self.model_path)
+        self.assertEqual([issue.level for issue in issues], ['warning'])
+        self.assertIn('origin field', issues[0].message)
+        write_model(self.model_path, [(500.0, 5.0, 5.0)])
+        self.assertEqual(self.levels(), ['warning'])
+
+    def test_crop_box(self):
+        write_map(self.map_path)
+        mrc = privateer_mrc.MRCMap(self.map_path)
+        coordinates = np.array([[5.0, 6.0, 7.0], [10.0, 10.0, 10.0]])
+        self.assertEqual(mrc.crop_box(coordinates, 2.0),
+                         [(3, 13), (4, 13), (5, 13)])
+        # Clipped to the map
+        self.assertEqual(mrc.crop_box(coordinates, 8.0),
+                         [(0, 19), (0, 19), (0, 19)])
+        self.assertIsNone(mrc.crop_box(coordinates + 100.0, 2.0))
+        self.assertIsNone(mrc.crop_box(np.zeros((0, 3)), 2.0))
+
+    def test_crop_box_starts(self):
+        '''
+        The box is in file indices, offset by the map's nstart.
+        '''
+        write_map(self.map_path, starts=(10, 0, 0))
+        mrc = privateer_mrc.MRCMap(self.map_path)
+        self.assertEqual(mrc.crop_box(np.array([[10.0, 5.0, 5.0]]), 2.0),
+                         [(0, 3), (3, 8), (3, 8)])
+        write_map(self.map_path, origin=(10.0, 0.0, 0.0))
+        mrc = privateer_mrc.MRCMap(self.map_path)
+        self.assertIsNone(mrc.crop_box(np.array([[15.0, 5.0, 5.0]]), 2.0))
+
+    def test_write_crop(self):
+        write_map(self.map_path)
+        mrc = privateer_mrc.MRCMap(self.map_path)
+        box = [(3, 13), (4, 13), (5, 14)]
+        crop_path = os.path.join(self.test_output, 'crop.mrc')
+        mrc.write_crop(crop_path, box)
+        crop = privateer_mrc.MRCMap(crop_path)
+        self.assertEqual(crop.starts(), [3, 4, 5])
+        self.assertTrue(np.array_equal(np.asarray(crop.data),
+                                       np.asarray(mrc.data)[5:14, 4:13, 3:13]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+
+import unittest
+import os
+import time
+import shutil
+import tempfile
+from ccpem_core.tasks.privateer import privateer_fake
+from ccpem_core.tasks.privateer import privateer_result_cache
+from ccpem_core.tasks.privateer import privateer_synthetic
+
+
+class Test(unittest.TestCase):
+    '''
+    Unit test for the Privateer result cache.
+    '''
+    def setUp(self):
+        self.test_output = tempfile.mkdtemp()
+        self.cache = privateer_result_cache.ResultCache(
+            os.path.join(self.test_output, 'cache'), max_bytes=1 << 30)
+
+    def tearDown(self):
+        if os.path.exists(path=self.test_output):
+            shutil.rmtree(self.test_output)
+
+    def store_job(self, number):
+        job_location = os.path.join(self.test_output,
+                                    'job_{0}'.format(number))
+        privateer_synthetic.write_synthetic_job(job_location, 10 + number)
+        key = '{0:040x}'.format(number)
+        self.assertTrue(self.cache.store(key, job_location))
+        return key
+
+    def test_materialise_copies(self):
+        key = self.store_job(1)
+        job_location = os.path.join(self.test_output, 'job')
+        os.mkdir(job_location)
+        names = self.cache.materialise(key, job_location)
+        self.assertIn('program.xml', names)
+        target = os.path.join(job_location, 'program.xml')
+        self.assertEqual(os.stat(target).st_nlink, 1)
+        with open(target, 'w') as f:
+            f.write('overwritten')
+        with open(os.path.join(self.cache.entry_location(key),
+                               'program.xml')) as f:
+            self.assertNotEqual(f.read(), 'overwritten')
+
+    def test_evict_least_recently_used(self):
+        keys = []
+        for number in range(3):
+            keys.append(self.store_job(number))
+            time.sleep(0.05)
+        job_location = os.path.join(self.test_output, 'job')
+        os.mkdir(job_location)
+        self.cache.materialise(keys[0], job_location)
+        size = sum(entry[1] for entry in self.cache.entries())
+        self.cache.max_bytes = size - 1
+        self.assertEqual(self.cache.evict(), [keys[1]])
+        self.assertTrue(self.cache.has(keys[0]))
+        self.assertFalse(self.cache.has(keys[1]))
+        self.cache.max_bytes = 0
+        self.assertEqual(self.cache.evict(keep=keys[0]), [keys[2]])
+        self.assertTrue(self.cache.has(keys[0]))
+
+    def test_model_only_supported(self):
+        command = privateer_fake.install(os.path.join(self.test_output, 'bin'))
+        self.assertTrue(self.cache.model_only_supported(command))
+        map_only = os.path.join(self.test_output, 'bin', 'privateer_old')
+        with open(map_only, 'w') as f:
+            f.write('#!/bin/sh\necho "No map given with -mapin"\nexit 1\n')
+        os.chmod(map_only, 0755)
+        self.assertFalse(self.cache.model_only_supported(map_only))
+        # The verdict is kept, so the executable is not run again
+        os.chmod(command, 0644)
+        cache = privateer_result_cache.ResultCache(self.cache.location)
+        self.assertTrue(cache.model_only_supported(command))
+
+if __name__ == '__main__':
+    unittest.main()
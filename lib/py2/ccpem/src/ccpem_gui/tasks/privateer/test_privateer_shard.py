@@ -0,0 +1,81 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+
+import unittest
+import os
+import shutil
+import tempfile
+from ccpem_core.tasks.privateer import privateer_shard
+
+
+def pdb_atom(serial, record, atom, code, chain, number, x, y, z):
+    return ('{0:<6}{1:>5} {2:<4} {3:>3} {4}{5:>4}    '
+            '{6:>8.3f}{7:>8.3f}{8:>8.3f}  1.00 20.00\n').format(
+                record, serial, atom, code, chain, number, x, y, z)
+
+
+class Test(unittest.TestCase):
+    '''
+    Unit test for the chain sharding plan of privateer_shard.
+    '''
+    def setUp(self):
+        self.test_output = tempfile.mkdtemp()
+        self.model_path = os.path.join(self.test_output, 'model.pdb')
+
+    def tearDown(self):
+        if os.path.exists(path=self.test_output):
+            shutil.rmtree(self.test_output)
+
+    def write_model(self, atoms):
+        '''
+        PDB file of (record, atom, code, chain, number, x) atoms on the
+        x axis.
+        '''
+        with open(self.model_path, 'w') as f:
+            for i, (record, atom, code, chain, number, x) in enumerate(atoms):
+                f.write(pdb_atom(i + 1, record, atom, code, chain, number,
+                                 x, 0.0, 0.0))
+            f.write('END\n')
+
+    def test_chain_clusters(self):
+        '''
+        A glycan modelled as its own chain goes with the protein chain it
+        is linked to, chains without sugars are left out.
+        '''
+        self.write_model([('ATOM', 'ND2', 'ASN', 'A', 1, 0.0),
+                          ('HETATM', 'C1', 'NAG', 'A', 101, 1.4),
+                          ('ATOM', 'ND2', 'ASN', 'B', 1, 50.0),
+                          ('HETATM', 'C1', 'NAG', 'C', 1, 51.4),
+                          ('HETATM', 'C1', 'NAG', 'C', 2, 55.0),
+                          ('ATOM', 'CA', 'GLY', 'D', 1, 100.0),
+                          ('HETATM', 'C1', 'MAN', 'E', 1, 200.0)])
+        self.assertEqual(privateer_shard.chain_clusters(self.model_path),
+                         [(1, ['A']), (2, ['B', 'C']), (1, ['E'])])
+
+    def test_plan_shards(self):
+        '''
+        Clusters are spread over the shards by sugar count, chains kept
+        in model order within each shard.
+        '''
+        atoms = []
+        for chain, sugars in zip('ABCD', (4, 1, 2, 1)):
+            atoms.append(('ATOM', 'CA', 'GLY', chain, 1, 0.0))
+            for number in range(sugars):
+                atoms.append(('HETATM', 'C1', 'NAG', chain, 101 + number,
+                              10.0 * number))
+        self.write_model(atoms)
+        self.assertEqual(privateer_shard.plan_shards(self.model_path, 2),
+                         [['A'], ['B', 'C', 'D']])
+        self.assertEqual(privateer_shard.plan_shards(self.model_path, 8),
+                         [['A'], ['C'], ['B'], ['D']])
+        self.assertEqual(privateer_shard.plan_shards(self.model_path, 1),
+                         [['A', 'B', 'C', 'D']])
+
+if __name__ == '__main__':
+    unittest.main()
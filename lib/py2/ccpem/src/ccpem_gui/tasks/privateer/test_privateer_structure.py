@@ -0,0 +1,87 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+
+import unittest
+import os
+import shutil
+import tempfile
+from ccpem_core.tasks.privateer import privateer_structure
+
+
+def pdb_atom(serial, record, atom, code, chain, number, x, y, z):
+    return ('{0:<6}{1:>5} {2:<4} {3:>3} {4}{5:>4}    '
+            '{6:>8.3f}{7:>8.3f}{8:>8.3f}  1.00 20.00\n').format(
+                record, serial, atom, code, chain, number, x, y, z)
+
+
+class Test(unittest.TestCase):
+    '''
+    Unit test for the sugar screen of privateer_structure.
+    '''
+    def setUp(self):
+        self.test_output = tempfile.mkdtemp()
+
+    def tearDown(self):
+        if os.path.exists(path=self.test_output):
+            shutil.rmtree(self.test_output)
+
+    def write_model(self, residues):
+        '''
+        PDB file of one atom per (record, code, chain, number) in residues.
+        '''
+        path = os.path.join(self.test_output, 'model.pdb')
+        with open(path, 'w') as f:
+            for i, (record, code, chain, number) in enumerate(residues):
+                f.write(pdb_atom(i + 1, record, 'C1', code, chain, number,
+                                 float(i), 0.0, 0.0))
+            f.write('END\n')
+        return path
+
+    def test_uncommon_sugar_code(self):
+        '''
+        A sugar whose code is not in sugar_codes is still screened in.
+        '''
+        self.assertNotIn('Z9D', privateer_structure.sugar_codes)
+        model = self.write_model([('ATOM', 'ASN', 'A', 1),
+                                  ('HETATM', 'Z9D', 'A', 2),
+                                  ('HETATM', 'HOH', 'A', 3)])
+        self.assertTrue(privateer_structure.has_sugars(model))
+        self.assertEqual(privateer_structure.count_sugar_residues(model), {})
+        job_location = os.path.join(self.test_output, 'job')
+        os.mkdir(job_location)
+        privateer_structure.main([model, job_location])
+        self.assertFalse(os.path.exists(
+            os.path.join(job_location, 'program.xml')))
+
+    def test_no_hetero_residues(self):
+        '''
+        Only a model with no hetero residue but water is screened out.
+        '''
+        model = self.write_model([('ATOM', 'ASN', 'A', 1),
+                                  ('HETATM', 'HOH', 'A', 2)])
+        self.assertFalse(privateer_structure.has_sugars(model))
+        job_location = os.path.join(self.test_output, 'job')
+        os.mkdir(job_location)
+        privateer_structure.main([model, job_location])
+        self.assertTrue(os.path.exists(
+            os.path.join(job_location, 'program.xml')))
+
+    def test_count_sugar_residues(self):
+        model = self.write_model([('HETATM', 'NAG', 'A', 1),
+                                  ('HETATM', 'NAG', 'A', 2),
+                                  ('HETATM', 'MAN', 'B', 1),
+                                  ('HETATM', 'Z9D', 'B', 2)])
+        self.assertEqual(privateer_structure.count_sugar_residues(model),
+                         {'NAG': 2, 'MAN': 1})
+        self.assertEqual(
+            privateer_structure.count_sugar_residues(model, ['z9d']),
+            {'NAG': 2, 'MAN': 1, 'Z9D': 1})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+
+import unittest
+import os
+import shutil
+import tempfile
+from lxml import etree
+from ccpem_core.tasks.privateer import privateer_svg
+from ccpem_core.tasks.privateer import privateer_synthetic
+
+
+class Test(unittest.TestCase):
+    '''
+    Unit test for the SVG asset cache of privateer_svg.
+    '''
+    def setUp(self):
+        self.test_output = tempfile.mkdtemp()
+
+    def tearDown(self):
+        if os.path.exists(path=self.test_output):
+            shutil.rmtree(self.test_output)
+
+    def write_glycan(self, chain, kinds):
+        '''
+        Diagram of a glycan on chain, with residue tooltips naming it.
+        '''
+        path = os.path.join(self.test_output, chain + '.svg')
+        residues = [('NAG-/{0}/{1}/'.format(chain, i + 1),
+                     privateer_synthetic.sugar_kinds[kind])
+                    for i, kind in enumerate(kinds)]
+        with open(path, 'wb') as f:
+            f.write(privateer_synthetic.glycan_svg(residues))
+        return path
+
+    def titles(self, element):
+        return [child.text for child in element.iter()
+                if privateer_svg.is_title(child)]
+
+    def test_same_topology_other_chain(self):
+        '''
+        Diagrams differing only in their tooltips share one symbol, and
+        each reference keeps its own tooltips.
+        '''
+        cache = privateer_svg.SVGAssetCache()
+        first = cache.get(self.write_glycan('A', [0, 4, 1]))
+        second = cache.get(self.write_glycan('B', [0, 4, 1]))
+        self.assertEqual(first.digest, second.digest)
+        self.assertIs(first.asset, second.asset)
+        self.assertEqual(self.titles(first.symbol()), [])
+        self.assertEqual(self.titles(first.reference()),
+                         ['NAG-/A/1/', 'NAG-/A/2/', 'NAG-/A/3/'])
+        self.assertEqual(self.titles(second.reference()),
+                         ['NAG-/B/1/', 'NAG-/B/2/', 'NAG-/B/3/'])
+
+    def test_other_topology(self):
+        cache = privateer_svg.SVGAssetCache()
+        first = cache.get(self.write_glycan('A', [0, 4, 1]))
+        second = cache.get(self.write_glycan('B', [0, 1, 4]))
+        self.assertNotEqual(first.digest, second.digest)
+        self.assertEqual(len(cache.assets), 2)
+
+    def test_digest_without_parsing(self):
+        '''
+        Hashing, as for the report's cache keys, parses nothing.
+        '''
+        cache = privateer_svg.SVGAssetCache()
+        path = self.write_glycan('A', [0, 4, 1])
+        digest = cache.digest(path)
+        self.assertEqual(cache.assets, {})
+        self.assertEqual(cache.get(path).digest, digest)
+        self.assertEqual(list(cache.assets), [digest])
+
+    def test_missing_file(self):
+        cache = privateer_svg.SVGAssetCache()
+        path = os.path.join(self.test_output, 'missing.svg')
+        self.assertIsNone(cache.digest(path))
+        self.assertIsNone(cache.get(path))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+#
+#     Copyright (C) 2017 CCP-EM
+#
+#     This code is distributed under the terms and conditions of the
+#     CCP-EM Program Suite Licence Agreement as a CCP-EM Application.
+#     A copy of the CCP-EM licence can be obtained by writing to the
+#     CCP-EM Secretary, RAL Laboratory, Harwell, OX11 0FA, UK.
+#
+
+import unittest
+import os
+import shutil
+import tempfile
+from ccpem_core.tasks.privateer import privateer_xml
+
+program_xml = '''<?xml version="1.0" encoding="UTF-8"?>
+<PrivateerResult>
+ <ValidationData>
+  <Pyranose>
+   <SugarChain>A</SugarChain>
+   <SugarName>NAG-/A/1/</SugarName>
+   <SugarQ>0.560</SugarQ>
+   <SugarPhi>10.50</SugarPhi>
+   <SugarTheta>4.20</SugarTheta>
+   <SugarAnomer>beta</SugarAnomer>
+   <SugarHand>D</SugarHand>
+   <SugarConformation>4c1</SugarConformation>
+   <SugarRSCC>0.80</SugarRSCC>
+   <SugarBFactor>30.00</SugarBFactor>
+   <SugarDiagnostic>yes</SugarDiagnostic>
+  </Pyranose>
+  <Furanose>
+   <SugarChain>B</SugarChain>
+   <SugarName>FUB-/B/2/</SugarName>
+   <SugarQ>0.450</SugarQ>
+   <SugarPhi>120.00</SugarPhi>
+   <SugarAnomer>alpha</SugarAnomer>
+   <SugarHand>D</SugarHand>
+   <SugarConformation>3t2</SugarConformation>
+   <SugarRSCC>0.70</SugarRSCC>
+   <SugarBFactor>45.00</SugarBFactor>
+   <SugarDiagnostic>Ring conformation is not the lowest energy one</SugarDiagnostic>
+  </Furanose>
+  <Glycan>
+   <GlycanChain>A</GlycanChain>
+   <GlycanWURCS>WURCS=2.0/1,1,0/[a2122h-1b_1-5]/1/</GlycanWURCS>
+   <GlycanGTCID>Unable to find GlyTouCan ID</GlycanGTCID>
+   <GlycanGlyConnectID>Unable to find GlyConnect ID</GlycanGlyConnectID>
+   <GlycanSVG>glycan-A-1.svg</GlycanSVG>
+   <GlycanPermutations>
+    <GlycanPermutation>
+     <PermutationWURCS>WURCS=2.0/1,1,0/[a2122h-1a_1-5]/1/</PermutationWURCS>
+     <PermutationScore>1.50</PermutationScore>
+     <anomerPermutations>1</anomerPermutations>
+     <residuePermutations>0</residuePermutations>
+     <residueDeletions>0</residueDeletions>
+     <PermutationGTCID>G00001CD</PermutationGTCID>
+     <PermutationGlyConnectID>1</PermutationGlyConnectID>
+     <PermutationSVG>glycan-A-1-permutation-0.svg</PermutationSVG>
+    </GlycanPermutation>
+   </GlycanPermutations>
+  </Glycan>
+ </ValidationData>
+</PrivateerResult>
+'''
+
+
+class Test(unittest.TestCase):
+    '''
+    Unit test for the program.xml reader of privateer_xml.
+    '''
+    def setUp(self):
+        self.test_output = tempfile.mkdtemp()
+        self.xmlfilename = os.path.join(self.test_output, 'program.xml')
+
+    def tearDown(self):
+        if os.path.exists(path=self.test_output):
+            shutil.rmtree(self.test_output)
+
+    def test_read_program_xml(self):
+        with open(self.xmlfilename, 'w') as f:
+            f.write(program_xml)
+        data = privateer_xml.read_program_xml(self.xmlfilename)
+        self.assertEqual(len(data.pyranoses), 1)
+        self.assertEqual(len(data.furanoses), 1)
+        self.assertEqual(len(data.glycans), 1)
+        pyranose = data.pyranoses[0]
+        self.assertEqual(pyranose.name, 'NAG-/A/1/')
+        self.assertAlmostEqual(pyranose.q, 0.56)
+        self.assertEqual(pyranose.text('q'), '0.560')
+        furanose = data.furanoses[0]
+        self.assertEqual(furanose.ring, 'furanose')
+        self.assertIsNone(furanose.theta)
+        glycan = data.glycans[0]
+        self.assertEqual(glycan.svg, 'glycan-A-1.svg')
+        self.assertEqual(len(glycan.permutations), 1)
+        self.assertEqual(glycan.permutations[0].score_text, '1.50')
+        self.assertEqual(glycan.permutations[0].gtc_id, 'G00001CD')
+        self.assertEqual(data.section_hashes, {})
+
+    def test_section_hashes(self):
+        with open(self.xmlfilename, 'w') as f:
+            f.write(program_xml)
+        hashes = privateer_xml.read_program_xml(
+            self.xmlfilename, section_hashes=True).section_hashes
+        self.assertEqual(sorted(hashes), ['Furanose', 'Glycan', 'Pyranose'])
+        with open(self.xmlfilename, 'w') as f:
+            f.write(program_xml.replace('0.560', '0.570'))
+        changed = privateer_xml.read_program_xml(
+            self.xmlfilename, section_hashes=True).section_hashes
+        self.assertNotEqual(changed['Pyranose'], hashes['Pyranose'])
+        self.assertEqual(changed['Glycan'], hashes['Glycan'])
+
+    def test_empty_program_xml(self):
+        privateer_xml.write_empty_program_xml(self.xmlfilename)
+        self.assertTrue(
+            privateer_xml.read_program_xml(self.xmlfilename).is_empty())
+
+if __name__ == '__main__':
+    unittest.main()